@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la composition DOCX (append_document)
+Compare l'épissage direct du body à docxcompose sur nos vrais templates → rapport JSON
+
+    python benchmark_compose.py                 # 10 passages par cas, rapport JSON
+    python benchmark_compose.py --repeat 30 -o compose.json
+
+Fonctionne hors ligne : aucun appel à l'API Claude, aucun rendu Jinja (seule la composition est mesurée).
+"""
+
+import io
+import os
+import json
+import math
+import time
+import random
+import argparse
+import platform
+
+REPORT_SCHEMA = 1
+ENGINES = {'splice': True, 'docxcompose': False}
+COVER, CONTENT = "TMC_NA_template_EN_Anonymise_CoverPage.docx", "TMC_NA_template_EN_Anonymise_Content.docx"
+# Cas mesurés : document maître + parties ajoutées (template ou skill matrix synthétique)
+CASES = {
+    'ms_cover_content': (COVER, [CONTENT]),
+    'ms_3parts': (COVER, ['matrix', CONTENT]),
+    'page2_matrix': ("Template_EN.docx", ['matrix']),
+    'page2_matrix_tmc_styles': ("Template_EN.docx", ['matrix_tmc']),
+}
+
+_SKILLS = ['Python', 'Java', 'SQL', 'Azure', 'AWS', 'Kubernetes', 'Docker', 'Terraform', 'Spark', 'Kafka',
+           'React', 'Angular', 'PostgreSQL', 'Oracle', 'Jenkins', 'GitLab CI', 'Power BI', 'Airflow']
+_LEVELS = ['Débutant', 'Intermédiaire', 'Avancé', 'Expert']
+
+
+# ==========================================
+# 🧩 SKILL MATRIX SYNTHÉTIQUE
+# ==========================================
+def build_matrix(base: bytes = None, rows: int = 40, seed: int = 42) -> bytes:
+    """Grille de compétences : document vierge (styles étrangers) ou bâtie sur un template TMC."""
+    from docx import Document
+    rng = random.Random(seed)
+    doc = Document(io.BytesIO(base)) if base else Document()
+    if base:
+        body = doc.element.body
+        for el in list(body):
+            if not el.tag.endswith('}sectPr'):
+                body.remove(el)
+    doc.add_paragraph("SKILLS MATRIX")
+    table = doc.add_table(rows=rows + 1, cols=3)
+    for cell, label in zip(table.rows[0].cells, ("Compétence", "Niveau", "Années")):
+        cell.text = label
+    for row in table.rows[1:]:
+        row.cells[0].text = rng.choice(_SKILLS)
+        row.cells[1].text = rng.choice(_LEVELS)
+        row.cells[2].text = str(rng.randint(1, 15))
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+# ==========================================
+# ⏱️ MESURES
+# ==========================================
+def _percentile(values: list, q: float) -> float:
+    """Percentile par rang le plus proche (suffisant pour comparer deux moteurs)."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _run_case(sources: dict, master: str, parts: list, fast: bool, repeat: int) -> dict:
+    from docx import Document
+    import cv_enricher
+
+    compose, save, engines, size = [], [], set(), 0
+    for i in range(repeat + 1):  # premier passage = chauffe, hors mesure
+        docs = [Document(io.BytesIO(sources[name])) for name in [master] + parts]
+        t0 = time.perf_counter()
+        for doc in docs[1:]:
+            docs[0].add_page_break()
+            engines.add(cv_enricher.append_document(docs[0], doc, fast=fast))
+        t1 = time.perf_counter()
+        out = io.BytesIO()
+        docs[0].save(out)
+        t2 = time.perf_counter()
+        if i:
+            compose.append(t1 - t0)
+            save.append(t2 - t1)
+            size = len(out.getvalue())
+    return {
+        'runs': repeat,
+        'engines': sorted(engines),
+        'compose_p50_ms': round(_percentile(compose, 50) * 1000, 2),
+        'compose_p95_ms': round(_percentile(compose, 95) * 1000, 2),
+        'save_p50_ms': round(_percentile(save, 50) * 1000, 2),
+        'output_bytes': size,
+    }
+
+
+def run_benchmark(sources: dict, repeat: int, cases: list = None) -> dict:
+    results = {}
+    for case in cases or CASES:
+        master, parts = CASES[case]
+        print(f"⏱️ {case}: {master} + {', '.join(parts)} × {repeat}...", flush=True)
+        results[case] = {engine: _run_case(sources, master, parts, fast, repeat) for engine, fast in ENGINES.items()}
+        fast, slow = results[case]['splice'], results[case]['docxcompose']
+        speedup = slow['compose_p50_ms'] / fast['compose_p50_ms'] if fast['compose_p50_ms'] else 0.0
+        results[case]['speedup'] = round(speedup, 2)
+        print(f"   ✅ splice ({'+'.join(fast['engines'])}) p50 {fast['compose_p50_ms']} ms · "
+              f"docxcompose p50 {slow['compose_p50_ms']} ms · ×{speedup:.2f}", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la composition DOCX (hors ligne)")
+    parser.add_argument('--output', '-o', default='benchmark_compose.json', help='Rapport JSON')
+    parser.add_argument('--repeat', type=int, default=10, help='Passages mesurés par cas et par moteur')
+    parser.add_argument('--rows', type=int, default=40, help='Lignes de la skill matrix synthétique')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', choices=list(CASES), help='Cas à mesurer')
+    args = parser.parse_args()
+
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark-offline')
+    import cv_enricher
+
+    sources = {}
+    for master, parts in CASES.values():
+        for name in [master] + parts:
+            if name.endswith('.docx') and name not in sources:
+                sources[name] = cv_enricher._TEMPLATES.data(name)
+    sources['matrix'] = build_matrix(rows=args.rows, seed=args.seed)
+    sources['matrix_tmc'] = build_matrix(sources["Template_EN.docx"], rows=args.rows, seed=args.seed)
+
+    results = run_benchmark(sources, args.repeat, args.only)
+    report = {
+        'schema': REPORT_SCHEMA,
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'repeat': args.repeat, 'rows': args.rows, 'seed': args.seed},
+        'cases': {case: {'master': CASES[case][0], 'parts': CASES[case][1]} for case in results},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+    print(f"💾 Rapport: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Benchmark de l'extraction (extract_cv_text)
+Génère un corpus synthétique reproductible → mesure chaque extracteur → rapport JSON
+
+    python benchmark_extraction.py                       # corpus temporaire, rapport JSON
+    python benchmark_extraction.py --baseline old.json   # compare à une version précédente
+
+Fonctionne hors ligne : aucun appel à l'API Claude, cache d'extraction désactivé.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+REPORT_SCHEMA = 1
+CATEGORIES = ['pdf_text', 'pdf_scan', 'docx', 'txt']
+TXT_ENCODINGS = ['utf-8', 'latin-1', 'cp1252']
+
+# ==========================================
+# 📄 CORPUS SYNTHÉTIQUE
+# ==========================================
+_FIRST = ['Jean', 'Marie', 'Olivier', 'Sophie', 'Karim', 'Amélie', 'David', 'Chloé', 'Lucas', 'Inès']
+_LAST = ['Dupont', 'Tremblay', 'Gagnon', 'Lefèvre', 'Roy', 'Côté', 'Martin', 'Bouchard', 'Nguyen', 'Bélanger']
+_ROLES = ['Développeur Python senior', 'Data Engineer', 'Architecte cloud', 'Chef de projet IT',
+          'Business Analyst', 'Ingénieur DevOps', 'Software Engineer', 'QA Lead']
+_COMPANIES = ['Desjardins', 'Banque Nationale', 'CGI', 'Morgan Stanley', 'Hydro-Québec', 'Ubisoft', 'CAE', 'Bell']
+_SKILLS = ['Python', 'Java', 'SQL', 'Azure', 'AWS', 'Kubernetes', 'Docker', 'Terraform', 'Spark', 'Kafka',
+           'React', 'Angular', 'PostgreSQL', 'Oracle', 'Jenkins', 'GitLab CI', 'Power BI', 'Airflow']
+_BULLETS = [
+    "Conception et développement d'une plateforme de traitement des données de marché",
+    "Migration de l'infrastructure on-premise vers le cloud (gain de 30 % sur les coûts)",
+    "Mise en place d'une chaîne CI/CD et des tests automatisés pour 12 microservices",
+    "Encadrement d'une équipe de 5 développeurs et revue de code quotidienne",
+    "Designed and delivered REST APIs consumed by over 40 internal applications",
+    "Reduced batch processing time from 6 hours to 45 minutes through query optimisation",
+    "Rédaction des spécifications fonctionnelles avec les équipes métier (« risque & conformité »)",
+    "Led the rollout of observability dashboards and on-call runbooks across teams",
+]
+
+
+def _cv_pages(rng: random.Random, n_pages: int) -> list:
+    """Un CV synthétique : liste de pages, chaque page = liste de lignes."""
+    name = f"{rng.choice(_FIRST)} {rng.choice(_LAST)}"
+    pages = []
+    for p in range(n_pages):
+        lines = []
+        if p == 0:
+            lines += [name, rng.choice(_ROLES), f"{name.split()[0].lower()}@example.com - Montréal, QC", "",
+                      "COMPÉTENCES", ", ".join(rng.sample(_SKILLS, 8)), ""]
+        lines.append("EXPÉRIENCES PROFESSIONNELLES" if p == 0 else "EXPÉRIENCES (suite)")
+        for _ in range(3):
+            start = rng.randint(2008, 2021)
+            lines += ["", f"{rng.choice(_ROLES)} - {rng.choice(_COMPANIES)} ({start} - {start + rng.randint(1, 4)})"]
+            lines += [f"- {b}" for b in rng.sample(_BULLETS, 4)]
+            lines.append("Environnement : " + ", ".join(rng.sample(_SKILLS, 5)))
+        pages.append(lines)
+    return pages
+
+
+def _pdf_escape(line: str) -> bytes:
+    raw = line.encode('cp1252', errors='replace')
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def write_text_pdf(path: str, pages: list):
+    """PDF texte minimal (Helvetica, WinAnsi) écrit à la main : pas de dépendance externe."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for lines in pages:
+        stream = b"BT /F1 10 Tf 14 TL 50 800 Td\n" + b"".join(b"(" + _pdf_escape(l) + b") '\n" for l in lines) + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def _scan_font(size: int):
+    from PIL import ImageFont
+    for name in ('DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 'Arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)  # Pillow >= 10.1 avec FreeType
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def write_scanned_pdf(path: str, pages: list, rng: random.Random, dpi: int = 150):
+    """PDF « scanné » : chaque page est une image (texte rastérisé, légère inclinaison)."""
+    from PIL import Image, ImageDraw
+    font = _scan_font(dpi // 6)
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    images = []
+    for lines in pages:
+        img = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(img)
+        y = dpi // 2
+        for line in lines:
+            draw.text((dpi // 2, y), line, fill=0, font=font)
+            y += int(dpi / 6 * 1.5)
+        images.append(img.rotate(rng.uniform(-1.0, 1.0), fillcolor=255).convert('RGB'))
+    images[0].save(path, 'PDF', resolution=dpi, save_all=True, append_images=images[1:])
+
+
+_VML_TEXTBOX = (
+    '<w:p xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:v="urn:schemas-microsoft-com:vml"><w:r><w:pict>'
+    '<v:shape style="width:200pt;height:60pt"><v:textbox><w:txbxContent>'
+    '<w:p><w:r><w:t>{text}</w:t></w:r></w:p>'
+    '</w:txbxContent></v:textbox></v:shape></w:pict></w:r></w:p>'
+)
+
+
+def write_docx(path: str, pages: list, rng: random.Random):
+    """Word avec zone texte (coordonnées), tableau de compétences à cellules fusionnées et sauts de page."""
+    from docx import Document
+    from docx.oxml import parse_xml
+    from xml.sax.saxutils import escape
+
+    doc = Document()
+    for p, lines in enumerate(pages):
+        if p == 0:
+            doc.add_heading(lines[0], level=1)
+            doc.element.body.sectPr.addprevious(parse_xml(_VML_TEXTBOX.format(text=escape(lines[2]))))
+            table = doc.add_table(rows=4, cols=3)
+            header = table.cell(0, 0).merge(table.cell(0, 2))
+            header.text = lines[4]
+            for r in range(1, 4):
+                for c in range(3):
+                    table.cell(r, c).text = rng.choice(_SKILLS)
+            lines = lines[6:]
+        else:
+            doc.add_page_break()
+        for line in lines:
+            doc.add_paragraph(line)
+    doc.save(path)
+
+
+def write_txt(path: str, pages: list, encoding: str):
+    text = "\n\n".join("\n".join(lines) for lines in pages)
+    if encoding == 'cp1252':
+        text += "\nPrétentions : 95 000 € – disponible « immédiatement »"
+    with open(path, 'w', encoding=encoding, errors='replace') as f:
+        f.write(text)
+
+
+def build_corpus(directory: str, seed: int = 42, docs_per_category: int = 3, max_pages: int = 3) -> list:
+    """Crée le corpus (déterministe pour une graine donnée) et retourne son manifeste."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    manifest = []
+    for category in CATEGORIES:
+        for i in range(docs_per_category):
+            n_pages = 1 + i % max_pages
+            pages = _cv_pages(rng, n_pages)
+            if category == 'pdf_text':
+                path = os.path.join(directory, f"cv_text_{i}.pdf")
+                write_text_pdf(path, pages)
+            elif category == 'pdf_scan':
+                path = os.path.join(directory, f"cv_scan_{i}.pdf")
+                write_scanned_pdf(path, pages, rng)
+            elif category == 'docx':
+                path = os.path.join(directory, f"cv_word_{i}.docx")
+                write_docx(path, pages, rng)
+            else:
+                encoding = TXT_ENCODINGS[i % len(TXT_ENCODINGS)]
+                path = os.path.join(directory, f"cv_{encoding.replace('-', '')}_{i}.txt")
+                write_txt(path, pages, encoding)
+            with open(path, 'rb') as f:
+                data = f.read()
+            manifest.append({'category': category, 'name': os.path.basename(path), 'path': path,
+                             'pages': n_pages, 'bytes': len(data),
+                             'sha256': hashlib.sha256(data).hexdigest()[:16]})
+    return manifest
+
+
+# ==========================================
+# ⏱️ MESURES
+# ==========================================
+def _percentile(values: list, q: float) -> float:
+    """Percentile par rang le plus proche (suffisant pour comparer deux versions)."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _maxrss_mb(who) -> float:
+    import resource
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux : kilo-octets ; macOS : octets
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _run_category(documents: list, repeat: int) -> dict:
+    """Exécuté dans un processus neuf (spawn) : le pic RSS mesuré est celui de cet extracteur seul."""
+    import resource
+    os.environ['CV_EXTRACT_CACHE'] = '0'
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark-offline')
+    import cv_enricher
+
+    enricher = cv_enricher.CVEnricher()
+    latencies, chars, pages, empty = [], 0, 0, 0
+
+    # Passage de chauffe (imports paresseux, pool OCR, tessdata) hors mesure
+    for doc in documents:
+        enricher.extract_cv_text(doc['path'])
+
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        for doc in documents:
+            t0 = time.perf_counter()
+            text = enricher.extract_cv_text(doc['path'])
+            latencies.append(time.perf_counter() - t0)
+            chars += len(text)
+            pages += doc['pages']
+            empty += 0 if text.strip() else 1
+    wall = time.perf_counter() - wall_start
+
+    # Les workers OCR comptent dans RUSAGE_CHILDREN une fois terminés
+    if cv_enricher._OCR_POOL is not None:
+        cv_enricher._OCR_POOL.shutdown(wait=True)
+
+    return {
+        'documents': len(documents),
+        'runs': len(latencies),
+        'pages_per_sec': round(pages / wall, 3),
+        'chars_per_sec': round(chars / wall, 1),
+        'chars_per_doc': round(chars / len(latencies)),
+        'empty_results': empty,
+        'latency_p50_ms': round(_percentile(latencies, 50) * 1000, 2),
+        'latency_p95_ms': round(_percentile(latencies, 95) * 1000, 2),
+        'peak_rss_mb': _maxrss_mb(resource.RUSAGE_SELF),
+        'peak_rss_children_mb': _maxrss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def run_benchmark(manifest: list, repeat: int = 3, categories: list = None) -> dict:
+    results = {}
+    ctx = multiprocessing.get_context('spawn')
+    for category in categories or CATEGORIES:
+        documents = [d for d in manifest if d['category'] == category]
+        if not documents:
+            continue
+        print(f"⏱️ {category}: {len(documents)} documents × {repeat}...", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results[category] = pool.submit(_run_category, documents, repeat).result()
+        r = results[category]
+        print(f"   ✅ {r['pages_per_sec']} pages/s, p50 {r['latency_p50_ms']} ms, "
+              f"p95 {r['latency_p95_ms']} ms, RSS {r['peak_rss_mb']} Mo", flush=True)
+    return results
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float) -> list:
+    """Régressions au-delà de la tolérance (débit en baisse ou p95 en hausse)."""
+    regressions = []
+    for category, cur in current['results'].items():
+        old = baseline.get('results', {}).get(category)
+        if not old:
+            continue
+        for metric, higher_is_better in (('pages_per_sec', True), ('chars_per_sec', True),
+                                         ('latency_p95_ms', False), ('peak_rss_mb', False)):
+            if not old.get(metric):
+                continue
+            change = (cur[metric] - old[metric]) / old[metric]
+            worse = -change if higher_is_better else change
+            flag = '⚠️' if worse > tolerance else '  '
+            print(f"   {flag} {category:9} {metric:16} {old[metric]:>10} → {cur[metric]:>10} ({change:+.1%})")
+            if worse > tolerance:
+                regressions.append(f"{category}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'extraction de CV (hors ligne)")
+    parser.add_argument('--output', '-o', default='benchmark_extraction.json', help='Rapport JSON')
+    parser.add_argument('--corpus-dir', help='Dossier du corpus (conservé) ; temporaire sinon')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--docs', type=int, default=3, help='Documents par catégorie')
+    parser.add_argument('--max-pages', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3, help='Passages mesurés par document')
+    parser.add_argument('--only', nargs='+', choices=CATEGORIES, help='Catégories à mesurer')
+    parser.add_argument('--baseline', help='Rapport précédent à comparer')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Régression tolérée (0.15 = 15 %%)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cv_bench_') as tmp:
+        corpus_dir = args.corpus_dir or tmp
+        print(f"📄 Génération du corpus (graine {args.seed}) dans {corpus_dir}", flush=True)
+        manifest = build_corpus(corpus_dir, args.seed, args.docs, args.max_pages)
+        results = run_benchmark(manifest, args.repeat, args.only)
+
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark-offline')
+    import cv_enricher
+    report = {
+        'schema': REPORT_SCHEMA,
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'extractor_version': cv_enricher._EXTRACTOR_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {'seed': args.seed, 'docs': args.docs, 'max_pages': args.max_pages, 'repeat': args.repeat,
+                     'ocr_mode': cv_enricher._OCR_MODE, 'ocr_workers': cv_enricher._ocr_max_workers()},
+        'corpus': [{k: d[k] for k in ('category', 'name', 'pages', 'bytes', 'sha256')} for d in manifest],
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+    print(f"💾 Rapport: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n📊 Comparaison avec {args.baseline} (extracteur v{baseline.get('extractor_version')}):")
+        regressions = compare_reports(baseline, report, args.tolerance)
+        if regressions:
+            print(f"❌ Régressions: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ Aucune régression")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,46 +5,84 @@ Reads any CV → Enriches with AI → Generates professional CV
 """
 
 import os
+import io
 import sys
 import json
 from docxtpl import DocxTemplate, RichText
 from docx import Document
 import jinja2
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator
 import PyPDF2
 import re
 from zipfile import ZipFile
 from xml.etree import ElementTree as ET
+from lxml import etree
 
 # === OCR IMPORTS ===
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
 from PIL import Image
 import tempfile
+import hashlib
+import random
+import copy
+import time
+import threading
+import asyncio
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import subprocess
+import shutil
+import shlex
+import signal
+import queue
+import atexit
+import http.client
+import xmlrpc.client
 
 print(">>> cv_enricher module loading", flush=True)
 
 
-import tempfile
-
 # ==========================================
 # 📊 COMPTEUR D'USAGE (fichier - reset au redeploiement)
 # ==========================================
 _STATS_FILE = os.path.join(tempfile.gettempdir(), "cv_optimizer_usage.json")
+_STATS_LOCK = threading.Lock()  # appels Claude concurrents : lecture-modification-écriture atomique
 _PRICE_IN = 3.0 / 1_000_000    # Claude Sonnet 4.5 : $3 / MTok input
 _PRICE_OUT = 15.0 / 1_000_000  # $15 / MTok output
+_CACHE_WRITE_MULT = 1.25   # écriture cache de prompt : +25 % du prix input du modèle
+_CACHE_READ_MULT = 0.10    # lecture cache de prompt : -90 %
+_PRICE_CACHE_WRITE = _PRICE_IN * _CACHE_WRITE_MULT
+_PRICE_CACHE_READ = _PRICE_IN * _CACHE_READ_MULT
+# $ / MTok (input, output) par famille de modèle — préfixe de l'identifiant ; inconnu → tarif Sonnet
+_MODEL_PRICES = {
+    "claude-sonnet-4-5": (3.0, 15.0),
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-opus-4-5": (5.0, 25.0),
+}
 _STATS_DEFAULT = {"cv_count": 0, "matching_count": 0, "api_calls": 0,
-                  "input_tokens": 0, "output_tokens": 0}
+                  "input_tokens": 0, "output_tokens": 0,
+                  "cache_write_tokens": 0, "cache_read_tokens": 0,
+                  "llm_cache_hits": 0, "llm_cache_misses": 0,
+                  "json_local_repairs": 0, "json_llm_fixes": 0,
+                  "cost_usd": 0.0, "by_stage": {},
+                  "api_retries": 0, "circuit_open_rejections": 0,
+                  "normalized_docs": 0, "norm_tokens_before": 0, "norm_tokens_saved": 0}
 
 def _load_stats():
     try:
         with open(_STATS_FILE) as f:
             d = json.load(f)
+        if "cost_usd" not in d:  # compteur antérieur au suivi par modèle : tout au tarif Sonnet
+            d["cost_usd"] = usage_cost(d.get("input_tokens"), d.get("output_tokens"),
+                                       d.get("cache_write_tokens"), d.get("cache_read_tokens"))
         for k, v in _STATS_DEFAULT.items():
-            d.setdefault(k, v)
+            d.setdefault(k, copy.deepcopy(v))
         return d
     except Exception:
-        return dict(_STATS_DEFAULT)
+        return copy.deepcopy(_STATS_DEFAULT)
 
 def _save_stats(d):
     try:
@@ -53,27 +91,2063 @@ def _save_stats(d):
     except Exception:
         pass
 
-def record_api_usage(input_tokens, output_tokens):
-    d = _load_stats()
-    d["api_calls"] += 1
-    d["input_tokens"] += int(input_tokens or 0)
-    d["output_tokens"] += int(output_tokens or 0)
-    _save_stats(d)
+def model_prices(model=None):
+    """(prix input, prix output) en $ par token pour `model` (tarif Sonnet si inconnu)."""
+    for prefix, (price_in, price_out) in _MODEL_PRICES.items():
+        if model and model.startswith(prefix):
+            return price_in / 1_000_000, price_out / 1_000_000
+    return _PRICE_IN, _PRICE_OUT
+
+def usage_cost(input_tokens, output_tokens, cache_write_tokens=0, cache_read_tokens=0, model=None):
+    """Coût en $ ; input_tokens = tokens hors cache (l'API compte le cache à part)."""
+    price_in, price_out = model_prices(model)
+    return ((input_tokens or 0) * price_in + (output_tokens or 0) * price_out
+            + (cache_write_tokens or 0) * price_in * _CACHE_WRITE_MULT
+            + (cache_read_tokens or 0) * price_in * _CACHE_READ_MULT)
+
+def _stage_row(d, stage, model):
+    row = d["by_stage"].setdefault(f"{stage or '-'}|{model or '-'}", {
+        "calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0,
+        "cache_write_tokens": 0, "cache_read_tokens": 0, "cost": 0.0})
+    row.setdefault("retries", 0)
+    return row
+
+def record_api_usage(input_tokens, output_tokens, cache_write_tokens=0, cache_read_tokens=0,
+                     stage=None, model=None, seconds=0.0):
+    tokens = (int(input_tokens or 0), int(output_tokens or 0), int(cache_write_tokens or 0), int(cache_read_tokens or 0))
+    cost = usage_cost(*tokens, model=model)
+    with _STATS_LOCK:
+        d = _load_stats()
+        d["api_calls"] += 1
+        d["input_tokens"] += tokens[0]
+        d["output_tokens"] += tokens[1]
+        d["cache_write_tokens"] += tokens[2]
+        d["cache_read_tokens"] += tokens[3]
+        d["cost_usd"] += cost
+        # Détail par étape et modèle : latence et coût comparables d'une route à l'autre
+        row = _stage_row(d, stage, model)
+        row["calls"] += 1
+        row["seconds"] += float(seconds or 0.0)
+        row["input_tokens"] += tokens[0]
+        row["output_tokens"] += tokens[1]
+        row["cache_write_tokens"] += tokens[2]
+        row["cache_read_tokens"] += tokens[3]
+        row["cost"] += cost
+        _save_stats(d)
+
+def record_retry(stage, model):
+    with _STATS_LOCK:
+        d = _load_stats()
+        d["api_retries"] += 1
+        _stage_row(d, stage, model)["retries"] += 1
+        _save_stats(d)
+
+def record_circuit_open():
+    with _STATS_LOCK:
+        d = _load_stats(); d["circuit_open_rejections"] += 1; _save_stats(d)
 
 def record_cv():
-    d = _load_stats(); d["cv_count"] += 1; _save_stats(d)
+    with _STATS_LOCK:
+        d = _load_stats(); d["cv_count"] += 1; _save_stats(d)
 
 def record_matching():
-    d = _load_stats(); d["matching_count"] += 1; _save_stats(d)
+    with _STATS_LOCK:
+        d = _load_stats(); d["matching_count"] += 1; _save_stats(d)
+
+def record_normalization(tokens_before, tokens_saved):
+    with _STATS_LOCK:
+        d = _load_stats()
+        d["normalized_docs"] += 1
+        d["norm_tokens_before"] += int(tokens_before or 0)
+        d["norm_tokens_saved"] += int(tokens_saved or 0)
+        _save_stats(d)
+
+def record_llm_cache(hit):
+    with _STATS_LOCK:
+        d = _load_stats()
+        d["llm_cache_hits" if hit else "llm_cache_misses"] += 1
+        _save_stats(d)
+
+def record_json_repair(kind):
+    """kind : 'local' (repair_json) ou 'llm' (aller-retour « corrige ce JSON »)"""
+    with _STATS_LOCK:
+        d = _load_stats()
+        d["json_local_repairs" if kind == 'local' else "json_llm_fixes"] += 1
+        _save_stats(d)
+
+def _off_loop(func, *args):
+    """Écriture disque (stats, cache) appelée depuis du code synchrone exécuté sur la boucle
+    asyncio : elle part dans un thread au lieu de bloquer la boucle."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return func(*args)
+    loop.run_in_executor(None, func, *args)
 
 def get_stats():
     d = _load_stats()
-    d["cost"] = d["input_tokens"] * _PRICE_IN + d["output_tokens"] * _PRICE_OUT
+    d["cost"] = d["cost_usd"]
+    # Économie du cache de prompt : les tokens lus auraient sinon été facturés plein tarif,
+    # au prix input du modèle qui les a servis (tokens par modèle dans by_stage)
+    def savings(read_tokens, write_tokens, model=None):
+        price_in = model_prices(model)[0]
+        return read_tokens * price_in * (1 - _CACHE_READ_MULT) - write_tokens * price_in * (_CACHE_WRITE_MULT - 1)
+
+    rows = [(key.split("|", 1)[1], row) for key, row in d["by_stage"].items()]
+    d["cache_savings"] = sum(savings(row["cache_read_tokens"], row["cache_write_tokens"], model) for model, row in rows)
+    # Compteur antérieur au suivi par modèle : le reste est valorisé au tarif Sonnet
+    d["cache_savings"] += savings(max(0, d["cache_read_tokens"] - sum(row["cache_read_tokens"] for _, row in rows)),
+                                  max(0, d["cache_write_tokens"] - sum(row["cache_write_tokens"] for _, row in rows)))
+    prompt_tokens = d["input_tokens"] + d["cache_write_tokens"] + d["cache_read_tokens"]
+    d["cache_hit_pct"] = (100.0 * d["cache_read_tokens"] / prompt_tokens) if prompt_tokens else 0.0
     d["cost_per_cv"] = (d["cost"] / d["cv_count"]) if d["cv_count"] else 0.0
+    d["norm_saved_per_doc"] = (d["norm_tokens_saved"] / d["normalized_docs"]) if d["normalized_docs"] else 0.0
+    d["norm_saved_pct"] = (100.0 * d["norm_tokens_saved"] / d["norm_tokens_before"]) if d["norm_tokens_before"] else 0.0
+    d["norm_cost_saved"] = d["norm_tokens_saved"] * model_prices(resolve_routes()['parse']['model'])[0]
+    lookups = d["llm_cache_hits"] + d["llm_cache_misses"]
+    d["llm_cache_hit_pct"] = (100.0 * d["llm_cache_hits"] / lookups) if lookups else 0.0
+    d["stage_rows"] = []
+    for key, row in sorted(d["by_stage"].items()):
+        stage, model = key.split("|", 1)
+        d["stage_rows"].append({
+            "stage": stage, "model": model, "calls": row["calls"],
+            "avg_seconds": round(row["seconds"] / row["calls"], 1) if row["calls"] else 0.0,
+            "input_tokens": row["input_tokens"] + row["cache_write_tokens"] + row["cache_read_tokens"],
+            "output_tokens": row["output_tokens"],
+            "cost": round(row["cost"], 4),
+            "cost_per_call": round(row["cost"] / row["calls"], 4) if row["calls"] else 0.0,
+            "retries": row.get("retries", 0),
+        })
     return d
 
 def reset_stats():
-    _save_stats(dict(_STATS_DEFAULT))
+    with _STATS_LOCK:
+        _save_stats(copy.deepcopy(_STATS_DEFAULT))
+
+
+# ==========================================
+# 🧭 ROUTAGE PAR ÉTAPE (modèle, max_tokens, timeout, température)
+# ==========================================
+_SONNET = "claude-sonnet-4-5-20250929"
+_HAIKU = "claude-haiku-4-5-20251001"
+
+# timeout None = défaut du SDK ; temperature None = défaut de l'API ;
+# retries = budget de nouvelles tentatives de l'étape sur erreur transitoire (cf. _atrack_create)
+_STAGE_ROUTES = {
+    'parse':      {"model": _HAIKU,  "max_tokens": 8000, "timeout": 300.0, "temperature": 0.0,  "retries": 3},
+    'matching':   {"model": _SONNET, "max_tokens": 4000, "timeout": None,  "temperature": None, "retries": 2},
+    'enrichment': {"model": _SONNET, "max_tokens": 8000, "timeout": 300.0, "temperature": None, "retries": 2},
+    'translate':  {"model": _HAIKU,  "max_tokens": 4000, "timeout": None,  "temperature": 0.0,  "retries": 1},
+    'json_fix':   {"model": _HAIKU,  "max_tokens": 8000, "timeout": 300.0, "temperature": 0.0,  "retries": 1},
+}
+_ROUTE_POLICY_KEYS = frozenset({"retries"})  # clés de route qui ne sont pas des paramètres d'API
+
+# Profils (CV_ROUTE_PROFILE ou CVEnricher(route_profile=...)) : surcharges partielles de la table
+_ROUTE_PROFILES = {
+    'balanced': {},
+    'quality': {stage: {"model": _SONNET} for stage in ('parse', 'translate', 'json_fix')},
+    'fast': {stage: {"model": _HAIKU} for stage in _STAGE_ROUTES},
+}
+
+
+def resolve_routes(profile: str = None) -> Dict[str, Dict[str, Any]]:
+    """Table de routage effective : défauts, puis profil (argument, sinon CV_ROUTE_PROFILE),
+    puis surcharges JSON par étape de CV_STAGE_ROUTES (ex. {"parse": {"model": "..."}})."""
+    routes = copy.deepcopy(_STAGE_ROUTES)
+    profile = profile or os.getenv('CV_ROUTE_PROFILE') or 'balanced'
+    if profile not in _ROUTE_PROFILES:
+        print(f"⚠️ Profil de routage inconnu '{profile}' → balanced", flush=True)
+        profile = 'balanced'
+    overrides = [_ROUTE_PROFILES[profile]]
+    raw = os.getenv('CV_STAGE_ROUTES')
+    if raw:
+        try:
+            overrides.append(json.loads(raw))
+        except ValueError as e:
+            print(f"⚠️ CV_STAGE_ROUTES ignoré (JSON invalide): {e}", flush=True)
+    for override in overrides:
+        for stage, values in override.items():
+            if stage in routes and isinstance(values, dict):
+                routes[stage].update(values)
+    return routes
+
+
+# ==========================================
+# 💾 CACHE DISQUE (clé → contenu, TTL + taille max + éviction LRU)
+# ==========================================
+_CACHE_ROOT = os.getenv('CV_CACHE_DIR') or os.path.join(tempfile.gettempdir(), "cv_optimizer_cache")
+
+
+def _env_number(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+class _DiskCache:
+    """Petit cache clé/valeur sur disque, un fichier par entrée.
+
+    - TTL : une entrée plus vieille que `ttl_seconds` est considérée absente (et supprimée)
+    - LRU : la date de modification sert de « dernier accès » (rafraîchie à chaque lecture) ;
+      au-delà de `max_bytes`, les entrées les moins récemment utilisées sont évincées
+    - Écriture atomique (fichier temporaire + os.replace) : sûr entre sessions/processus
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: float):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".entry")
+
+    def get(self, key: str):
+        """Retourne le contenu (bytes) ou None si absent/expiré."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header, _, payload = f.read().partition(b"\n")
+            created = json.loads(header)["created"]
+        except (OSError, ValueError, KeyError):
+            return None
+        if self.ttl_seconds and time.time() - created > self.ttl_seconds:
+            self.invalidate(key)
+            return None
+        try:
+            os.utime(path)  # LRU : marquer comme récemment utilisée
+        except OSError:
+            pass
+        return payload
+
+    def set(self, key: str, payload: bytes):
+        header = json.dumps({"created": time.time()}).encode()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header + b"\n" + payload)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def get_json(self, key: str):
+        payload = self.get(key)
+        if payload is None:
+            return None
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def set_json(self, key: str, value):
+        self.set(key, json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+    def invalidate(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".entry"):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".entry"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+# Version de l'extraction : à incrémenter dès que le texte produit change
+# (OCR, règles de classification des pages, extraction Word...) pour invalider le cache.
+_EXTRACTOR_VERSION = "4"
+_EXTRACTION_CACHE = None
+
+
+def _get_extraction_cache():
+    """Cache des textes extraits (CV_EXTRACT_CACHE=0 pour le désactiver)."""
+    global _EXTRACTION_CACHE
+    if os.getenv('CV_EXTRACT_CACHE', '1') == '0':
+        return None
+    if _EXTRACTION_CACHE is None:
+        _EXTRACTION_CACHE = _DiskCache(
+            os.path.join(_CACHE_ROOT, "extraction"),
+            max_bytes=_env_number('CV_EXTRACT_CACHE_MAX_MB', 200) * 1024 * 1024,
+            ttl_seconds=_env_number('CV_EXTRACT_CACHE_TTL_HOURS', 24) * 3600,
+        )
+    return _EXTRACTION_CACHE
+
+
+# Version de la préparation des skill matrices : à incrémenter dès que la normalisation
+# (largeurs, marges, paragraphes vides, prompt de traduction...) change.
+_MATRIX_VERSION = "1"
+_MATRIX_CACHE = None
+
+
+def _get_matrix_cache():
+    """Cache des skill matrices préparées (CV_MATRIX_CACHE=0 pour le désactiver)."""
+    global _MATRIX_CACHE
+    if os.getenv('CV_MATRIX_CACHE', '1') == '0':
+        return None
+    if _MATRIX_CACHE is None:
+        _MATRIX_CACHE = _DiskCache(
+            os.path.join(_CACHE_ROOT, "matrix"),
+            max_bytes=_env_number('CV_MATRIX_CACHE_MAX_MB', 100) * 1024 * 1024,
+            ttl_seconds=_env_number('CV_MATRIX_CACHE_TTL_HOURS', 168) * 3600,
+        )
+    return _MATRIX_CACHE
+
+
+# Version des prompts : à incrémenter dès qu'un prompt (parsing, matching, enrichissement...)
+# change, pour que les réponses déjà en cache ne soient plus servies.
+_PROMPT_VERSION = "1"
+_LLM_CACHE = None
+# id de réponse → clé de cache, pour retirer une réponse servie ou écrite qui s'avère inexploitable
+_LLM_CACHE_KEYS: Dict[str, str] = {}
+_LLM_CACHE_KEYS_MAX = 256
+
+
+def _get_llm_cache():
+    """Cache des réponses Claude (CV_LLM_CACHE=0 pour le désactiver)."""
+    global _LLM_CACHE
+    if os.getenv('CV_LLM_CACHE', '1') == '0':
+        return None
+    if _LLM_CACHE is None:
+        _LLM_CACHE = _DiskCache(
+            os.path.join(_CACHE_ROOT, "llm"),
+            max_bytes=_env_number('CV_LLM_CACHE_MAX_MB', 100) * 1024 * 1024,
+            ttl_seconds=_env_number('CV_LLM_CACHE_TTL_HOURS', 72) * 3600,
+        )
+    return _LLM_CACHE
+
+
+def clear_llm_cache():
+    """Invalide toutes les réponses Claude en cache (bouton admin)."""
+    cache = _get_llm_cache()
+    if cache is not None:
+        cache.clear()
+
+
+def _remember_llm_cache_key(resp, key: str):
+    resp_id = getattr(resp, 'id', None)
+    if resp_id is None:
+        return
+    _LLM_CACHE_KEYS[resp_id] = key
+    if len(_LLM_CACHE_KEYS) > _LLM_CACHE_KEYS_MAX:
+        _LLM_CACHE_KEYS.pop(next(iter(_LLM_CACHE_KEYS)))
+
+
+def invalidate_llm_response(resp):
+    """Retire du cache la réponse `resp` (JSON irréparable, sortie hors schéma) :
+    la tentative suivante rappelle Claude au lieu de rejouer la même réponse."""
+    key = _LLM_CACHE_KEYS.pop(getattr(resp, 'id', None), None)
+    cache = _get_llm_cache()
+    if key is not None and cache is not None:
+        _off_loop(cache.invalidate, key)
+
+
+def _llm_cache_key(request: Dict[str, Any]) -> str:
+    """Hash du modèle, de la version des prompts et de tout le contenu envoyé
+    (system + messages contiennent déjà CV, JD et langue). Le timeout n'en fait pas partie."""
+    payload = {k: v for k, v in request.items() if k != 'timeout'}
+    raw = json.dumps([_PROMPT_VERSION, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _response_to_dict(resp) -> Dict[str, Any]:
+    blocks = []
+    for b in resp.content:
+        block = {'type': b.type}
+        for attr in ('text', 'id', 'name', 'input'):
+            if hasattr(b, attr):
+                block[attr] = getattr(b, attr)
+        blocks.append(block)
+    return {'id': getattr(resp, 'id', None), 'model': getattr(resp, 'model', None),
+            'stop_reason': getattr(resp, 'stop_reason', None), 'content': blocks}
+
+
+def _response_from_dict(d: Dict[str, Any]):
+    """Réponse rejouée depuis le cache : même forme que l'objet SDK, usage à zéro (rien n'est facturé)."""
+    from types import SimpleNamespace
+    return SimpleNamespace(
+        id=d.get('id'), model=d.get('model'), stop_reason=d.get('stop_reason'), type='message', role='assistant',
+        content=[SimpleNamespace(**b) for b in d['content']],
+        usage=SimpleNamespace(input_tokens=0, output_tokens=0,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=0),
+        from_cache=True,
+    )
+
+
+# ==========================================
+# 📥 SOURCES EN MÉMOIRE (bytes / fichier / chemin)
+# ==========================================
+_OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'   # Word 97-2003 (.doc)
+
+
+def _is_path(source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def _read_source(source) -> bytes:
+    """Contenu d'une source : chemin, bytes ou objet fichier (UploadedFile Streamlit, BytesIO...)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if _is_path(source):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def _source_label(source) -> str:
+    """Nom affiché dans les logs."""
+    if _is_path(source):
+        return os.fspath(source)
+    name = getattr(source, 'name', None)
+    return name if isinstance(name, str) else f"<{type(source).__name__} en mémoire>"
+
+
+def sniff_file_type(data: bytes) -> str:
+    """Type du document d'après ses premiers octets (l'extension peut mentir).
+    Retourne 'pdf', 'docx', 'doc', 'txt' ou 'unknown'."""
+    head = data[:1024]
+    if b'%PDF-' in head:
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        try:
+            with ZipFile(io.BytesIO(data)) as z:
+                if 'word/document.xml' in z.namelist():
+                    return 'docx'
+        except Exception:
+            pass
+        return 'unknown'
+    if head.startswith(_OLE2_MAGIC):
+        return 'doc'
+    # BOM UTF-8/UTF-16 ou pas d'octet nul : texte brut
+    if head.startswith((b'\xef\xbb\xbf', b'\xff\xfe', b'\xfe\xff')) or b'\x00' not in data[:4096]:
+        return 'txt'
+    return 'unknown'
+
+
+@contextmanager
+def _source_path(source, data: bytes, suffix: str):
+    """Chemin sur disque pour les outils externes (poppler, tesseract).
+    Un chemin existant est réutilisé ; sinon fichier temporaire supprimé à la sortie."""
+    if _is_path(source):
+        yield os.fspath(source)
+        return
+    fd, path = tempfile.mkstemp(prefix='cv_src_', suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+# ==========================================
+# 🧹 NORMALISATION DU TEXTE (avant envoi à Claude)
+# ==========================================
+_PAGE_BREAK = "\n\f"
+_PAGE_MARKER_RE = re.compile(r'^-{2,}\s*Page\s+\d+\s*-{2,}$', re.IGNORECASE)
+_PAGE_NUMBER_RE = re.compile(r'^(?:page|p\.)\s*\d{1,3}(?:\s*(?:/|sur|of|de)\s*\d{1,3})?$|^\d{1,3}\s*(?:/|sur|of)\s*\d{1,3}$',
+                             re.IGNORECASE)
+# Numéro de page en fin de ligne ("Jean Dupont - Page 2", "2/3", "4") : seuls ces chiffres sont
+# ignorés pour reconnaître un en-tête/pied répété ; toute autre ligne est comparée telle quelle
+_PAGE_NUMBER_TAIL_RE = re.compile(r'(?:\b(?:page|p\.)\s*\d{1,3}(?:\s*(?:/|sur|of|de)\s*\d{1,3})?|\b\d{1,3}\s*(?:/|sur|of)\s*\d{1,3}|^\d{1,3})$',
+                                  re.IGNORECASE)
+_YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+_DATE_WORDS_RE = re.compile(r"\b(?:jan|f[ée]v|feb|mar|avr|apr|mai|may|juin|jun|juil|jul|ao[uû]t|aug|sep|oct|nov|d[ée]c|dec)[a-zéû]*\.?"
+                            r"|\b(?:pr[ée]sent|aujourd'hui|now|current|actuel(?:lement)?|today|to|au|à|a|depuis|since)\b",
+                            re.IGNORECASE)
+_DATE_PUNCT_RE = re.compile(r'[\d\s/\-–—.,:()]')
+_SPACES_RE = re.compile(r'[ \t\u00a0\u2000-\u200b\u3000]+')
+_PIPES_RE = re.compile(r'\s*\|(?:\s*\|)*\s*')
+_NORM_MIN_ALNUM_RATIO = 0.3      # sous ce ratio (caractères alphanumériques / visibles) → bruit OCR
+_NORM_DEDUP_MIN_CHARS = 50       # seules les lignes longues répétées à la suite sont fusionnées (pas les intitulés courts)
+_NORM_EDGE_LINES = 2             # lignes de début/fin de page candidates en-tête/pied de page
+_NORM_MIN_PAGES = 3              # en dessous, pas assez de pages pour distinguer un en-tête d'un contenu
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation rapide (~4 caractères par token), suffisante pour suivre les économies."""
+    return (len(text) + 3) // 4
+
+
+def _clean_line(line: str) -> str:
+    line = _SPACES_RE.sub(' ', line).strip()
+    if '|' in line:
+        # Cellules vides de tableau ("a |  |  | b") → un seul séparateur
+        line = _PIPES_RE.sub(' | ', line).strip(' |')
+    return line
+
+
+def _is_date_line(line: str) -> bool:
+    """Ligne faite uniquement de dates ("2019 - 2023", "Janv. 2016 – Présent") : jamais retirée."""
+    return bool(_YEAR_RE.search(line)) and not _DATE_PUNCT_RE.sub('', _DATE_WORDS_RE.sub('', line))
+
+
+def _edge_key(line: str) -> str:
+    """Clé de comparaison des lignes de bord : exacte, sauf le numéro de page final masqué."""
+    line = line.lower()
+    match = _PAGE_NUMBER_TAIL_RE.search(line)
+    if match:
+        line = line[:match.start()] + re.sub(r'\d+', '#', match.group())
+    return line
+
+
+def _is_noise(line: str) -> bool:
+    visible = line.replace(' ', '')
+    if len(visible) < 4:
+        return not any(c.isalnum() for c in visible)
+    return sum(c.isalnum() for c in visible) / len(visible) < _NORM_MIN_ALNUM_RATIO
+
+
+def normalize_cv_text(text: str) -> str:
+    """
+    Allège le texte extrait avant parsing (tokens et latence) sans toucher au contenu :
+    - marqueurs '--- Page N ---' et numéros de page retirés
+    - espaces et séparateurs de tableau (|) compactés, lignes vides fusionnées
+    - en-têtes/pieds de page répétés (à partir de 3 pages, 2 premières/dernières lignes,
+      texte identique au numéro de page près) : seule la 1re occurrence est gardée ;
+      les lignes de dates ne sont jamais retirées
+    - lignes de bruit OCR (peu de caractères alphanumériques) supprimées
+    - ligne longue répétée immédiatement (copie de zone de texte ou d'en-tête) fusionnée ;
+      une même puce dans deux expériences est gardée
+    """
+    pages = []
+    for page in text.split('\f'):
+        lines = [_clean_line(l) for l in page.splitlines()]
+        lines = [l for l in lines if not _PAGE_MARKER_RE.match(l)]
+        # Lignes de bord (haut/bas de page) : seules candidates en-tête/pied de page
+        content = [i for i, l in enumerate(lines) if l]
+        edges = set(content[:_NORM_EDGE_LINES] + content[-_NORM_EDGE_LINES:])
+        pages.append((lines, edges))
+
+    # En-têtes / pieds de page : même ligne (numéro de page ignoré) en bord de page sur au moins la moitié des pages
+    repeated = set()
+    if len(pages) >= _NORM_MIN_PAGES:
+        counts = {}
+        for lines, edges in pages:
+            for k in {_edge_key(lines[i]) for i in edges if not _is_date_line(lines[i])}:
+                counts[k] = counts.get(k, 0) + 1
+        threshold = max(2, (len(pages) + 1) // 2)
+        repeated = {k for k, n in counts.items() if n >= threshold}
+
+    out, seen_repeated, last = [], set(), None
+    for lines, edges in pages:
+        for i, line in enumerate(lines):
+            if not line:
+                if out and out[-1]:
+                    out.append('')
+                continue
+            if _is_noise(line):
+                continue
+            if i in edges:
+                if _PAGE_NUMBER_RE.match(line):
+                    continue
+                key = _edge_key(line)
+                if key in repeated and not _is_date_line(line):
+                    if key in seen_repeated:
+                        continue
+                    seen_repeated.add(key)
+            if len(line) >= _NORM_DEDUP_MIN_CHARS and line == last:
+                continue
+            out.append(line)
+            last = line
+        if out and out[-1]:
+            out.append('')
+    return '\n'.join(out).strip()
+
+
+# ==========================================
+# 📝 EXTRACTION WORD EN UN SEUL PASSAGE (iterparse)
+# ==========================================
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+
+def _iter_docx_part_text(xml_stream) -> Iterator[str]:
+    """Parcourt UNE partie WordprocessingML (document, en-tête, pied de page) en streaming.
+
+    Émet, dans l'ordre du document : les paragraphes, une ligne « a | b | c » par ligne
+    de tableau et le contenu des zones de texte (là où elles sont ancrées).
+    - cellules fusionnées : une cellule gridSpan n'existe qu'une fois dans le XML et les
+      continuations vMerge sont ignorées → plus de texte répété par colonne fusionnée
+    - mc:Fallback (copie VML des zones de texte modernes) est ignoré → pas de doublon
+    - chaque élément de premier niveau est vidé puis détaché une fois traité : seul
+      l'élément courant reste en mémoire
+    """
+    para_stack = []   # paragraphes ouverts (celui d'une zone de texte est imbriqué dans son ancre)
+    cell_stack = []   # cellules ouvertes : {'paras': [...], 'skip': bool}
+    row_stack = []    # lignes de tableau ouvertes
+    fallback_depth = 0
+    ppr_depth = 0     # w:tab dans w:pPr/w:tabs = taquet de tabulation, pas du texte
+    body = None
+
+    for event, elem in ET.iterparse(xml_stream, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == _MC_FALLBACK:
+                fallback_depth += 1
+            elif fallback_depth:
+                continue
+            elif tag == _W + 'p':
+                para_stack.append([])
+            elif tag == _W + 'tc':
+                cell_stack.append({'paras': [], 'skip': False})
+            elif tag == _W + 'tr':
+                row_stack.append([])
+            elif tag == _W + 'pPr':
+                ppr_depth += 1
+            elif tag == _W + 'body':
+                body = elem
+            continue
+
+        # ----- event == 'end' -----
+        if tag == _MC_FALLBACK:
+            fallback_depth -= 1
+            elem.clear()
+            continue
+        if fallback_depth:
+            continue
+
+        if tag == _W + 't':
+            if para_stack and elem.text:
+                para_stack[-1].append(elem.text)
+        elif tag == _W + 'tab':
+            if para_stack and not ppr_depth:
+                para_stack[-1].append('\t')
+        elif tag in (_W + 'br', _W + 'cr'):
+            if para_stack and elem.get(_W + 'type') not in ('page', 'column'):
+                para_stack[-1].append('\n')
+        elif tag == _W + 'pPr':
+            ppr_depth -= 1
+        elif tag == _W + 'vMerge':
+            # Pas de w:val (ou "continue") = suite d'une fusion verticale
+            if cell_stack and elem.get(_W + 'val') in (None, 'continue'):
+                cell_stack[-1]['skip'] = True
+        elif tag == _W + 'p':
+            txt = ''.join(para_stack.pop()).strip() if para_stack else ''
+            if txt:
+                if cell_stack:
+                    cell_stack[-1]['paras'].append(txt)
+                else:
+                    yield txt
+        elif tag == _W + 'tc':
+            cell = cell_stack.pop()
+            if not cell['skip'] and row_stack:
+                row_stack[-1].append('\n'.join(cell['paras']).strip())
+        elif tag == _W + 'tr':
+            row_text = " | ".join(c for c in row_stack.pop() if c)
+            if row_text:
+                if cell_stack:
+                    cell_stack[-1]['paras'].append(row_text)  # tableau imbriqué
+                else:
+                    yield row_text
+
+        # Libérer la mémoire dès qu'un élément de premier niveau est traité
+        if tag in (_W + 'p', _W + 'tbl', _W + 'sdt') and not para_stack and not cell_stack:
+            elem.clear()
+            if body is not None:
+                try:
+                    body.remove(elem)
+                except ValueError:
+                    pass  # pas un enfant direct du body (ex: dans un w:sdt)
+
+
+# ==========================================
+# 🔎 OCR PARALLÈLE (pool de processus borné)
+# ==========================================
+_OCR_LANG = 'eng+fra'            # Anglais + Français
+_OCR_CONFIG = '--psm 1 --oem 3'  # PSM 1 = automatic page segmentation with OSD
+_OCR_POOL = None
+_OCR_POOL_LOCK = threading.Lock()
+
+
+def _ocr_max_workers() -> int:
+    """Nombre max de pages OCR en parallèle (CV_OCR_MAX_WORKERS, sinon nb de cœurs)."""
+    try:
+        n = int(os.getenv('CV_OCR_MAX_WORKERS', '0'))
+    except ValueError:
+        n = 0
+    return max(1, n or os.cpu_count() or 1)
+
+
+def _ocr_worker_init():
+    # Tesseract lance ses propres threads OpenMP : 1 seul par processus pour
+    # éviter la sur-souscription quand plusieurs pages tournent en parallèle.
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+_OCR_DPI = 300                   # Haute résolution pour meilleur OCR
+_PAGE_MIN_CHARS = 100            # En dessous (ou trop peu de mots) → page suspectée scannée
+_PAGE_MIN_WORDS = 20
+
+# Mode adaptatif (CV_OCR_MODE=adaptive, défaut) : 1re passe en basse résolution,
+# re-rasterisation à _OCR_DPI uniquement des pages dont la confiance moyenne Tesseract
+# est sous le seuil. CV_OCR_MODE=fixed → ancien comportement (tout à 300 DPI).
+_OCR_MODE = os.getenv('CV_OCR_MODE', 'adaptive')
+_OCR_LOW_DPI = int(_env_number('CV_OCR_LOW_DPI', 150))
+_OCR_MIN_CONFIDENCE = _env_number('CV_OCR_MIN_CONFIDENCE', 75)
+# OSD fait séparément (orientation + script) → la passe de texte n'a plus besoin de PSM 1
+_OCR_DATA_CONFIG = '--psm 3 --oem 3'
+
+_FR_STOPWORDS = {'le', 'la', 'les', 'des', 'du', 'de', 'et', 'en', 'pour', 'avec',
+                 'dans', 'sur', 'une', 'un', 'au', 'aux', 'est', 'par', 'chez', 'été'}
+_EN_STOPWORDS = {'the', 'and', 'of', 'to', 'in', 'for', 'with', 'on', 'at', 'is',
+                 'by', 'an', 'as', 'from', 'was', 'were', 'have', 'has'}
+
+
+def _guess_ocr_lang(text: str) -> str:
+    """Langue Tesseract à utiliser pour le reste du document, d'après une page déjà lue.
+    Un seul modèle quand la page est clairement FR ou EN, les deux si c'est mélangé."""
+    words = re.findall(r"[a-zà-ÿ]+", text.lower())
+    fr = sum(w in _FR_STOPWORDS for w in words)
+    en = sum(w in _EN_STOPWORDS for w in words)
+    if fr + en < 10:
+        return _OCR_LANG
+    if fr >= 3 * en:
+        return 'fra'
+    if en >= 3 * fr:
+        return 'eng'
+    return _OCR_LANG
+
+
+def _ocr_data_to_text(data) -> tuple:
+    """Reconstruit le texte (lignes / paragraphes) depuis image_to_data + confiance moyenne des mots."""
+    lines, words, confs = [], [], []
+    last_key = None
+    for i, word in enumerate(data['text']):
+        try:
+            conf = float(data['conf'][i])
+        except (TypeError, ValueError):
+            conf = -1.0
+        if conf < 0 or not word.strip():
+            continue
+        confs.append(conf)
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        if key != last_key:
+            if words:
+                lines.append(' '.join(words))
+            if last_key is not None and key[:2] != last_key[:2]:
+                lines.append('')  # nouveau paragraphe
+            words = []
+            last_key = key
+        words.append(word)
+    if words:
+        lines.append(' '.join(words))
+    return '\n'.join(lines), (round(sum(confs) / len(confs), 1) if confs else 0.0)
+
+
+def _ocr_page(file_path: str, page_num: int, dpi: int = _OCR_DPI, lang: str = _OCR_LANG) -> Dict[str, Any]:
+    """Rasterise UNE page du PDF puis l'OCR (exécuté dans un processus du pool).
+
+    pdftoppm écrit l'image dans un dossier temporaire propre à la page ; elle est
+    libérée et supprimée avant la page suivante -> mémoire plate quel que soit
+    le nombre de pages du document.
+    Retourne {'page', 'source', 'text', 'dpi', 'confidence', 'lang', 'rotation', 'script'}.
+    """
+    result = {'page': page_num, 'source': 'ocr', 'text': '', 'dpi': dpi,
+              'confidence': 0.0, 'lang': lang, 'rotation': 0, 'script': None}
+    with tempfile.TemporaryDirectory(prefix='cv_ocr_') as tmp_dir:
+        images = convert_from_path(
+            file_path,
+            dpi=dpi,
+            fmt='jpeg',
+            first_page=page_num,
+            last_page=page_num,
+            output_folder=tmp_dir,
+        )
+        try:
+            for img in images:
+                if _OCR_MODE == 'fixed':
+                    result['text'] += pytesseract.image_to_string(img, lang=_OCR_LANG, config=_OCR_CONFIG)
+                    continue
+                # OSD (orientation + script) : page redressée avant la vraie passe OCR
+                try:
+                    osd = pytesseract.image_to_osd(img, output_type=pytesseract.Output.DICT)
+                    result['rotation'] = int(osd.get('rotate', 0))
+                    result['script'] = osd.get('script')
+                except pytesseract.TesseractError:
+                    pass  # trop peu de texte pour l'OSD : on garde la page telle quelle
+                if result['rotation']:
+                    img = img.rotate(-result['rotation'], expand=True)
+                # Script non latin : le modèle choisi pour le document ne convient pas
+                if result['script'] and result['script'] != 'Latin':
+                    result['lang'] = _OCR_LANG
+                data = pytesseract.image_to_data(img, lang=result['lang'], config=_OCR_DATA_CONFIG,
+                                                 output_type=pytesseract.Output.DICT)
+                text, conf = _ocr_data_to_text(data)
+                result['text'] += text
+                result['confidence'] = conf
+        finally:
+            for img in images:
+                img.close()
+    return result
+
+
+def _get_ocr_pool():
+    """Pool de processus partagé par tout le process (créé à la première utilisation).
+    Sa taille borne le nombre de pages OCR simultanées, toutes sessions confondues."""
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is None:
+            # forkserver : pas de fork du process Streamlit (multi-threadé)
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _OCR_POOL = ProcessPoolExecutor(
+                max_workers=_ocr_max_workers(),
+                mp_context=multiprocessing.get_context(method),
+                initializer=_ocr_worker_init,
+            )
+        return _OCR_POOL
+
+
+# ==========================================
+# 🗂️ CONVERSIONS LIBREOFFICE (pool de workers unoserver)
+# ==========================================
+_OFFICE_WORKERS = int(_env_number('CV_OFFICE_WORKERS', 2))
+_OFFICE_TIMEOUT = _env_number('CV_OFFICE_TIMEOUT', 120)              # s par conversion, au-delà → worker redémarré
+_OFFICE_RECYCLE_AFTER = int(_env_number('CV_OFFICE_RECYCLE_AFTER', 200))  # conversions avant recyclage de soffice
+_OFFICE_BASE_PORT = int(_env_number('CV_OFFICE_BASE_PORT', 2100))
+_OFFICE_START_TIMEOUT = 60
+_OFFICE_POOL = None
+_OFFICE_POOL_LOCK = threading.Lock()
+# Un PDF s'ouvre dans Draw par défaut : Writer est nécessaire pour produire un .docx éditable
+_OFFICE_INFILTERS = {'pdf': 'writer_pdf_import'}
+
+
+def _soffice_executable():
+    return shutil.which('soffice') or shutil.which('libreoffice')
+
+
+def _unoserver_command():
+    """Commande de lancement d'unoserver (CV_UNOSERVER_CMD, sinon `unoserver` du PATH), None si absent."""
+    cmd = os.getenv('CV_UNOSERVER_CMD')
+    if cmd:
+        return shlex.split(cmd)
+    exe = shutil.which('unoserver')
+    return [exe] if exe else None
+
+
+def _kill_process_group(proc):
+    """Tue le processus et ses fils (soffice.bin survit sinon au wrapper)."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        pass
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    """Transport XML-RPC avec timeout : une conversion bloquée ne bloque pas la session."""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self._timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = self._timeout
+        return conn
+
+
+class _OfficeWorker:
+    """Un unoserver (et son soffice) avec son propre profil utilisateur :
+    deux conversions simultanées ne se disputent jamais le même verrou de profil."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.port = _OFFICE_BASE_PORT + 2 * index
+        self.uno_port = self.port + 1
+        self.profile = os.path.join(_CACHE_ROOT, "office", f"profile_{index}")
+        self.proc = None
+
+    def _proxy(self, timeout: float):
+        return xmlrpc.client.ServerProxy(f"http://127.0.0.1:{self.port}", allow_none=True,
+                                         transport=_TimeoutTransport(timeout))
+
+    def start(self, command: list):
+        from pathlib import Path
+        os.makedirs(self.profile, exist_ok=True)
+        cmd = command + ['--interface', '127.0.0.1', '--port', str(self.port), '--uno-port', str(self.uno_port),
+                         '--user-installation', Path(self.profile).resolve().as_uri(),
+                         '--conversion-timeout', str(int(_OFFICE_TIMEOUT)),
+                         '--stop-after', str(_OFFICE_RECYCLE_AFTER)]
+        exe = _soffice_executable()
+        if exe:
+            cmd += ['--executable', exe]
+        # Nouveau groupe de processus : soffice est tué avec unoserver au redémarrage
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                     start_new_session=True)
+        deadline = time.monotonic() + _OFFICE_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                code = self.proc.returncode
+                self.proc = None
+                raise RuntimeError(f"unoserver #{self.index} arrêté au démarrage (code {code})")
+            if self.healthy():
+                print(f"   🗂️ Worker LibreOffice #{self.index} prêt (port {self.port})", flush=True)
+                return
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"unoserver #{self.index} ne répond pas après {_OFFICE_START_TIMEOUT} s")
+
+    def healthy(self) -> bool:
+        """Processus vivant ET serveur XML-RPC qui répond (sinon : planté, bloqué ou recyclé)."""
+        if self.proc is None or self.proc.poll() is not None:
+            return False
+        try:
+            self._proxy(5).info()
+            return True
+        except Exception:
+            return False
+
+    def stop(self):
+        if self.proc is not None:
+            _kill_process_group(self.proc)
+            self.proc = None
+
+    def convert(self, data: bytes, convert_to: str, infilter: str = None) -> bytes:
+        result = self._proxy(_OFFICE_TIMEOUT + 10).convert(
+            None, xmlrpc.client.Binary(data), None, convert_to, None, [], True, infilter)
+        return result.data
+
+
+class _OfficePool:
+    """File des workers libres : une conversion prend un worker, le (re)démarre
+    si besoin, le rend à la fin. Un worker bloqué ou injoignable est tué et relancé."""
+
+    def __init__(self, size: int, command: list):
+        self.command = command
+        self.workers = [_OfficeWorker(i) for i in range(size)]
+        self.warmed = False
+        self.idle = queue.Queue()
+        for w in self.workers:
+            self.idle.put(w)
+
+    def _acquire(self) -> '_OfficeWorker':
+        try:
+            worker = self.idle.get(timeout=_OFFICE_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("Aucun worker LibreOffice libre")
+        try:
+            if not worker.healthy():
+                worker.stop()
+                worker.start(self.command)
+        except Exception:
+            self.idle.put(worker)
+            raise
+        return worker
+
+    def convert(self, data: bytes, convert_to: str, infilter: str = None) -> bytes:
+        worker = self._acquire()
+        try:
+            return worker.convert(data, convert_to, infilter)
+        except (OSError, http.client.HTTPException, xmlrpc.client.ProtocolError):
+            # Timeout ou connexion coupée : soffice bloqué → redémarré à la prochaine demande
+            worker.stop()
+            raise
+        finally:
+            self.idle.put(worker)
+
+    def warm(self):
+        """Démarre les workers d'avance (tâche de fond)."""
+        for _ in self.workers:
+            try:
+                self.idle.put(self._acquire())
+            except Exception as e:
+                print(f"⚠️ Préchauffage LibreOffice: {e}", flush=True)
+                return
+
+    def shutdown(self):
+        for w in self.workers:
+            w.stop()
+
+
+def _get_office_pool():
+    """Pool partagé (créé au premier besoin) ; None si unoserver n'est pas installé."""
+    global _OFFICE_POOL
+    with _OFFICE_POOL_LOCK:
+        if _OFFICE_POOL is None and _OFFICE_WORKERS > 0:
+            command = _unoserver_command()
+            if command:
+                _OFFICE_POOL = _OfficePool(_OFFICE_WORKERS, command)
+                atexit.register(_OFFICE_POOL.shutdown)
+        return _OFFICE_POOL
+
+
+def warm_office_pool():
+    """Lance les workers LibreOffice en arrière-plan (appelé dès qu'un dépôt nécessitera une conversion)."""
+    pool = _get_office_pool()
+    if pool is not None and not pool.warmed:
+        pool.warmed = True
+        threading.Thread(target=pool.warm, daemon=True).start()
+
+
+def _convert_oneshot(data: bytes, src_type: str, convert_to: str, infilter: str = None) -> bytes:
+    """Repli sans unoserver : soffice ponctuel avec un profil isolé (pas de collision entre appels)."""
+    from pathlib import Path
+    exe = _soffice_executable()
+    if not exe:
+        raise RuntimeError("LibreOffice (soffice) introuvable")
+    with tempfile.TemporaryDirectory(prefix='cv_office_') as tmp_dir:
+        src = os.path.join(tmp_dir, f"source.{src_type}")
+        out_dir = os.path.join(tmp_dir, "out")
+        with open(src, 'wb') as f:
+            f.write(data)
+        cmd = [exe, '--headless', '--norestore', f"-env:UserInstallation={Path(tmp_dir, 'profile').as_uri()}",
+               '--convert-to', convert_to, '--outdir', out_dir]
+        if infilter:
+            cmd.append(f"--infilter={infilter}")
+        proc = subprocess.Popen(cmd + [src], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                start_new_session=True)
+        try:
+            proc.wait(timeout=_OFFICE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            _kill_process_group(proc)
+            raise RuntimeError(f"soffice bloqué (> {_OFFICE_TIMEOUT:.0f} s)")
+        out = os.path.join(out_dir, f"source.{convert_to}")
+        if not os.path.exists(out):
+            raise RuntimeError(f"Conversion {src_type} → {convert_to} impossible")
+        with open(out, 'rb') as f:
+            return f.read()
+
+
+def convert_document(source, convert_to: str) -> bytes:
+    """
+    Conversion LibreOffice (.doc → .docx, .pdf → .docx, .docx → .pdf...).
+    `source` : chemin, bytes ou objet fichier ; retourne le document converti (bytes).
+    Passe par le pool unoserver (soffice déjà chaud) ; soffice ponctuel sinon.
+    """
+    data = _read_source(source)
+    src_type = sniff_file_type(data)
+    if src_type not in ('pdf', 'docx', 'doc'):
+        ext = os.path.splitext(_source_label(source))[1].lstrip('.').lower()
+        src_type = ext if ext.isalnum() else src_type
+    infilter = _OFFICE_INFILTERS.get(src_type) if convert_to in ('docx', 'doc', 'odt') else None
+
+    t0 = time.perf_counter()
+    pool = _get_office_pool()
+    if pool is not None:
+        try:
+            result = pool.convert(data, convert_to, infilter)
+            print(f"   🗂️ Conversion {src_type} → {convert_to} (unoserver) en {time.perf_counter() - t0:.1f}s", flush=True)
+            return result
+        except Exception as e:
+            print(f"⚠️ Worker LibreOffice en échec ({e}) → soffice ponctuel", flush=True)
+    result = _convert_oneshot(data, src_type, convert_to, infilter)
+    print(f"   🗂️ Conversion {src_type} → {convert_to} (soffice) en {time.perf_counter() - t0:.1f}s", flush=True)
+    return result
+
+
+# ==========================================
+# ⚡ BOUCLE ASYNCIO PARTAGÉE (appels Claude non bloquants)
+# ==========================================
+_ASYNC_LOOP = None
+_ASYNC_LOOP_LOCK = threading.Lock()
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()  # boucle → {clé API: AsyncAnthropic}
+
+
+def _get_async_loop():
+    """Boucle asyncio de fond (thread démon) partagée par tous les CVEnricher :
+    les appels Claude de toutes les sessions y sont multiplexés, sans thread par requête."""
+    global _ASYNC_LOOP
+    with _ASYNC_LOOP_LOCK:
+        if _ASYNC_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="cv-enricher-async", daemon=True).start()
+            _ASYNC_LOOP = loop
+        return _ASYNC_LOOP
+
+
+def run_sync(coro):
+    """Exécute une coroutine sur la boucle de fond et attend son résultat.
+    Point d'entrée des méthodes synchrones ; depuis du code async, faire `await` directement."""
+    loop = _get_async_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() appelé depuis la boucle asyncio : utiliser la variante async")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def submit_async(coro):
+    """Lance une coroutine sur la boucle de fond sans attendre (concurrent.futures.Future) :
+    l'appelant peut afficher les événements de streaming pendant l'appel."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_async_loop())
+
+
+# ==========================================
+# 🔁 POLITIQUE DE RETRY + COUPE-CIRCUIT (tous les appels Claude)
+# ==========================================
+_RETRY_BASE_DELAY = _env_number('CV_RETRY_BASE_DELAY', 1.0)     # s, doublé à chaque tentative
+_RETRY_MAX_DELAY = _env_number('CV_RETRY_MAX_DELAY', 30.0)      # s, plafond (retry-after compris)
+_BREAKER_THRESHOLD = int(_env_number('CV_BREAKER_THRESHOLD', 5))
+_BREAKER_COOLDOWN = _env_number('CV_BREAKER_COOLDOWN', 30.0)
+_RETRYABLE_STATUS = {408, 409, 429}
+# Erreur SSE en cours de stream : levée en APIStatusError avec le statut HTTP du stream (200)
+_RETRYABLE_ERROR_TYPES = {'overloaded_error', 'api_error', 'rate_limit_error'}
+
+
+class CircuitOpenError(RuntimeError):
+    """API Claude jugée dégradée : appel refusé sans attendre (coupe-circuit ouvert)."""
+
+
+class _CircuitBreaker:
+    """Coupe-circuit partagé par tous les appels : après `threshold` erreurs transitoires
+    consécutives, les appels échouent immédiatement pendant `cooldown` s ; ensuite un seul
+    appel d'essai passe — succès → fermé, échec → rouvert pour un nouveau cooldown."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial:
+                raise CircuitOpenError(f"API Claude indisponible (coupe-circuit ouvert, réessai dans {max(remaining, 0):.0f}s)")
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial:
+                    print(f"⛔ Coupe-circuit ouvert ({self._failures} erreurs consécutives) pour {self.cooldown:.0f}s", flush=True)
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+_BREAKER = _CircuitBreaker(_BREAKER_THRESHOLD, _BREAKER_COOLDOWN)
+
+
+def _is_transient(error) -> bool:
+    """Erreur qui mérite une nouvelle tentative : 408/409/429, 5xx (dont 529 overloaded), réseau/timeout,
+    événement SSE `error` de type overloaded/api/rate_limit reçu en plein stream (statut 200)."""
+    body = getattr(error, 'body', None)
+    if isinstance(body, dict) and isinstance(body.get('error'), dict):
+        if body['error'].get('type') in _RETRYABLE_ERROR_TYPES:
+            return True
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in _RETRYABLE_STATUS or status >= 500
+    import anthropic
+    return isinstance(error, (anthropic.APIConnectionError, asyncio.TimeoutError))
+
+
+def _retry_delay(error, attempt: int) -> float:
+    """Délai avant la tentative suivante : retry-after(-ms) du serveur s'il est fourni,
+    sinon backoff exponentiel « full jitter » ; plafonné à _RETRY_MAX_DELAY."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    for name, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return min(float(value) * scale + random.uniform(0, 0.25), _RETRY_MAX_DELAY)
+            except ValueError:
+                pass  # format date HTTP : backoff normal
+    return random.uniform(0, min(_RETRY_BASE_DELAY * (2 ** attempt), _RETRY_MAX_DELAY))
+
+
+# ==========================================
+# 📡 STREAMING : PARSING JSON INCRÉMENTAL
+# ==========================================
+class IncrementalJSONParser:
+    """Parse au fil de l'eau l'objet JSON renvoyé par Claude (texte reçu par morceaux).
+
+    `feed(chunk)` retourne les événements complétés par ce morceau :
+    - ('item', clé, index, valeur) : un élément d'un tableau de premier niveau
+      (ex. chaque entrée de experiences_enrichies dès qu'elle est fermée)
+    - ('field', clé, valeur) : un champ de premier niveau terminé
+    Le texte avant la première accolade (```json...) est ignoré ; un fragment
+    illisible est sauté en silence (le JSON final reste parsé en entier).
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack = []          # conteneurs ouverts : '{' / '['
+        self._in_str = False
+        self._esc = False
+        self._str_start = None
+        self._expect_key = False  # prochaine chaîne de niveau 1 = une clé
+        self._key = None
+        self._value_start = None  # début de la valeur de niveau 1 en cours
+        self._item_start = None   # début de l'élément de tableau de niveau 2 en cours
+        self._item_index = 0
+
+    def _load(self, start, end):
+        try:
+            return True, json.loads(self._text[start:end])
+        except ValueError:
+            return False, None
+
+    def _end_field(self, end, events):
+        ok, value = self._load(self._value_start, end)
+        if ok and self._key is not None:
+            events.append(('field', self._key, value))
+        self._value_start = None
+
+    def _end_item(self, end, events):
+        ok, value = self._load(self._item_start, end)
+        if ok and self._key is not None:
+            events.append(('item', self._key, self._item_index, value))
+        self._item_start = None
+        self._item_index += 1
+
+    def _in_top_array(self):
+        return len(self._stack) == 2 and self._stack[-1] == '['
+
+    def feed(self, chunk: str) -> list:
+        events = []
+        self._text += chunk
+        text = self._text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == '\\':
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    depth = len(self._stack)
+                    if depth == 1 and self._expect_key:
+                        ok, key = self._load(self._str_start, i + 1)
+                        self._key = key if ok else None
+                    elif depth == 1 and self._value_start == self._str_start:
+                        self._end_field(i + 1, events)
+                    elif self._in_top_array() and self._item_start == self._str_start:
+                        self._end_item(i + 1, events)
+                continue
+            if not self._stack:
+                if c == '{':
+                    self._stack.append(c)
+                    self._expect_key = True
+                continue
+            depth = len(self._stack)
+            if c in ' \t\r\n':
+                continue
+            if c == ':' and depth == 1:
+                self._expect_key = False
+                continue
+            if c == ',':
+                if depth == 1:
+                    if self._value_start is not None:
+                        self._end_field(i, events)
+                    self._expect_key = True
+                elif self._in_top_array() and self._item_start is not None:
+                    self._end_item(i, events)
+                continue
+            if c in '}]':
+                if self._in_top_array() and self._item_start is not None:
+                    self._end_item(i, events)           # scalaire en fin de tableau
+                if depth == 1 and self._value_start is not None:
+                    self._end_field(i, events)          # scalaire en fin d'objet
+                self._stack.pop()
+                depth = len(self._stack)
+                if self._in_top_array() and self._item_start is not None:
+                    self._end_item(i + 1, events)       # élément objet/tableau fermé
+                elif depth == 1 and self._value_start is not None:
+                    self._end_field(i + 1, events)      # valeur objet/tableau fermée
+                continue
+            # Début d'une valeur (chaîne, conteneur ou scalaire)
+            if depth == 1 and not self._expect_key and self._value_start is None:
+                self._value_start = i
+                self._item_index = 0
+            elif self._in_top_array() and self._item_start is None:
+                self._item_start = i
+            if c == '"':
+                self._in_str = True
+                self._str_start = i
+            elif c in '{[':
+                self._stack.append(c)
+        self._pos = len(text)
+        return events
+
+
+# ==========================================
+# 🩹 RÉPARATION JSON LOCALE (avant tout aller-retour « corrige ce JSON »)
+# ==========================================
+_FENCE_RE = re.compile(r'```[A-Za-z]*')
+_LEADING_FENCE_RE = re.compile(r'^```[A-Za-z]*')
+_TRAILING_FENCE_RE = re.compile(r'```$')
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def _scan_json(s: str):
+    """Parcourt `s` (qui commence par { ou [) hors chaînes : retire blocs ```, commentaires // et /* */,
+    virgules finales, sauts de ligne bruts dans les chaînes ; note les points de coupe sûrs.
+    Retourne (texte gardé, pile ouverte, dans_une_chaîne, points de coupe, fin, réparations)."""
+    out = []
+    stack = []
+    in_str = esc = False
+    cuts = []      # (longueur gardée, pile) : préfixe qui ne se termine pas au milieu d'une valeur
+    fired = set()
+    i, n = 0, len(s)
+    while i < n:
+        c = s[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif c == '\\':
+                esc = True
+            elif c == '"':
+                in_str = False
+            elif c == '\n':
+                c = '\\n'
+                fired.add('newlines')
+            out.append(c)
+            i += 1
+            continue
+        if s.startswith('```', i):
+            i = _FENCE_RE.match(s, i).end()
+            fired.add('fences')
+            continue
+        if s.startswith('//', i):
+            j = s.find('\n', i)
+            i = n if j < 0 else j
+            fired.add('comments')
+            continue
+        if s.startswith('/*', i):
+            j = s.find('*/', i + 2)
+            i = n if j < 0 else j + 2
+            fired.add('comments')
+            continue
+        if c == '"':
+            in_str = True
+        elif c in '{[':
+            stack.append(c)
+            out.append(c)
+            cuts.append((len(out), tuple(stack)))
+            i += 1
+            continue
+        elif c in '}]':
+            k = len(out) - 1
+            while k >= 0 and out[k] in ' \t\r\n':
+                k -= 1
+            if k >= 0 and out[k] == ',':
+                del out[k]
+                fired.add('trailing_commas')
+            if stack:
+                stack.pop()
+            out.append(c)
+            if not stack:
+                return ''.join(out), stack, False, cuts, i + 1, fired
+            i += 1
+            continue
+        elif c == ',':
+            cuts.append((len(out), tuple(stack)))
+        out.append(c)
+        i += 1
+    return ''.join(out), stack, in_str, cuts, None, fired
+
+
+def _close_json(prefix: str, stack) -> str:
+    prefix = prefix.rstrip()
+    if prefix.endswith(','):
+        prefix = prefix[:-1]
+    return prefix + ''.join(_CLOSERS[c] for c in reversed(stack))
+
+
+def repair_json(text: str):
+    """
+    Réparation locale d'une réponse JSON de Claude : blocs ``` autour ou hors chaînes (un ```
+    dans une valeur texte est gardé), texte autour de l'objet, commentaires, virgules finales,
+    chaînes/crochets/accolades non fermés, réponse tronquée (max_tokens) ramenée au dernier
+    élément complet.
+    
+    Returns:
+        (valeur, liste des réparations appliquées) — ValueError si rien d'exploitable
+    """
+    repairs = []
+    # Bloc ouvrant en tête : forcément hors chaîne
+    cleaned = _LEADING_FENCE_RE.sub('', text.strip()).strip()
+    if cleaned != text.strip():
+        repairs.append('fences')
+    # Bloc fermant en fin : retiré seulement si le reste se parse (sinon il peut terminer une chaîne tronquée)
+    unfenced = _TRAILING_FENCE_RE.sub('', cleaned).strip()
+    try:
+        value = json.loads(unfenced)
+        if unfenced != cleaned and 'fences' not in repairs:
+            repairs.append('fences')
+        return value, repairs
+    except ValueError:
+        pass
+    starts = [i for i in (cleaned.find('{'), cleaned.find('[')) if i >= 0]
+    if not starts:
+        raise ValueError("aucun objet JSON dans la réponse")
+    start = min(starts)
+    kept, stack, in_str, cuts, end, fired = _scan_json(cleaned[start:])
+    if start > 0 or (end is not None and _FENCE_RE.sub('', cleaned[start + end:]).strip()):
+        repairs.append('extract')
+    repairs.extend(sorted(fired - set(repairs)))
+    if end is not None:
+        candidates = [kept]
+    else:
+        repairs.append('truncation')
+        candidates = [_close_json(kept + ('"' if in_str else ''), stack)]
+        candidates += [_close_json(kept[:cut], cut_stack) for cut, cut_stack in reversed(cuts[-50:])]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), repairs
+        except ValueError:
+            continue
+    raise ValueError(f"JSON irréparable localement (tentatives: {', '.join(repairs) or 'aucune'})")
+
+
+# ==========================================
+# 📐 SCHÉMAS DE SORTIE (tool use forcé + validation locale)
+# ==========================================
+def _str(default=""):
+    return {"type": "string", "default": default}
+
+
+def _str_list(default=None):
+    schema = {"type": "array", "items": {"type": "string"}}
+    if default is not None:
+        schema["default"] = default
+    return schema
+
+
+_EXPERIENCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "periode": _str(), "entreprise": _str(), "poste": _str(),
+        "responsabilites": _str_list([]),
+    },
+}
+
+PARSED_CV_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "nom_complet": _str(),
+        "titre_professionnel": _str(),
+        "profil_resume": _str(),
+        "lieu_residence": _str("Location not specified"),
+        "langues": _str_list(["Not specified"]),
+        "competences": _str_list([]),
+        "experiences": {"type": "array", "items": _EXPERIENCE_SCHEMA, "default": []},
+        "formation": {"type": "array", "default": [], "items": {
+            "type": "object",
+            "properties": {"diplome": _str(), "institution": _str(), "annee": _str(), "pays": _str()},
+        }},
+        "certifications": {"type": "array", "default": [], "items": {
+            "type": "object",
+            "properties": {"nom": _str(), "organisme": _str(), "annee": _str()},
+        }},
+        "projets": {"type": "array", "default": [], "items": {
+            "type": "object",
+            "properties": {"nom": _str(), "description": _str()},
+        }},
+    },
+    "required": ["nom_complet", "experiences"],
+}
+
+_MATCHING_PROPERTIES = {
+    "score_matching": {"type": "number"},
+    "domaines_analyses": {"type": "array", "items": {
+        "type": "object",
+        "properties": {
+            "domaine": {"type": "string"},
+            "poids": {"type": "number"},
+            "score": {"type": "number"},
+            "score_max": {"type": "number"},
+            "match": {"type": "string", "enum": ["excellent", "bon", "partiel", "incompatible"]},
+            "commentaire": _str(),
+        },
+        "required": ["domaine", "poids", "score"],
+    }},
+    "synthese_matching": {"type": "string"},
+    "points_forts": _str_list([]),
+}
+
+MATCHING_SCHEMA = {
+    "type": "object",
+    "properties": _MATCHING_PROPERTIES,
+    "required": ["score_matching", "domaines_analyses", "synthese_matching"],
+}
+
+_ENRICHED_PROPERTIES = {
+    "titre_professionnel_enrichi": {"type": "string"},
+    "profil_enrichi": {"type": "string"},
+    "mots_cles_a_mettre_en_gras": _str_list([]),
+    "competences_enrichies": {"type": "object", "additionalProperties": _str_list()},
+    "experiences_enrichies": {"type": "array", "items": {
+        "type": "object",
+        "properties": dict(_EXPERIENCE_SCHEMA["properties"], environment=_str()),
+    }},
+    # Pas de défaut : absent → map_to_tmc_structure reprend la formation du CV parsé
+    "formation_enrichie": {"type": "array", "items": {
+        "type": "object",
+        "properties": {"institution": _str(), "diplome": _str(), "annee": _str()},
+    }},
+    "projets_enrichis": _str_list([]),
+}
+_ENRICHED_REQUIRED = ["titre_professionnel_enrichi", "profil_enrichi", "competences_enrichies", "experiences_enrichies"]
+
+ENRICHED_CV_SCHEMA = {
+    "type": "object",
+    "properties": _ENRICHED_PROPERTIES,
+    "required": _ENRICHED_REQUIRED,
+}
+
+# Mode complet (sans matching préalable) : enrichissement + scoring dans la même réponse
+ENRICHED_CV_FULL_SCHEMA = {
+    "type": "object",
+    "properties": dict(_MATCHING_PROPERTIES, **_ENRICHED_PROPERTIES),
+    "required": MATCHING_SCHEMA["required"] + _ENRICHED_REQUIRED,
+}
+
+_OUTPUT_TOOLS = {
+    'parsed_cv': ("enregistrer_cv", "Enregistre les informations structurées extraites du CV.", PARSED_CV_SCHEMA),
+    'matching': ("enregistrer_matching", "Enregistre l'analyse de matching CV / job description.", MATCHING_SCHEMA),
+    'enriched_cv': ("enregistrer_cv_enrichi", "Enregistre le CV reformulé au format TMC.", ENRICHED_CV_SCHEMA),
+    'enriched_cv_full': ("enregistrer_cv_enrichi", "Enregistre le CV reformulé au format TMC et son analyse de matching.",
+                         ENRICHED_CV_FULL_SCHEMA),
+}
+
+_INVALID = object()
+
+
+def _compile_validator(schema: Dict[str, Any], path: str = "$"):
+    """Compile (une fois) un schéma — sous-ensemble JSON Schema : type, properties, required,
+    items, additionalProperties, enum, default — en fonction check(valeur, erreurs).
+    check retourne la valeur normalisée (défauts ajoutés, nombres/chaînes convertis,
+    éléments invalides retirés) ou _INVALID ; chaque écart est ajouté à `erreurs`."""
+    kind = schema.get("type")
+    enum = schema.get("enum")
+
+    if kind == "object":
+        props = {key: (_compile_validator(sub, f"{path}.{key}"), sub) for key, sub in schema.get("properties", {}).items()}
+        required = frozenset(schema.get("required", ()))
+        extra = schema.get("additionalProperties")
+        extra_check = _compile_validator(extra, f"{path}.*") if isinstance(extra, dict) else None
+
+        def check(value, errors):
+            if not isinstance(value, dict):
+                errors.append(f"{path}: objet attendu")
+                return _INVALID
+            out = {}
+            for key, (sub_check, sub) in props.items():
+                if key in value:
+                    checked = sub_check(value[key], errors)
+                    if checked is not _INVALID:
+                        out[key] = checked
+                        continue
+                if "default" in sub:
+                    out[key] = copy.deepcopy(sub["default"])
+                elif key in required and key not in value:
+                    errors.append(f"{path}.{key}: manquant")
+            for key, item in value.items():
+                if key in props:
+                    continue
+                if extra_check is None:
+                    out[key] = item          # clé non décrite : conservée telle quelle
+                else:
+                    checked = extra_check(item, errors)
+                    if checked is not _INVALID:
+                        out[key] = checked
+            return out
+        return check
+
+    if kind == "array":
+        item_check = _compile_validator(schema["items"], f"{path}[]") if "items" in schema else None
+
+        def check(value, errors):
+            if not isinstance(value, list):
+                errors.append(f"{path}: liste attendue")
+                return _INVALID
+            if item_check is None:
+                return value
+            items = (item_check(item, errors) for item in value)
+            return [item for item in items if item is not _INVALID]
+        return check
+
+    def check(value, errors):
+        if kind == "string":
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            elif not isinstance(value, str):
+                errors.append(f"{path}: texte attendu")
+                return _INVALID
+        elif kind in ("number", "integer"):
+            if isinstance(value, str):
+                try:
+                    value = float(value.strip().rstrip('%'))
+                except ValueError:
+                    pass
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                errors.append(f"{path}: nombre attendu")
+                return _INVALID
+            if kind == "integer" or float(value).is_integer():
+                value = int(round(value))
+        elif kind == "boolean" and not isinstance(value, bool):
+            errors.append(f"{path}: booléen attendu")
+            return _INVALID
+        if enum is not None and value not in enum and isinstance(value, str) and value.strip().lower() in enum:
+            value = value.strip().lower()
+        if enum is not None and value not in enum:
+            errors.append(f"{path}: valeur hors liste ({value!r})")
+            return _INVALID
+        return value
+    return check
+
+
+_VALIDATORS = {name: _compile_validator(schema) for name, (_, _, schema) in _OUTPUT_TOOLS.items()}
+
+
+def validate_output(name: str, value):
+    """Valide une sortie de Claude contre son schéma ('parsed_cv', 'matching', 'enriched_cv',
+    'enriched_cv_full') : retourne (valeur normalisée avec défauts, liste d'écarts)."""
+    errors = []
+    checked = _VALIDATORS[name](value, errors)
+    return ({} if checked is _INVALID else checked), errors
+
+
+def _output_tool_kwargs(name: str) -> Dict[str, Any]:
+    """Paramètres d'appel imposant la réponse structurée via l'outil du schéma `name`."""
+    tool_name, description, schema = _OUTPUT_TOOLS[name]
+    return {
+        "tools": [{"name": tool_name, "description": description, "input_schema": schema}],
+        "tool_choice": {"type": "tool", "name": tool_name},
+    }
+
+
+def _tool_input(response):
+    """Arguments (dict) du premier bloc tool_use de la réponse, sinon None."""
+    for block in getattr(response, "content", None) or []:
+        if getattr(block, "type", None) == "tool_use" and isinstance(getattr(block, "input", None), dict):
+            return block.input
+    return None
+
+
+def _response_text(response) -> str:
+    """Texte de la réponse (blocs text concaténés)."""
+    return "".join(getattr(b, "text", "") or "" for b in getattr(response, "content", None) or []
+                   if getattr(b, "type", None) == "text").strip()
+
+
+# ==========================================
+# 📑 REGISTRE DES TEMPLATES DOCX (chargés une fois, clonés à chaque rendu)
+# ==========================================
+_TEMPLATE_NAMES = (
+    "Template_EN.docx", "Template_FR.docx",
+    "Template_EN_Anonymise.docx", "Template_FR_Anonymise.docx",
+    "TMC_NA_template_EN_Anonymise_CoverPage.docx", "TMC_NA_template_EN_Anonymise_Content.docx",
+)
+
+
+def _template_search_paths(template_name: str) -> list:
+    """Emplacements possibles d'un template, par ordre de priorité."""
+    from pathlib import Path
+    script_dir = Path(__file__).parent
+    possible_paths = [
+        Path(template_name),  # Current directory
+        script_dir / template_name,  # Script directory
+        script_dir.parent / "branding" / "templates" / template_name,  # ../../branding/templates/
+        script_dir.parent.parent / "branding" / "templates" / template_name,  # ../../../branding/templates/
+        Path.home() / template_name,  # Home directory
+        Path.home() / "tmc-cv-optimizer" / "branding" / "templates" / template_name,  # Project in home
+        Path("/app/branding/templates") / template_name,  # Render deployment path
+        Path("/home/ubuntu/tmc-cv-optimizer/branding/templates") / template_name,  # Ubuntu deployment
+    ]
+    # Chercher dans les variables d'environnement aussi
+    env_template_path = os.getenv("TMC_TEMPLATE_PATH")
+    if env_template_path:
+        possible_paths.insert(0, Path(env_template_path))
+    return possible_paths
+
+
+def _pairwise(iterable):
+    items = list(iterable)
+    result = []
+    for i in range(0, len(items), 2):
+        if i + 1 < len(items):
+            result.append((items[i], items[i + 1]))
+        else:
+            result.append((items[i], ''))
+    return result
+
+
+class _CompilingEnvironment(jinja2.Environment):
+    """Environnement Jinja partagé : docxtpl appelle from_string() sur le XML de chaque partie
+    à chaque rendu ; le XML d'un template étant identique d'un CV à l'autre, la compilation est
+    mémorisée (Template.render est thread-safe)."""
+
+    _MAX_COMPILED = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compiled = {}
+        self._compiled_lock = threading.Lock()
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class or not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+        template = self._compiled.get(source)
+        if template is None:
+            template = super().from_string(source)
+            with self._compiled_lock:
+                if len(self._compiled) >= self._MAX_COMPILED:
+                    self._compiled.clear()
+                self._compiled[source] = template
+        return template
+
+
+_JINJA_ENV = _CompilingEnvironment()
+_JINJA_ENV.filters['pairwise'] = _pairwise
+
+
+class _PrepatchedDocxTemplate(DocxTemplate):
+    """DocxTemplate dont le nettoyage des balises Jinja éclatées par Word (patch_xml, une série
+    de regex sur tout le XML) est calculé une fois par template puis réutilisé."""
+
+    _patched = {}
+    _patched_lock = threading.Lock()
+
+    def patch_xml(self, src_xml):
+        patched = self._patched.get(src_xml)
+        if patched is None:
+            patched = super().patch_xml(src_xml)
+            with self._patched_lock:
+                if len(self._patched) >= _CompilingEnvironment._MAX_COMPILED:
+                    self._patched.clear()
+                self._patched[src_xml] = patched
+        return patched
+
+
+class _TemplateRegistry:
+    """Templates résolus et lus une seule fois par processus ; get() renvoie un clone neuf
+    (DocxTemplate sur les octets en mémoire) que le rendu peut modifier librement."""
+
+    def __init__(self):
+        self._paths = {}
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def path(self, template_name: str) -> str:
+        with self._lock:
+            if template_name not in self._paths:
+                self._paths[template_name] = self._resolve(template_name)
+            return self._paths[template_name]
+
+    @staticmethod
+    def _resolve(template_name: str) -> str:
+        possible_paths = _template_search_paths(template_name)
+        for path in possible_paths:
+            try:
+                if path.exists() and path.is_file():
+                    print(f"   ✅ Template trouvé: {path.resolve()}")
+                    return str(path.resolve())
+            except (OSError, PermissionError):
+                # Ignorer silencieusement les erreurs de permissions
+                continue
+
+        # Si pas trouvé, afficher tous les chemins essayés
+        print(f"   ❌ Template introuvable: {template_name}")
+        print(f"   Chemins testés:")
+        for path in possible_paths:
+            print(f"      - {path}")
+        print(f"\n   💡 Astuce: Définir TMC_TEMPLATE_PATH pour spécifier un emplacement personnalisé")
+        raise FileNotFoundError(f"Template TMC introuvable: {template_name}")
+
+    def data(self, template_name: str) -> bytes:
+        path = self.path(template_name)
+        with self._lock:
+            if template_name not in self._data:
+                with open(path, 'rb') as f:
+                    self._data[template_name] = f.read()
+            return self._data[template_name]
+
+    def get(self, template_name: str) -> DocxTemplate:
+        return _PrepatchedDocxTemplate(io.BytesIO(self.data(template_name)))
+
+    def warm(self, names=_TEMPLATE_NAMES):
+        """Charge chaque template connu et précompile son XML (rendu à blanc : patch_xml et
+        from_string sont mémorisés avant que le contexte vide ne fasse échouer le rendu)."""
+        started = time.perf_counter()
+        loaded = 0
+        for name in names:
+            try:
+                tpl = self.get(name)
+            except FileNotFoundError:
+                continue
+            try:
+                tpl.render({}, _JINJA_ENV)
+            except Exception:
+                pass
+            loaded += 1
+        print(f"📑 {loaded} template(s) préchargé(s) en {time.perf_counter() - started:.2f}s", flush=True)
+
+
+_TEMPLATES = _TemplateRegistry()
+
+
+def warm_templates():
+    """Précharge les templates en arrière-plan (appelé une fois au démarrage de l'app)."""
+    threading.Thread(target=_TEMPLATES.warm, daemon=True).start()
+
+
+# ==========================================
+# 🧬 COMPOSITION DOCX RAPIDE (épissage direct du body, docxcompose en repli)
+# ==========================================
+_FAST_COMPOSE = os.getenv('CV_FAST_COMPOSE', '1') != '0'
+_R_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_WP_DOCPR = '{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}docPr'
+_COMPOSE_NS = {'w': _W[1:-1], 'r': _R_NS[1:-1], 'wp': _WP_DOCPR[1:].split('}')[0],
+               'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture'}
+# XPath compilées : parcours en C plutôt qu'une boucle Python sur chaque nœud du body
+_R_ATTR_XPATH = etree.XPath('descendant-or-self::*[@r:*]', namespaces=_COMPOSE_NS)
+_DOCPR_XPATH = etree.XPath('descendant-or-self::wp:docPr', namespaces=_COMPOSE_NS)
+_PIC_CNVPR_XPATH = etree.XPath('descendant-or-self::pic:cNvPr', namespaces=_COMPOSE_NS)
+_BOOKMARK_XPATH = etree.XPath('descendant-or-self::w:bookmarkStart | descendant-or-self::w:bookmarkEnd',
+                              namespaces=_COMPOSE_NS)
+# Références vers des parties que l'épissage ne sait pas fusionner (notes, commentaires...)
+_SPLICE_BLOCKERS_XPATH = etree.XPath(
+    ' | '.join(f'descendant-or-self::w:{t}' for t in ('footnoteReference', 'endnoteReference', 'commentReference',
+                                                       'commentRangeStart', 'altChunk', 'subDoc')),
+    namespaces=_COMPOSE_NS)
+# Réglages qui changent le rendu du contenu épissé (rsids, docId, zoom... ignorés)
+_SETTINGS_LAYOUT_TAGS = ('defaultTabStop', 'characterSpacingControl', 'compat', 'themeFontLang', 'clrSchemeMapping')
+
+
+def _xml_key(el):
+    # Sérialisation brute (pas de c14n) : une différence purement syntaxique ne fait que
+    # basculer vers docxcompose
+    return None if el is None else etree.tostring(el)
+
+
+def _styles_by_id(styles_el) -> Dict[str, Any]:
+    return {st.get(_W + 'styleId'): st for st in styles_el.findall(_W + 'style')}
+
+
+def _related_part(doc, reltype):
+    """Partie liée au document (numérotation, thème...) sans la créer si absente."""
+    for rel in doc.part.rels.values():
+        if rel.reltype == reltype and not rel.is_external:
+            return rel.target_part
+    return None
+
+
+def _related_element(doc, reltype):
+    part = _related_part(doc, reltype)
+    return None if part is None else part.element
+
+
+def _settings_key(settings_el):
+    if settings_el is None:
+        return None
+    return [_xml_key(settings_el.find(_W + tag)) for tag in _SETTINGS_LAYOUT_TAGS]
+
+
+def _splice_blocker(master, doc, elements):
+    """Raison pour laquelle le body de `doc` ne peut pas être épissé tel quel dans `master`
+    (None si compatible) : thème, réglages de mise en page, styles utilisés, numérotation
+    utilisée et relations identiques ou transposables des deux côtés."""
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+
+    # 0. Thème (polices/couleurs « theme ») et réglages de mise en page : ceux du maître s'appliquent
+    m_theme, d_theme = _related_part(master, RT.THEME), _related_part(doc, RT.THEME)
+    if (m_theme is None) != (d_theme is None) or (d_theme is not None and m_theme.blob != d_theme.blob):
+        return "thème différent"
+    if _settings_key(_related_element(master, RT.SETTINGS)) != _settings_key(_related_element(doc, RT.SETTINGS)):
+        return "réglages différents"
+
+    # 1. Styles : defaults + styles utilisés (et leurs parents basedOn/link) identiques
+    m_styles, d_styles = master.styles.element, doc.styles.element
+    if _xml_key(m_styles.find(_W + 'docDefaults')) != _xml_key(d_styles.find(_W + 'docDefaults')):
+        return "docDefaults différents"
+    m_by_id, d_by_id = _styles_by_id(m_styles), _styles_by_id(d_styles)
+    todo = [el.get(_W + 'val') for root in elements for tag in ('pStyle', 'rStyle', 'tblStyle')
+            for el in root.iter(_W + tag)]
+    todo += [sid for by_id in (m_by_id, d_by_id) for sid, st in by_id.items() if st.get(_W + 'default') in ('1', 'true')]
+    seen, num_ids = set(), set()
+    while todo:
+        sid = todo.pop()
+        if sid in seen:
+            continue
+        seen.add(sid)
+        st = d_by_id.get(sid)
+        if _xml_key(st) != _xml_key(m_by_id.get(sid)):
+            return f"style '{sid}' différent"
+        if st is not None:
+            todo += [ref.get(_W + 'val') for tag in ('basedOn', 'link') for ref in st.findall(_W + tag)]
+            num_ids.update(el.get(_W + 'val') for el in st.iter(_W + 'numId'))
+
+    # 2. Numérotation : listes utilisées (num + abstractNum) identiques
+    num_ids.update(el.get(_W + 'val') for root in elements for el in root.iter(_W + 'numId'))
+    num_ids.discard('0')
+    if num_ids:
+        m_num, d_num = _related_element(master, RT.NUMBERING), _related_element(doc, RT.NUMBERING)
+        if m_num is None or d_num is None:
+            return "numérotation absente"
+
+        def find(root, tag, attr, value):
+            return next((el for el in root.findall(_W + tag) if el.get(_W + attr) == value), None)
+
+        for nid in num_ids:
+            d_n = find(d_num, 'num', 'numId', nid)
+            if d_n is None or _xml_key(d_n) != _xml_key(find(m_num, 'num', 'numId', nid)):
+                return f"liste {nid} différente"
+            aid = d_n.find(_W + 'abstractNumId').get(_W + 'val')
+            if _xml_key(find(d_num, 'abstractNum', 'abstractNumId', aid)) != _xml_key(find(m_num, 'abstractNum', 'abstractNumId', aid)):
+                return f"liste {nid} différente"
+
+    # 3. Relations : images, liens et en-têtes/pieds sans relations propres
+    for root in elements:
+        blockers = _SPLICE_BLOCKERS_XPATH(root)
+        if blockers:
+            return f"{blockers[0].tag.split('}')[1]} non géré"
+        for el in _R_ATTR_XPATH(root):
+            for attr, rid in el.attrib.items():
+                if not attr.startswith(_R_NS):
+                    continue
+                rel = doc.part.rels.get(rid)
+                if rel is None:
+                    return f"relation {rid} introuvable"
+                if rel.reltype == RT.HYPERLINK or (rel.reltype == RT.IMAGE and not rel.is_external):
+                    continue
+                if rel.reltype in (RT.HEADER, RT.FOOTER) and not rel.target_part.rels:
+                    continue
+                return f"relation {rel.reltype.rsplit('/', 1)[-1]} non gérée"
+    return None
+
+
+def _remap_relation(master, rel) -> str:
+    """Recrée dans `master` la relation `rel` du document ajouté ; renvoie le nouvel rId."""
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+    if rel.is_external:
+        return master.part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+    if rel.reltype == RT.IMAGE:
+        rid, _ = master.part.get_or_add_image(io.BytesIO(rel.target_part.blob))  # dédoublonnée (SHA1)
+        return rid
+    # En-tête / pied de page : copie sous un nouveau nom, le document ajouté reste intact
+    part = rel.target_part
+    partname = master.part.package.next_partname(re.sub(r'\d*\.xml$', '%d.xml', str(part.partname)))
+    part_copy = type(part)(partname, part.content_type, copy.deepcopy(part.element), master.part.package)
+    return master.part.relate_to(part_copy, rel.reltype)
+
+
+def _renumber(roots, xpath, attr, existing):
+    """Renumérote `attr` des éléments `xpath` des copies à la suite des valeurs de `existing`
+    (même ancien id → même nouvel id : les paires bookmarkStart/bookmarkEnd restent liées)."""
+    values = (el.get(attr) or '' for el in existing)
+    next_id = max((int(v) for v in values if v.isdigit()), default=0) + 1
+    new_ids = {}
+    for root in roots:
+        for el in xpath(root):
+            old = el.get(attr)
+            if old not in new_ids:
+                new_ids[old] = str(next_id)
+                next_id += 1
+            el.set(attr, new_ids[old])
+
+
+def _splice_body(master, doc, elements):
+    """Copie les éléments du body de `doc` à la fin de `master` (avant sa sectPr),
+    rIds, identifiants de formes (wp:docPr, pic:cNvPr) et de signets remappés. Toutes les
+    relations sont recréées avant la première insertion ; en cas d'erreur, celles ajoutées
+    au maître sont retirées : maître et document ajouté restent intacts pour docxcompose."""
+    copies = [copy.deepcopy(el) for el in elements]
+    linked = [el for root in copies for el in _R_ATTR_XPATH(root)]
+    rid_map = {}
+    before = set(master.part.rels)
+    body = master.element.body
+    try:
+        for el in linked:
+            for attr, rid in el.attrib.items():
+                if attr.startswith(_R_NS) and rid not in rid_map:
+                    rid_map[rid] = _remap_relation(master, doc.part.rels[rid])
+        _renumber(copies, _DOCPR_XPATH, 'id', _DOCPR_XPATH(body))
+        _renumber(copies, _PIC_CNVPR_XPATH, 'id', _PIC_CNVPR_XPATH(body))
+        _renumber(copies, _BOOKMARK_XPATH, _W + 'id', _BOOKMARK_XPATH(body))
+        for el in linked:
+            for attr, rid in list(el.attrib.items()):
+                if attr.startswith(_R_NS):
+                    el.set(attr, rid_map[rid])
+    except Exception:
+        for rid in set(rid_map.values()) - before:
+            master.part.drop_rel(rid)
+        raise
+    sect = body.find(_W + 'sectPr')
+    for el in copies:
+        if sect is not None:
+            sect.addprevious(el)
+        else:
+            body.append(el)
+
+
+def append_document(master, doc, fast: bool = None) -> str:
+    """Ajoute le body de `doc` à la fin de `master`. Épissage direct du XML quand styles,
+    numérotation et relations sont compatibles (templates de la même famille), docxcompose
+    sinon. Renvoie le moteur utilisé : 'splice' ou 'docxcompose'."""
+    fast = _FAST_COMPOSE if fast is None else fast
+    elements = [el for el in doc.element.body if isinstance(el.tag, str) and el.tag != _W + 'sectPr']
+    reason = _splice_blocker(master, doc, elements) if fast else "désactivé"
+    if reason is None:
+        try:
+            _splice_body(master, doc, elements)
+            return 'splice'
+        except Exception as e:
+            reason = f"épissage en échec ({e})"
+    from docxcompose.composer import Composer
+    print(f"   🧬 Composition docxcompose : {reason}", flush=True)
+    Composer(master).append(doc)
+    return 'docxcompose'
 
 
 def fix_table_width_to_auto(doc):
@@ -120,11 +2194,15 @@ def fix_table_width_to_auto(doc):
     return tables_fixed
 
 
+# JD de remplacement quand aucune description de poste n'est fournie
+NO_JD_TEXT = "(Aucune description de poste fournie — reformate fidèlement le CV au format TMC, sans cibler d'offre.)"
+
+
 class CVEnricher:
     """Universal CV enricher"""
     
-    def __init__(self, api_key: str = None):
-        """Initialize with Claude API key"""
+    def __init__(self, api_key: str = None, route_profile: str = None):
+        """Initialize with Claude API key (route_profile : profil de routage des modèles, cf. resolve_routes)"""
         self.api_key = api_key or os.getenv('ANTHROPIC_API_KEY')
         if not self.api_key:
             raise ValueError("❌ Claude API key missing! Set ANTHROPIC_API_KEY in Streamlit secrets or environment variable.")
@@ -132,30 +2210,168 @@ class CVEnricher:
         # Debug API key
         print(f">>> ANTHROPIC_KEY_PRESENT: {bool(self.api_key)}, len: {len(self.api_key) if self.api_key else 0}", flush=True)
         
-        # Lazy loading
-        self._anthropic_client = None
-    
-    def _get_anthropic_client(self):
-        """Lazy loading of Anthropic client"""
-        if self._anthropic_client is None:
+        # Modèle / max_tokens / timeout / température par étape
+        self.routes = resolve_routes(route_profile)
+
+    def _get_async_client(self):
+        """Client AsyncAnthropic partagé (un par boucle asyncio et par clé API, créé à la demande)"""
+        clients = _ASYNC_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(self.api_key)
+        if client is None:
             try:
                 print(">>> Creating anthropic client", flush=True)
                 import anthropic
-                self._anthropic_client = anthropic.Anthropic(api_key=self.api_key)
+                client = clients[self.api_key] = anthropic.AsyncAnthropic(api_key=self.api_key, max_retries=0)  # retries : _atrack_create
                 print(">>> Anthropic client created OK", flush=True)
             except Exception as e:
                 print(f">>> ERROR creating anthropic client: {repr(e)}", flush=True)
                 raise
-        return self._anthropic_client
-
-    def _track_create(self, **kwargs):
-        """Appelle l'API Claude et enregistre les tokens consommes (compteur d'usage)."""
-        client = self._get_anthropic_client()
-        resp = client.messages.create(**kwargs)
+        return client
+
+    @staticmethod
+    def _json_stream_handler(on_event=None):
+        """Callback on_text (streaming) : transmet à on_event les champs JSON complétés"""
+        parser = IncrementalJSONParser()
+        def on_text(chunk):
+            if on_event is not None:
+                for event in parser.feed(chunk):
+                    on_event(event)
+        return on_text
+
+    @staticmethod
+    def _loads_or_repair(text: str, response=None):
+        """json.loads, puis réparation locale (repair_json) avant tout recours à Claude.
+        Lève l'erreur JSON d'origine si la réponse est irréparable (retirée du cache)."""
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            error = e
+        try:
+            value, repairs = repair_json(text)
+        except ValueError:
+            invalidate_llm_response(response)
+            raise error
+        truncated = getattr(response, 'stop_reason', None) == 'max_tokens'
+        print(f"🩹 JSON réparé localement ({', '.join(repairs) or 'nettoyage'})"
+              f"{' — réponse tronquée (max_tokens)' if truncated else ''}", flush=True)
+        _off_loop(record_json_repair, 'local')
+        return value
+
+    @staticmethod
+    def _validate(name: str, value: Dict[str, Any], response=None) -> Dict[str, Any]:
+        """validate_output + log des écarts au schéma (valeurs par défaut déjà appliquées).
+        Une sortie qui n'est pas un objet JSON est retirée du cache de `response`."""
+        if not isinstance(value, dict):
+            invalidate_llm_response(response)
+        value, errors = validate_output(name, value)
+        if errors:
+            print(f"⚠️ Sortie '{name}' hors schéma ({len(errors)}): {', '.join(errors[:5])}", flush=True)
+        return value
+
+    @staticmethod
+    async def _acall_once(client, kwargs, on_text, streamed):
+        """Un appel API (streamé si on_text) ; `streamed` reçoit un marqueur dès le premier morceau transmis."""
+        if on_text is None:
+            return await client.messages.create(**kwargs)
+        async with client.messages.stream(**kwargs) as stream:
+            async for event in stream:
+                if event.type != "content_block_delta":
+                    continue
+                if event.delta.type == "text_delta":
+                    chunk = event.delta.text
+                elif event.delta.type == "input_json_delta":  # arguments de l'outil (sortie structurée)
+                    chunk = event.delta.partial_json
+                else:
+                    continue
+                streamed.append(True)
+                on_text(chunk)
+            return await stream.get_final_message()
+
+    def _track_create(self, stage=None, on_text=None, **kwargs):
+        """Version synchrone de _atrack_create"""
+        return run_sync(self._atrack_create(stage=stage, on_text=on_text, **kwargs))
+
+    async def _atrack_create(self, stage=None, on_text=None, **kwargs):
+        """Appelle l'API Claude et enregistre les tokens consommes (compteur d'usage).
+        Avec `on_text`, la reponse est streamee (messages.stream) : chaque morceau de texte
+        (ou du JSON des arguments d'outil) est passe a on_text des sa reception
+        (sur une reponse en cache : le tout en une fois).
+        `stage` applique la route de l'etape (self.routes) pour les parametres non fournis
+        et ventile tokens, latence et cout par etape/modele dans les stats.
+        Politique de retry unique : erreurs transitoires (429/529/5xx/reseau) relancees avec
+        backoff + jitter ou retry-after, dans la limite du budget `retries` de l'etape ;
+        coupe-circuit partage (CircuitOpenError) quand l'API est degradee. Un flux deja
+        commence n'est jamais relance (le texte a ete transmis a on_text).
+        Un `system` texte est envoye avec un point de cache (cache_control ephemeral) :
+        les consignes fixes ne sont facturees a plein tarif qu'a la premiere ecriture.
+        Les reponses sont gardees sur disque : meme requete (modele, version des prompts,
+        contenu) → reponse rejouee instantanement, sans appel ni tokens."""
+        retries = 0
+        if stage is not None:
+            route = self.routes[stage]
+            retries = int(route.get("retries") or 0)
+            for name, value in route.items():
+                if value is not None and name not in _ROUTE_POLICY_KEYS:
+                    kwargs.setdefault(name, value)
+        cache = _get_llm_cache()
+        key = None
+        if cache is not None:
+            key = _llm_cache_key(kwargs)
+            cached = await asyncio.to_thread(cache.get_json, key)
+            await asyncio.to_thread(record_llm_cache, cached is not None)
+            if cached is not None:
+                print(f"   ⚡ Réponse Claude en cache ({kwargs.get('model')})", flush=True)
+                resp = _response_from_dict(cached)
+                _remember_llm_cache_key(resp, key)
+                if on_text is not None:
+                    tool_input = _tool_input(resp)
+                    on_text(_response_text(resp) if tool_input is None else json.dumps(tool_input, ensure_ascii=False))
+                return resp
+        
+        client = self._get_async_client()
+        system = kwargs.get("system")
+        if isinstance(system, str) and system:
+            kwargs["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                _BREAKER.before_call()
+            except CircuitOpenError:
+                await asyncio.to_thread(record_circuit_open)
+                raise
+            streamed = []
+            try:
+                resp = await self._acall_once(client, kwargs, on_text, streamed)
+            except Exception as e:
+                if not _is_transient(e):
+                    _BREAKER.record_success()  # l'API répond : erreur de requête, pas de panne
+                    raise
+                _BREAKER.record_failure()
+                if attempt >= retries or streamed:
+                    raise
+                delay = _retry_delay(e, attempt)
+                attempt += 1
+                await asyncio.to_thread(record_retry, stage, kwargs.get("model"))
+                print(f"🔁 {stage or 'Claude'} : {type(e).__name__} → tentative {attempt + 1}/{retries + 1} dans {delay:.1f}s", flush=True)
+                await asyncio.sleep(delay)
+                continue
+            _BREAKER.record_success()
+            break
+        # Réponse tronquée (max_tokens) : JSON incomplet → jamais mise en cache
+        if cache is not None and getattr(resp, "stop_reason", None) != "max_tokens":
+            try:
+                await asyncio.to_thread(cache.set_json, key, _response_to_dict(resp))
+                _remember_llm_cache_key(resp, key)
+            except Exception as e:
+                print(f"⚠️ Cache réponse Claude non écrit: {e}", flush=True)
         try:
             u = getattr(resp, "usage", None)
             if u is not None:
-                record_api_usage(getattr(u, "input_tokens", 0), getattr(u, "output_tokens", 0))
+                await asyncio.to_thread(record_api_usage, getattr(u, "input_tokens", 0), getattr(u, "output_tokens", 0),
+                                        getattr(u, "cache_creation_input_tokens", 0) or 0,
+                                        getattr(u, "cache_read_input_tokens", 0) or 0,
+                                        stage=stage, model=kwargs.get("model"), seconds=time.perf_counter() - started)
         except Exception:
             pass
         return resp
@@ -169,226 +2385,324 @@ class CVEnricher:
         ext = file_path.lower().split('.')[-1]
         if ext == 'pdf':
             return 'pdf'
-        elif ext in ['docx', 'doc']:
+        elif ext == 'docx':
             return 'docx'
+        elif ext == 'doc':
+            return 'doc'
         elif ext in ['txt', 'text']:
             return 'txt'
         else:
             return 'unknown'
     
-    def extract_from_pdf(self, file_path: str) -> str:
+    def extract_from_pdf(self, source) -> str:
         """
-        Extraire texte d'un PDF avec fallback OCR automatique
+        Extraire texte d'un PDF (chemin, bytes ou objet fichier) avec fallback OCR automatique, page par page
         1. Essaye PyPDF2 pour texte sélectionnable
-        2. Si échec/texte vide → Utilise OCR sur images
+        2. Seules les pages sans vrai texte (scannées) passent par l'OCR
         """
-        print(f"📄 Extracting PDF: {file_path}", flush=True)
+        pages = self._extract_pdf_pages(source)
+        return self._join_pdf_pages(pages)
+    
+    @staticmethod
+    def _format_pdf_page(page: Dict[str, Any]) -> str:
+        """Texte d'une page ; les pages OCR gardent leur marqueur '--- Page N ---'."""
+        if page['source'] == 'ocr':
+            return f"--- Page {page['page']} ---\n{page['text']}\n"
+        return page['text']
+    
+    @classmethod
+    def _join_pdf_pages(cls, pages: List[Dict[str, Any]]) -> str:
+        """Texte du document ; pages séparées par un saut de page (\\f) repéré par normalize_cv_text."""
+        return _PAGE_BREAK.join(cls._format_pdf_page(p) for p in pages if p['text'].strip()).strip()
+    
+    @staticmethod
+    def _page_has_images(page) -> bool:
+        """Vrai si la page dessine au moins une image (XObject /Image, direct ou via un /Form)."""
+        try:
+            xobjects = page['/Resources']['/XObject']
+        except Exception:
+            return False
+        try:
+            for name in xobjects:
+                xobj = xobjects[name]
+                subtype = xobj.get('/Subtype')
+                if subtype == '/Image':
+                    return True
+                if subtype == '/Form' and '/Resources' in xobj and '/XObject' in xobj['/Resources']:
+                    if CVEnricher._page_has_images(xobj):
+                        return True
+        except Exception:
+            # En cas de doute, laisser l'OCR décider
+            return True
+        return False
+    
+    def _extract_pdf_pages(self, source) -> List[Dict[str, Any]]:
+        """
+        Classification page par page : le texte PyPDF2 est gardé pour les pages qui
+        en ont vraiment, seules les pages pauvres en texte (scannées) partent à l'OCR.
+        Le PDF est lu en mémoire ; il n'est écrit sur disque que si l'OCR (poppler) en a besoin.
+        Retourne [{'page': n, 'source': 'text'|'ocr', 'text': ...}] dans l'ordre.
+        """
+        print(f"📄 Extracting PDF: {_source_label(source)}", flush=True)
+        data = _read_source(source)
         
         try:
             # ===== ÉTAPE 1: Tentative extraction PyPDF2 =====
-            text = []
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                num_pages = len(pdf_reader.pages)
-                print(f"📊 PDF has {num_pages} pages", flush=True)
-                
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text.append(page_text)
-                    print(f"  Page {page_num}: {len(page_text) if page_text else 0} chars", flush=True)
+            pages = []
+            poor_pages = []   # pages avec trop peu de texte
+            image_pages = set()
+            pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+            num_pages = len(pdf_reader.pages)
+            print(f"📊 PDF has {num_pages} pages", flush=True)
             
-            extracted_text = "\n".join(text).strip()
+            for page_num, page in enumerate(pdf_reader.pages, 1):
+                page_text = (page.extract_text() or "").strip()
+                pages.append({'page': page_num, 'source': 'text', 'text': page_text})
+                print(f"  Page {page_num}: {len(page_text)} chars", flush=True)
+                
+                # Seuil par page: moins de 100 caractères ou trop peu de mots → suspect
+                if not (len(page_text) > _PAGE_MIN_CHARS and len(page_text.split()) > _PAGE_MIN_WORDS):
+                    poor_pages.append(page_num)
+                    if self._page_has_images(page):
+                        image_pages.add(page_num)
             
-            # ===== VÉRIFIER SI L'EXTRACTION A FONCTIONNÉ =====
-            # Seuil: Si moins de 100 caractères ou trop peu de mots → C'est scanné
+            extracted_text = "\n".join(p['text'] for p in pages).strip()
             word_count = len(extracted_text.split())
             char_count = len(extracted_text)
-            
             print(f"📈 PyPDF2 extraction: {char_count} chars, {word_count} words", flush=True)
             
-            # Si extraction suffisante → Retourner
-            if char_count > 100 and word_count > 20:
+            # ===== ÉTAPE 2: Choisir les pages à OCR =====
+            if char_count > _PAGE_MIN_CHARS and word_count > _PAGE_MIN_WORDS:
+                # Document globalement textuel : une page pauvre n'est OCRisée que si
+                # elle contient une image (page scannée), pas une simple page de garde
+                ocr_pages = [n for n in poor_pages if n in image_pages]
+            else:
+                # Quasi aucun texte : PDF scanné (ou texte vectorisé) → OCR de tout ce qui est pauvre
+                ocr_pages = poor_pages
+            
+            if not ocr_pages:
                 print("✅ PDF text extraction successful (text-based PDF)", flush=True)
-                return extracted_text
+                return pages
             
-            # ===== ÉTAPE 2: PDF scanné détecté → OCR =====
-            print("⚠️ PDF appears to be scanned (image-based). Switching to OCR...", flush=True)
-            return self._extract_from_pdf_ocr(file_path)
+            print(f"⚠️ {len(ocr_pages)}/{num_pages} page(s) scannée(s) détectée(s) → OCR de ces pages uniquement", flush=True)
+            with _source_path(source, data, '.pdf') as pdf_path:
+                ocr_results = {p['page']: p for p in self._ocr_pdf_pages(pdf_path, ocr_pages)}
+            return [ocr_results.get(p['page'], p) for p in pages]
             
         except Exception as e:
             print(f"❌ Error in PDF extraction: {e}", flush=True)
             # En cas d'erreur PyPDF2, essayer quand même OCR
             try:
                 print("🔄 Trying OCR as fallback...", flush=True)
-                return self._extract_from_pdf_ocr(file_path)
+                with _source_path(source, data, '.pdf') as pdf_path:
+                    return self._ocr_pdf_pages(pdf_path)
             except Exception as e2:
                 print(f"❌ OCR fallback also failed: {e2}", flush=True)
-                return ""
+                return []
     
     def _extract_from_pdf_ocr(self, file_path: str) -> str:
         """
         Extraire texte d'un PDF scanné via OCR
-        Utilise pdf2image + pytesseract
-        """
-        print("🔍 Starting OCR extraction...", flush=True)
-        
+        Utilise pdf2image + pytesseract (toutes les pages)
+        """
         try:
-            # Convertir PDF en images (une par page)
-            # poppler_path peut être nécessaire sur Windows, mais pas sur Linux/Render
-            images = convert_from_path(
-                file_path,
-                dpi=300,  # Haute résolution pour meilleur OCR
-                fmt='jpeg',
-                thread_count=2  # Parallélisation
-            )
-            
-            print(f"📷 Converted {len(images)} pages to images", flush=True)
-            
-            # Extraire texte de chaque image
-            all_text = []
-            for i, image in enumerate(images, 1):
-                print(f"  🔎 OCR processing page {i}/{len(images)}...", flush=True)
-                
-                # Appliquer OCR avec config optimisée
-                # lang='eng+fra' pour anglais ET français
-                page_text = pytesseract.image_to_string(
-                    image,
-                    lang='eng+fra',  # Anglais + Français
-                    config='--psm 1 --oem 3'  # PSM 1 = automatic page segmentation with OSD
-                )
-                
-                if page_text.strip():
-                    all_text.append(f"--- Page {i} ---\n{page_text}")
-                    print(f"  ✓ Page {i}: {len(page_text)} chars extracted", flush=True)
-            
-            extracted_text = "\n\n".join(all_text)
-            print(f"✅ OCR extraction complete: {len(extracted_text)} chars total", flush=True)
-            
-            return extracted_text
-            
+            pages = self._ocr_pdf_pages(file_path)
         except Exception as e:
             print(f"❌ OCR extraction failed: {e}", flush=True)
             import traceback
             print(traceback.format_exc(), flush=True)
             return ""
+        return self._join_pdf_pages(pages)
+    
+    def _ocr_pdf_pages(self, file_path: str, page_nums: List[int] = None) -> List[Dict[str, Any]]:
+        """
+        OCR des pages demandées (toutes par défaut).
+        Les pages sont réparties sur un pool de processus (CV_OCR_MAX_WORKERS,
+        défaut = nb de cœurs), l'ordre est conservé.
+        Mode adaptatif : passe basse résolution, puis re-passe à 300 DPI des seules
+        pages à faible confiance. DPI et confiance retenus sont exposés par page.
+        """
+        print("🔍 Starting OCR extraction...", flush=True)
+        
+        # Les pages ne sont PAS rasterisées d'avance : chaque tâche rend sa page
+        # (first_page/last_page) puis la libère -> au plus `workers` images en mémoire.
+        # poppler_path peut être nécessaire sur Windows, mais pas sur Linux/Render
+        if page_nums is None:
+            page_nums = list(range(1, int(pdfinfo_from_path(file_path)['Pages']) + 1))
+        num_pages = len(page_nums)
+        
+        if _OCR_MODE == 'fixed':
+            print(f"📷 {num_pages} pages à rasteriser ({_OCR_DPI} DPI, page par page)", flush=True)
+            results = self._run_ocr_tasks(file_path, page_nums, _OCR_DPI, _OCR_LANG)
+        else:
+            print(f"📷 {num_pages} pages à rasteriser ({_OCR_LOW_DPI} DPI d'abord, page par page)", flush=True)
+            # 1re page seule, avec les deux langues → choisit le modèle du reste du document
+            first = self._run_ocr_tasks(file_path, page_nums[:1], _OCR_LOW_DPI, _OCR_LANG)
+            lang = _guess_ocr_lang(first[0]['text'])
+            print(f"  🌐 Langue OCR retenue pour le document: {lang}", flush=True)
+            results = first + self._run_ocr_tasks(file_path, page_nums[1:], _OCR_LOW_DPI, lang)
+            
+            # Re-rasterisation haute résolution des seules pages peu fiables
+            retry = [r['page'] for r in results if r['confidence'] < _OCR_MIN_CONFIDENCE]
+            if retry:
+                print(f"  🔁 {len(retry)} page(s) sous {_OCR_MIN_CONFIDENCE:.0f}% de confiance → {_OCR_DPI} DPI", flush=True)
+                better = {r['page']: r for r in self._run_ocr_tasks(file_path, retry, _OCR_DPI, _OCR_LANG)}
+                results = [better[r['page']] if r['page'] in better and better[r['page']]['confidence'] >= r['confidence'] else r
+                           for r in results]
+        
+        for r in results:
+            conf = f", conf {r['confidence']}%" if _OCR_MODE != 'fixed' else ""
+            print(f"  ✓ Page {r['page']}: {len(r['text'])} chars extracted (OCR {r['dpi']} DPI{conf})", flush=True)
+        
+        print(f"✅ OCR extraction complete: {sum(len(r['text']) for r in results)} chars total", flush=True)
+        return results
+    
+    def _run_ocr_tasks(self, file_path: str, page_nums: List[int], dpi: int, lang: str) -> List[Dict[str, Any]]:
+        """Exécute _ocr_page sur les pages données (pool si plusieurs), dans l'ordre."""
+        n = len(page_nums)
+        if not n:
+            return []
+        workers = _ocr_max_workers()
+        # Une seule page (ou 1 worker) → pas la peine de passer par le pool
+        if workers > 1 and n > 1:
+            print(f"  ⚡ OCR parallèle: {min(workers, n)} pages simultanées", flush=True)
+            # map() rend les résultats dans l'ordre des pages
+            return list(_get_ocr_pool().map(_ocr_page, [file_path] * n, page_nums, [dpi] * n, [lang] * n))
+        return [_ocr_page(file_path, p, dpi, lang) for p in page_nums]
     
      
-    def extract_from_docx(self, file_path: str) -> str:
-        """Extraire texte d'un Word + zones textes"""
+    def extract_from_docx(self, source) -> str:
+        """Extraire texte d'un Word (chemin, bytes ou objet fichier) + zones textes + en-têtes/pieds de page.
+        Un seul passage iterparse par partie XML, dans l'ordre du document."""
         try:
-            doc = Document(file_path)
             text = []
-            
-            # Paragraphes normaux
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    text.append(para.text.strip())
-            
-            # Tableaux
-            for table in doc.tables:
-                for row in table.rows:
-                    row_text = " | ".join([cell.text.strip() for cell in row.cells if cell.text.strip()])
-                    if row_text:
-                        text.append(row_text)
-            
-            # NOUVEAU : Extraire les zones textes du XML
-            textbox_content = self.extract_textboxes(file_path)
-            if textbox_content:
-                text.append("\n=== ZONES TEXTES ===")
-                text.extend(textbox_content)
+            with ZipFile(source if _is_path(source) else io.BytesIO(_read_source(source)), 'r') as docx:
+                names = docx.namelist()
+                headers = sorted(n for n in names if re.fullmatch(r'word/header\d*\.xml', n))
+                footers = sorted(n for n in names if re.fullmatch(r'word/footer\d*\.xml', n))
+                
+                # En-têtes (souvent nom + coordonnées) : les variantes première page /
+                # paires / impaires répètent les mêmes lignes → dédoublonnées
+                seen = set()
+                def _add_unique(part):
+                    with docx.open(part) as f:
+                        for line in _iter_docx_part_text(f):
+                            if line not in seen:
+                                seen.add(line)
+                                text.append(line)
+                
+                for part in headers:
+                    _add_unique(part)
+                with docx.open('word/document.xml') as f:
+                    text.extend(_iter_docx_part_text(f))
+                for part in footers:
+                    _add_unique(part)
             
             return "\n".join(text)
         except Exception as e:
             print(f"⚠️ Erreur extraction Word: {e}")
             return ""
-    def extract_from_txt(self, file_path: str) -> str:
-        """Extraire texte d'un fichier texte"""
+    def extract_from_txt(self, source) -> str:
+        """Extraire texte d'un fichier texte (chemin, bytes ou objet fichier)"""
         try:
+            data = _read_source(source)
             # Essayer plusieurs encodages
             for encoding in ['utf-8', 'latin-1', 'cp1252']:
                 try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        return f.read()
+                    text = data.decode(encoding)
+                    break
                 except UnicodeDecodeError:
                     continue
-            # Si tout échoue, ignorer les erreurs
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
+            else:
+                # Si tout échoue, ignorer les erreurs
+                text = data.decode('utf-8', errors='ignore')
+            # Fins de ligne normalisées comme en lecture texte
+            return text.replace('\r\n', '\n').replace('\r', '\n')
         except Exception as e:
             print(f"⚠️ Erreur extraction TXT: {e}")
             return ""
     
-    def extract_textboxes(self, docx_path: str) -> list:
-        """Extraire le contenu des zones textes (text boxes) du XML"""
-        textboxes = []
-        
-        try:
-            with ZipFile(docx_path, 'r') as docx:
-                # Lire le document.xml
-                xml_content = docx.read('word/document.xml')
-                tree = ET.fromstring(xml_content)
-                
-                # Namespaces Word
-                namespaces = {
-                    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
-                    'v': 'urn:schemas-microsoft-com:vml',
-                    'w10': 'urn:schemas-microsoft-com:office:word'
-                }
-                
-                # Chercher tous les éléments de texte dans les zones textes
-                # Les zones textes sont dans w:txbxContent
-                for txbx in tree.findall('.//w:txbxContent', namespaces):
-                    texts = []
-                    for t in txbx.findall('.//w:t', namespaces):
-                        if t.text:
-                            texts.append(t.text.strip())
-                    if texts:
-                        textboxes.append(' '.join(texts))
-                
-                # Aussi chercher dans v:textbox (ancien format)
-                for vtxbx in tree.findall('.//v:textbox', namespaces):
-                    texts = []
-                    for t in vtxbx.findall('.//w:t', namespaces):
-                        if t.text:
-                            texts.append(t.text.strip())
-                    if texts:
-                        textboxes.append(' '.join(texts))
-                        
-        except Exception as e:
-            print(f"⚠️ Erreur extraction zones textes: {e}")
-        
-        return textboxes
-    
-    def extract_cv_text(self, cv_path: str) -> str:
-        """Extraction universelle - détecte et extrait selon le type"""
-        print(f"📄 Extraction du CV: {cv_path}")
+    def extract_document(self, source, default_type: str = None) -> Dict[str, Any]:
+        """
+        Extraction universelle avec cache disque.
+        `source` : chemin, bytes ou objet fichier (UploadedFile Streamlit) ; le format est
+        déduit des premiers octets, l'extension (si connue) ne sert qu'en dernier recours.
+        Clé = hash du contenu du fichier + version de l'extracteur : un même fichier
+        re-déposé (matching, puis CV TMC, puis FR/EN...) n'est ni re-parsé ni re-OCRisé.
+        Retourne {'text', 'file_type', 'pages'} (pages = résultats par page pour les PDF).
+        """
+        data = _read_source(source)
+        file_type = sniff_file_type(data)
+        if file_type == 'unknown':
+            file_type = self.detect_file_type(_source_label(source))
+        if file_type == 'unknown' and default_type:
+            file_type = default_type
+        if file_type not in ('pdf', 'docx', 'doc', 'txt'):
+            raise ValueError(f"❌ Format non supporté: {file_type}")
         
-        file_type = self.detect_file_type(cv_path)
+        cache = _get_extraction_cache()
+        key = None
+        if cache is not None:
+            key = f"{hashlib.sha256(data).hexdigest()}-{file_type}-v{_EXTRACTOR_VERSION}"
+            cached = cache.get_json(key)
+            if cached is not None:
+                print(f"   ⚡ Extraction en cache ({len(cached['text'])} caractères)", flush=True)
+                return cached
         
         if file_type == 'pdf':
             print("   Format détecté: PDF")
-            return self.extract_from_pdf(cv_path)
+            # Un chemin reste un chemin (OCR sans copie), sinon on travaille sur les octets
+            pages = self._extract_pdf_pages(source if _is_path(source) else data)
+            text = self._join_pdf_pages(pages)
         elif file_type == 'docx':
             print("   Format détecté: Word")
-            return self.extract_from_docx(cv_path)
-        elif file_type == 'txt':
-            print("   Format détecté: Texte")
-            return self.extract_from_txt(cv_path)
+            pages = []
+            text = self.extract_from_docx(source if _is_path(source) else data)
+        elif file_type == 'doc':
+            print("   Format détecté: Word 97-2003 → conversion .docx")
+            pages = []
+            try:
+                docx_data = convert_document(data, 'docx')
+            except Exception as e:
+                raise ValueError(f"❌ Conversion du .doc impossible ({e}) : enregistrer le fichier en .docx")
+            text = self.extract_from_docx(docx_data)
         else:
-            raise ValueError(f"❌ Format non supporté: {file_type}")
+            print("   Format détecté: Texte")
+            pages = []
+            text = self.extract_from_txt(data)
+        
+        result = {'text': text, 'file_type': file_type, 'pages': pages}
+        # Ne pas mettre en cache un échec d'extraction (texte vide) : on retentera
+        if cache is not None and text.strip():
+            cache.set_json(key, result)
+        return result
+    
+    def extract_cv_text(self, cv) -> str:
+        """Extraction universelle - détecte et extrait selon le type (chemin, bytes ou objet fichier)"""
+        print(f"📄 Extraction du CV: {_source_label(cv)}")
+        return self.extract_document(cv)['text']
 
     # ========================================
     # MODULE 2 : PARSING INTELLIGENT
     # ========================================
     
     def parse_cv_with_claude(self, cv_text: str) -> Dict[str, Any]:
+        """Version synchrone de aparse_cv_with_claude"""
+        return run_sync(self.aparse_cv_with_claude(cv_text))
+
+    async def aparse_cv_with_claude(self, cv_text: str) -> Dict[str, Any]:
         """Parser le CV avec Claude pour extraire les infos structurées"""
         print("🤖 Parsing du CV avec Claude AI...", flush=True)
         
+        # Normalisation : bruit OCR, marqueurs de page, en-têtes répétés... hors du prompt
+        tokens_before = estimate_tokens(cv_text)
+        cv_text = normalize_cv_text(cv_text)
+        tokens_saved = tokens_before - estimate_tokens(cv_text)
+        pct = (100 * tokens_saved / tokens_before) if tokens_before else 0
+        print(f"🧹 Texte normalisé: ~{tokens_before} → ~{tokens_before - tokens_saved} tokens (-{pct:.0f}%)", flush=True)
+        await asyncio.to_thread(record_normalization, tokens_before, tokens_saved)
+        
         try:
-            client = self._get_anthropic_client()
-            
             prompt = f"""Tu es un expert en analyse de CV. Extrait TOUTES les informations de ce CV et structure-les en JSON.
 
 CV À ANALYSER:
@@ -447,12 +2761,11 @@ RÈGLES CRITIQUES:
 - Si une section est vide, mets une liste vide []
 - Format JSON strict uniquement"""
 
-            print(f">>> Calling Claude API with timeout=300s...", flush=True)
-            response = self._track_create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=8000,
-                timeout=300.0,  # 5 minutes max
-                messages=[{"role": "user", "content": prompt}]
+            print(f">>> Calling Claude API ({self.routes['parse']['model']})...", flush=True)
+            response = await self._atrack_create(
+                stage="parse",
+                messages=[{"role": "user", "content": prompt}],
+                **_output_tool_kwargs('parsed_cv')
             )
             print(f">>> API call completed successfully", flush=True)
             
@@ -460,7 +2773,8 @@ RÈGLES CRITIQUES:
             print(f">>> ERROR calling anthropic for parsing: {repr(e)}", flush=True)
             return {}
         
-        response_text = response.content[0].text.strip()
+        tool_input = _tool_input(response)
+        response_text = _response_text(response)
         
         # Nettoyer JSON
         if response_text.startswith('```json'):
@@ -472,7 +2786,8 @@ RÈGLES CRITIQUES:
         response_text = response_text.strip()
         
         try:
-            parsed_data = json.loads(response_text)
+            parsed_data = tool_input if tool_input is not None else self._loads_or_repair(response_text, response)
+            parsed_data = self._validate('parsed_cv', parsed_data, response)
             print(f"✅ Parsing réussi!")
             print(f"   Nom: [ANONYMIZED]")
             print(f"   Langues: {', '.join(parsed_data.get('langues', []))}")
@@ -489,21 +2804,20 @@ RÈGLES CRITIQUES:
     # MODULE 3 : ENRICHISSEMENT (TON PROMPT)
     # ========================================
     
-    def read_job_description(self, jd_path: str) -> str:
-        """Lire la job description"""
-        file_type = self.detect_file_type(jd_path)
-        
-        if file_type == 'pdf':
-            return self.extract_from_pdf(jd_path)
-        elif file_type == 'docx':
-            return self.extract_from_docx(jd_path)
-        else:
-            return self.extract_from_txt(jd_path)
+    def read_job_description(self, jd) -> str:
+        """Lire la job description : chemin, bytes ou objet fichier (format inconnu → lu comme du texte)"""
+        return self.extract_document(jd, default_type='txt')['text']
     
-    def analyze_cv_matching(self, parsed_cv: Dict[str, Any], jd_text: str, language: str = "French") -> Dict[str, Any]:
+    def analyze_cv_matching(self, parsed_cv: Dict[str, Any], jd_text: str, language: str = "French", on_event=None) -> Dict[str, Any]:
+        """Version synchrone de aanalyze_cv_matching"""
+        return run_sync(self.aanalyze_cv_matching(parsed_cv, jd_text, language, on_event))
+
+    async def aanalyze_cv_matching(self, parsed_cv: Dict[str, Any], jd_text: str, language: str = "French", on_event=None) -> Dict[str, Any]:
         """
         Analyser le matching entre CV et JD sans enrichir le contenu.
         Retourne uniquement: score_matching, domaines_analyses, synthese_matching
+        Réponse streamée : on_event reçoit les champs dès qu'ils sont complets
+        (cf. IncrementalJSONParser).
         """
         import time
         
@@ -512,8 +2826,6 @@ RÈGLES CRITIQUES:
         start_time = time.time()
         
         try:
-            client = self._get_anthropic_client()
-            
             # Reconstruire le CV en texte pour le prompt
             cv_text = f"""
 PROFIL: {parsed_cv.get('profil_resume', '')}
@@ -535,7 +2847,9 @@ EXPÉRIENCES:
                 cv_text += f"- {form.get('diplome', '')} | {form.get('institution', '')} | {form.get('annee', '')}\n"
         
             # PROMPT FOCALISÉ SUR L'ANALYSE DE MATCHING UNIQUEMENT - VERSION ULTRA-STRICTE V1.3.9
-            prompt = f"""Tu es un système d'évaluation automatisé ULTRA-STRICT qui analyse le matching entre CV et Job Description.
+            # Consignes fixes (ne dépendent que de la langue) en system → mises en cache par l'API ;
+            # seuls la JD et le CV changent d'un appel à l'autre.
+            system_prompt = f"""Tu es un système d'évaluation automatisé ULTRA-STRICT qui analyse le matching entre CV et Job Description.
 
 🎯 ANALYSE DE MATCHING PONDÉRÉE (VERSION ULTRA-STRICTE V1.3.9):
 
@@ -724,15 +3038,7 @@ RÈGLES CRITIQUES:
 📄 FORMAT DE SORTIE JSON
 ═══════════════════════════════════════════════════
 
-📄 JOB DESCRIPTION:
-{jd_text}
-
-📄 CV DU CANDIDAT:
-{cv_text}
-
-═══════════════════════════════════════════════════
-
-🎯 GÉNÈRE MAINTENANT TON ANALYSE - FORMAT JSON STRICT:
+La JOB DESCRIPTION et le CV DU CANDIDAT sont fournis dans le message de l'utilisateur.
 
 Retourne UNIQUEMENT un JSON avec cette structure (sans texte avant/après):
 
@@ -777,63 +3083,53 @@ Retourne UNIQUEMENT un JSON avec cette structure (sans texte avant/après):
 
 ⚠️ LANGUE DE SORTIE: TOUT le texte (noms de domaines, commentaires, synthèse) doit être rédigé en {language}.
 - Si {language} = "French": noms de domaines, commentaires et synthèse 100% en français.
-- Si {language} = "English": domain names, comments and synthesis 100% in English.
+- Si {language} = "English": domain names, comments and synthesis 100% in English."""
+            
+            prompt = f"""📄 JOB DESCRIPTION:
+{jd_text}
+
+📄 CV DU CANDIDAT:
+{cv_text}
 
-Génère l'analyse maintenant:"""
+═══════════════════════════════════════════════════
+
+🎯 GÉNÈRE MAINTENANT TON ANALYSE - FORMAT JSON STRICT (langue de sortie: {language}):"""
             
             print(f">>> Calling Claude API for matching analysis...", flush=True)
             
-            # ✅ RETRY LOGIC FOR TIMEOUTS
-            max_retries = 2
-            response = None
-            last_error = None
-            
-            for attempt in range(max_retries):
-                try:
-                    response = self._track_create(
-                        model="claude-sonnet-4-5-20250929",
-                        max_tokens=4000,
-                        timeout=900.0,  # 15 minutes
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-                    break  # Success - exit retry loop
-                    
-                except Exception as e:
-                    last_error = e
-                    error_name = type(e).__name__
-                    
-                    # Check if it's a timeout error
-                    if 'timeout' in error_name.lower() or 'timeout' in str(e).lower():
-                        if attempt < max_retries - 1:
-                            print(f"⏱️ Timeout attempt {attempt+1}/{max_retries}, retrying...", flush=True)
-                            continue
-                        else:
-                            # Final timeout - return error result
-                            print(f"❌ Final timeout after {max_retries} attempts", flush=True)
-                            return {
-                                'error': 'timeout',
-                                'score_matching': 0,
-                                'domaines_analyses': [],
-                                'synthese_matching': "⏱️ L'analyse a pris trop de temps (timeout après plusieurs tentatives). Veuillez réessayer avec un CV plus court ou contactez le support."
-                            }
-                    else:
-                        # Other error - re-raise
-                        raise
-            
-            if response is None:
-                # Should not happen, but safety check
-                raise last_error
+            # Retries (429/529/5xx/timeouts, retry-after, coupe-circuit) : politique centralisée dans _atrack_create
+            try:
+                response = await self._atrack_create(
+                    stage="matching",
+                    system=system_prompt,
+                    messages=[{"role": "user", "content": prompt}],
+                    on_text=self._json_stream_handler(on_event),  # streaming : plus de timeout de lecture de 15 min
+                    **_output_tool_kwargs('matching')
+                )
+            except Exception as e:
+                if 'timeout' in type(e).__name__.lower() or 'timeout' in str(e).lower():
+                    print(f"❌ Final timeout after retries", flush=True)
+                    return {
+                        'error': 'timeout',
+                        'score_matching': 0,
+                        'domaines_analyses': [],
+                        'synthese_matching': "⏱️ L'analyse a pris trop de temps (timeout après plusieurs tentatives). Veuillez réessayer avec un CV plus court ou contactez le support."
+                    }
+                raise
             
-            # Extraire tokens
+            # Extraire tokens (les tokens servis par le cache de prompt sont comptés à part)
             usage = response.usage
             input_tokens = usage.input_tokens
             output_tokens = usage.output_tokens
-            total_tokens = input_tokens + output_tokens
+            cache_write_tokens = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+            cache_read_tokens = getattr(usage, 'cache_read_input_tokens', 0) or 0
+            total_tokens = input_tokens + cache_write_tokens + cache_read_tokens + output_tokens
             
-            print(f">>> API Response received. Tokens: {total_tokens}", flush=True)
+            print(f">>> API Response received. Tokens: {total_tokens} (cache: {cache_read_tokens} lus, {cache_write_tokens} écrits)", flush=True)
             
-            # Parser la réponse
-            response_text = response.content[0].text.strip()
+            # Parser la réponse (arguments de l'outil structuré ; texte en repli)
+            tool_input = _tool_input(response)
+            response_text = _response_text(response) if tool_input is None else json.dumps(tool_input, ensure_ascii=False)
             
             # Nettoyer le JSON
             if response_text.startswith('```json'):
@@ -846,7 +3142,8 @@ Génère l'analyse maintenant:"""
             
             # Parser le JSON
             try:
-                matching_result = json.loads(response_text)
+                matching_result = tool_input if tool_input is not None else self._loads_or_repair(response_text, response)
+                matching_result = self._validate('matching', matching_result, response)
                 print(f">>> JSON parsed successfully!", flush=True)
                 
                 # V1.3.5 FIX ULTIME: Recalculer TOUS les scores pondérés pour garantir cohérence
@@ -930,40 +3227,21 @@ Génère l'analyse maintenant:"""
 
 Return the corrected JSON directly:"""
                 
-                # ✅ RETRY LOGIC FOR JSON FIX
-                fix_response = None
-                for fix_attempt in range(2):
-                    try:
-                        fix_response = self._track_create(
-                            model="claude-sonnet-4-5-20250929",
-                            max_tokens=4000,
-                            timeout=300.0,  # 5 minutes for fix
-                            messages=[{"role": "user", "content": fix_prompt}]
-                        )
-                        break
-                    except Exception as fix_error:
-                        if 'timeout' in type(fix_error).__name__.lower() or 'timeout' in str(fix_error).lower():
-                            if fix_attempt < 1:
-                                print(f"⏱️ JSON fix timeout, retrying...", flush=True)
-                                continue
-                            else:
-                                # Can't fix JSON - return error
-                                return {
-                                    'error': 'json_parse_timeout',
-                                    'score_matching': 0,
-                                    'domaines_analyses': [],
-                                    'synthese_matching': "❌ Erreur de parsing JSON et timeout lors de la correction. Veuillez réessayer."
-                                }
-                        else:
-                            raise
-                
-                if fix_response is None:
-                    return {
-                        'error': 'json_fix_failed',
-                        'score_matching': 0,
-                        'domaines_analyses': [],
-                        'synthese_matching': "❌ Impossible de corriger le JSON malformé."
-                    }
+                try:
+                    fix_response = await self._atrack_create(
+                        stage="json_fix",
+                        messages=[{"role": "user", "content": fix_prompt}]
+                    )
+                except Exception as fix_error:
+                    if 'timeout' in type(fix_error).__name__.lower() or 'timeout' in str(fix_error).lower():
+                        # Can't fix JSON - return error
+                        return {
+                            'error': 'json_parse_timeout',
+                            'score_matching': 0,
+                            'domaines_analyses': [],
+                            'synthese_matching': "❌ Erreur de parsing JSON et timeout lors de la correction. Veuillez réessayer."
+                        }
+                    raise
                 
                 fixed_text = fix_response.content[0].text.strip()
                 if fixed_text.startswith('```json'):
@@ -974,20 +3252,21 @@ Return the corrected JSON directly:"""
                     fixed_text = fixed_text[:-3]
                 fixed_text = fixed_text.strip()
                 
-                matching_result = json.loads(fixed_text)
+                matching_result = self._validate('matching', self._loads_or_repair(fixed_text, fix_response), fix_response)
+                await asyncio.to_thread(record_json_repair, 'llm')
                 print(f">>> JSON successfully fixed and parsed!", flush=True)
             
             # Calculer le temps et coût
             processing_time = round(time.time() - start_time, 2)
-            cost_input = (input_tokens / 1_000_000) * 3.0
-            cost_output = (output_tokens / 1_000_000) * 15.0
-            total_cost = round(cost_input + cost_output, 4)
+            total_cost = round(usage_cost(input_tokens, output_tokens, cache_write_tokens, cache_read_tokens, model=getattr(response, 'model', None)), 4)
             
             # Ajouter les métadonnées
             matching_result['_metadata'] = {
                 'processing_time_seconds': processing_time,
                 'input_tokens': input_tokens,
                 'output_tokens': output_tokens,
+                'cache_write_tokens': cache_write_tokens,
+                'cache_read_tokens': cache_read_tokens,
                 'total_tokens': total_tokens,
                 'estimated_cost_usd': total_cost
             }
@@ -1016,7 +3295,21 @@ Return the corrected JSON directly:"""
         parsed_cv: Dict[str, Any], 
         jd_text: str, 
         language: str = "French",
-        matching_analysis: Dict[str, Any] = None  # ✅ FIX: Nouveau paramètre pour réutiliser le matching
+        matching_analysis: Dict[str, Any] = None,
+        reuse_scoring: bool = None,
+        on_event=None
+    ) -> Dict[str, Any]:
+        """Version synchrone de aenrich_cv_with_prompt"""
+        return run_sync(self.aenrich_cv_with_prompt(parsed_cv, jd_text, language, matching_analysis, reuse_scoring, on_event))
+
+    async def aenrich_cv_with_prompt(
+        self, 
+        parsed_cv: Dict[str, Any], 
+        jd_text: str, 
+        language: str = "French",
+        matching_analysis: Dict[str, Any] = None,  # ✅ FIX: Nouveau paramètre pour réutiliser le matching
+        reuse_scoring: bool = None,
+        on_event=None
     ) -> Dict[str, Any]:
         """
         Enrichir le CV avec l'IA
@@ -1027,6 +3320,12 @@ Return the corrected JSON directly:"""
             language: Langue cible (French/English)
             matching_analysis: Résultat optionnel du matching préalable (Step 1)
                               Si fourni, réutilise le score au lieu de le recalculer
+            reuse_scoring: Force le prompt simplifié (sans scoring) même si le
+                           matching n'est pas encore connu — il sera fusionné
+                           après coup via merge_matching (cf. enrich_with_matching)
+            on_event: Callback appelé pendant le streaming à chaque champ complété
+                      (titre_professionnel_enrichi, profil_enrichi, chaque
+                      experiences_enrichies...) — cf. IncrementalJSONParser
         
         Returns:
             CV enrichi avec tous les champs nécessaires
@@ -1034,7 +3333,8 @@ Return the corrected JSON directly:"""
         import time
         
         # ⚠️ CRITICIAL: Déterminer si on réutilise le scoring du Step 1
-        reuse_scoring = matching_analysis is not None
+        if reuse_scoring is None:
+            reuse_scoring = matching_analysis is not None
         
         print(f"✨ Enrichissement du CV avec l'IA...", flush=True)
         print(f"   Langue cible: {language}", flush=True)
@@ -1044,8 +3344,6 @@ Return the corrected JSON directly:"""
         start_time = time.time()
         
         try:
-            client = self._get_anthropic_client()
-            
             # Reconstruire le CV en texte pour le prompt
             cv_text = f"""
 PROFIL: {parsed_cv.get('profil_resume', '')}
@@ -1142,13 +3440,13 @@ Si UNE SEULE phrase n'est pas en {language} → RECOMMENCE TOUT.
                 # ============================================
                 # VERSION SIMPLIFIÉE - Matching déjà fait au Step 1
                 # ============================================
-                prompt = f"""Voici la job description et le CV actuel ci-dessous.
+                system_prompt = f"""La job description et le CV actuel sont fournis dans le message de l'utilisateur.
 
-🔹 Reformate et reformule LÉGÈREMENT le CV ci-dessous au format TMC, en gardant un ton professionnel sobre.
+🔹 Reformate et reformule LÉGÈREMENT le CV au format TMC, en gardant un ton professionnel sobre.
 {language_instruction}
 
 🚫🚫 RÈGLE N°1 — FIDÉLITÉ ABSOLUE, ZÉRO INVENTION (prime sur tout le reste) 🚫🚫
-- Utilise UNIQUEMENT des informations RÉELLEMENT présentes dans le CV source ci-dessous.
+- Utilise UNIQUEMENT des informations RÉELLEMENT présentes dans le CV source fourni.
 - INTERDIT d'ajouter une compétence, technologie, outil, chiffre, résultat ou responsabilité absent du CV.
 - INTERDIT de "compléter" avec des mots-clés de la Job Description que le candidat n'a pas. La JD sert SEULEMENT à choisir quels éléments VRAIS du CV mettre en avant et dans quel ordre — JAMAIS à ajouter ce qui est absent.
 - Si une info n'est pas dans le CV (résultat chiffré, outil...), NE L'INVENTE PAS.
@@ -1233,18 +3531,6 @@ FORMAT OBLIGATOIRE (COPIER format compétences):
 - JAMAIS phrases entières en gras
 - Maximum 2-3 mots entre **astérisques**
 
----
-
-JOB DESCRIPTION:
-{jd_text}
-
----
-
-CV ACTUEL:
-{cv_text}
-
----
-
 IMPORTANT FINAL - RÈGLES JSON STRICTES:
 - Génère UNIQUEMENT du JSON valide
 - PAS de commentaires (// ou /* */)
@@ -1260,7 +3546,7 @@ Réponds UNIQUEMENT avec du JSON pur, sans rien d'autre avant ou après."""
                 # ============================================
                 # VERSION COMPLÈTE - Mode legacy/fallback avec matching inclus
                 # ============================================
-                prompt = f"""Voici la job description et le CV actuel ci-dessous.
+                system_prompt = f"""La job description et le CV actuel sont fournis dans le message de l'utilisateur.
 
 🔹 Reformate et reformule LÉGÈREMENT le CV au format TMC, ton professionnel sobre.
 {language_instruction}
@@ -1552,18 +3838,6 @@ Donc: score_matching = 30 ✅
 
 Si tu trouves une incohérence → RECALCULE TOUT depuis le début
 
----
-
-JOB DESCRIPTION:
-{jd_text}
-
----
-
-CV ACTUEL:
-{cv_text}
-
----
-
 IMPORTANT FINAL - RÈGLES JSON STRICTES:
 - Génère UNIQUEMENT du JSON valide
 - PAS de commentaires (// ou /* */)
@@ -1575,19 +3849,36 @@ IMPORTANT FINAL - RÈGLES JSON STRICTES:
 
 Réponds UNIQUEMENT avec du JSON pur, sans rien d'autre avant ou après."""
 
-            print(f">>> Calling Claude API for enrichment with timeout=300s...", flush=True)
-            response = self._track_create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=8000,
-                timeout=300.0,  # 5 minutes max
-                messages=[{"role": "user", "content": prompt}]
+            # Partie variable (hors cache) : la JD et le CV du candidat
+            prompt = f"""JOB DESCRIPTION:
+{jd_text}
+
+---
+
+CV ACTUEL:
+{cv_text}
+
+---
+
+Réponds UNIQUEMENT avec le JSON demandé."""
+
+            print(f">>> Calling Claude API for enrichment ({self.routes['enrichment']['model']}, streaming)...", flush=True)
+            response = await self._atrack_create(
+                stage="enrichment",
+                system=system_prompt,
+                messages=[{"role": "user", "content": prompt}],
+                on_text=self._json_stream_handler(on_event),
+                **_output_tool_kwargs('enriched_cv' if reuse_scoring else 'enriched_cv_full')
             )
             print(f">>> Enrichment API call completed successfully", flush=True)
             
             # 📊 Capturer les métadonnées API
-            input_tokens = response.usage.input_tokens if hasattr(response, 'usage') else 0
-            output_tokens = response.usage.output_tokens if hasattr(response, 'usage') else 0
-            total_tokens = input_tokens + output_tokens
+            usage = getattr(response, 'usage', None)
+            input_tokens = getattr(usage, 'input_tokens', 0) or 0
+            output_tokens = getattr(usage, 'output_tokens', 0) or 0
+            cache_write_tokens = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+            cache_read_tokens = getattr(usage, 'cache_read_input_tokens', 0) or 0
+            total_tokens = input_tokens + cache_write_tokens + cache_read_tokens + output_tokens
             
         except Exception as e:
             print(f">>> ERROR calling anthropic for enrichment: {repr(e)}", flush=True)
@@ -1596,7 +3887,8 @@ Réponds UNIQUEMENT avec du JSON pur, sans rien d'autre avant ou après."""
             return {}
         
         print(f">>> API Response received, extracting text...", flush=True)
-        response_text = response.content[0].text.strip()
+        tool_input = _tool_input(response)
+        response_text = _response_text(response) if tool_input is None else json.dumps(tool_input, ensure_ascii=False)
         print(f">>> Response length: {len(response_text)} characters", flush=True)
         print(f">>> Response preview (first 500 chars):\n{response_text[:500]}", flush=True)
         
@@ -1613,13 +3905,14 @@ Réponds UNIQUEMENT avec du JSON pur, sans rien d'autre avant ou après."""
         
         # 🔧 NOUVEAU: Tentative de parsing avec retry et correction
         enriched = None
+        source = response  # réponse dont provient `enriched` (retirée du cache si hors schéma)
         max_retries = 3
         
         for attempt in range(max_retries):
             try:
                 if attempt == 0:
-                    # Première tentative: parsing direct
-                    enriched = json.loads(response_text)
+                    # Première tentative: parsing direct, puis réparation locale
+                    enriched = tool_input if tool_input is not None else self._loads_or_repair(response_text, response)
                     print(f">>> JSON parsed successfully on first attempt!", flush=True)
                     break
                 else:
@@ -1632,10 +3925,8 @@ Réponds UNIQUEMENT avec du JSON pur, sans rien d'autre avant ou après."""
 
 Return the corrected JSON directly:"""
                     
-                    fix_response = self._track_create(
-                        model="claude-sonnet-4-5-20250929",
-                        max_tokens=8000,
-                        timeout=300.0,  # Same as main enrichment call
+                    fix_response = await self._atrack_create(
+                        stage="json_fix",
                         messages=[{"role": "user", "content": fix_prompt}]
                     )
                     
@@ -1649,7 +3940,9 @@ Return the corrected JSON directly:"""
                         fixed_text = fixed_text[:-3]
                     fixed_text = fixed_text.strip()
                     
-                    enriched = json.loads(fixed_text)
+                    enriched = self._loads_or_repair(fixed_text, fix_response)
+                    source = fix_response
+                    await asyncio.to_thread(record_json_repair, 'llm')
                     print(f">>> JSON successfully fixed and parsed on attempt {attempt}!", flush=True)
                     break
                     
@@ -1672,6 +3965,9 @@ Return the corrected JSON directly:"""
             print(f">>> ERROR: enriched is None after all retries", flush=True)
             return {}
         
+        # 📐 Validation locale (schéma précompilé) : défauts pour les champs optionnels
+        enriched = self._validate('enriched_cv' if reuse_scoring else 'enriched_cv_full', enriched, source)
+        
         # ✅ FIX: Décoder les entités HTML dans tout le contenu enrichi
         import html
         
@@ -1694,16 +3990,16 @@ Return the corrected JSON directly:"""
         # ⏱️ Calculer le temps de traitement
         processing_time = round(time.time() - start_time, 2)
         
-        # 💰 Calculer le coût (prix Claude Sonnet 4.5: $3/MTok input, $15/MTok output)
-        cost_input = (input_tokens / 1_000_000) * 3.0
-        cost_output = (output_tokens / 1_000_000) * 15.0
-        total_cost = round(cost_input + cost_output, 4)
+        # 💰 Calculer le coût (tarif du modèle routé, cf. _MODEL_PRICES ; cache x1.25 / x0.1)
+        total_cost = round(usage_cost(input_tokens, output_tokens, cache_write_tokens, cache_read_tokens, model=getattr(response, 'model', None)), 4)
         
         # 📈 Ajouter les métadonnées dans le résultat
         enriched['_metadata'] = {
             'processing_time_seconds': processing_time,
             'input_tokens': input_tokens,
             'output_tokens': output_tokens,
+            'cache_write_tokens': cache_write_tokens,
+            'cache_read_tokens': cache_read_tokens,
             'total_tokens': total_tokens,
             'estimated_cost_usd': total_cost
         }
@@ -1713,20 +4009,16 @@ Return the corrected JSON directly:"""
         # ✅ FIX: Si on réutilise le matching, merger les résultats
         if reuse_scoring and matching_analysis:
             print(f"   Mode: Réutilisation du matching du Step 1", flush=True)
-            # Récupérer les résultats du Step 1
-            enriched['score_matching'] = matching_analysis.get('score_matching', 0)
-            enriched['domaines_analyses'] = matching_analysis.get('domaines_analyses', [])
-            enriched['synthese_matching'] = matching_analysis.get('synthese_matching', '')
-            enriched['points_forts'] = matching_analysis.get('points_forts', [])
-            print(f"   Score réutilisé: {enriched['score_matching']}/100")
-            print(f"   Domaines réutilisés: {len(enriched['domaines_analyses'])}")
+            self.merge_matching(enriched, matching_analysis)
+        elif reuse_scoring:
+            print(f"   Mode: Matching calculé en parallèle, fusionné ensuite", flush=True)
         else:
             print(f"   Mode: Calcul complet du matching", flush=True)
             print(f"   Score matching: {enriched.get('score_matching', 0)}/100")
             print(f"   Domaines analysés: {len(enriched.get('domaines_analyses', []))}")
         print(f"   Mots-clés en gras: {len(enriched.get('mots_cles_a_mettre_en_gras', []))}")
         print(f"   ⏱️ Temps de traitement: {processing_time}s")
-        print(f"   📊 Tokens: {total_tokens:,} ({input_tokens:,} in + {output_tokens:,} out)")
+        print(f"   📊 Tokens: {total_tokens:,} ({input_tokens:,} in + {cache_read_tokens:,} cache lu + {cache_write_tokens:,} cache écrit + {output_tokens:,} out)")
         print(f"   💰 Coût estimé: ${total_cost}")
         
         if enriched.get('domaines_analyses'):
@@ -1756,15 +4048,87 @@ Return the corrected JSON directly:"""
             print(f">>> WARNING: enriched dict is EMPTY!", flush=True)
             return {}
         
-        # Vérifier les clés essentielles
-        required_keys = ['score_matching', 'domaines_analyses', 'profil_enrichi']
-        missing_keys = [k for k in required_keys if k not in enriched]
-        if missing_keys:
-            print(f">>> WARNING: Missing critical keys: {missing_keys}", flush=True)
-            print(f">>> Available keys: {list(enriched.keys())}", flush=True)
-        
         return enriched
 
+    def merge_matching(self, enriched: Dict[str, Any], matching_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Reporte le résultat du matching (Step 1) dans le CV enrichi."""
+        enriched['score_matching'] = matching_analysis.get('score_matching', 0)
+        enriched['domaines_analyses'] = matching_analysis.get('domaines_analyses', [])
+        enriched['synthese_matching'] = matching_analysis.get('synthese_matching', '')
+        enriched['points_forts'] = matching_analysis.get('points_forts', [])
+        print(f"   Score réutilisé: {enriched['score_matching']}/100")
+        print(f"   Domaines réutilisés: {len(enriched['domaines_analyses'])}")
+        return enriched
+
+    def enrich_with_matching(self, parsed_cv: Dict[str, Any], jd_text: str, language: str = "French", on_event=None) -> tuple:
+        """Version synchrone de aenrich_with_matching"""
+        return run_sync(self.aenrich_with_matching(parsed_cv, jd_text, language, on_event))
+
+    async def aenrich_with_matching(
+        self,
+        parsed_cv: Dict[str, Any],
+        jd_text: str,
+        language: str = "French",
+        on_event=None
+    ) -> tuple:
+        """
+        Lance en parallèle l'analyse de matching et l'enrichissement (prompt
+        simplifié, qui n'a pas besoin du score), puis fusionne les deux.
+        Le temps total est celui de l'appel le plus long, pas leur somme.
+        on_event reçoit les événements de streaming de l'enrichissement.
+        
+        Returns:
+            (enriched_cv, matching_analysis)
+        """
+        start_time = time.time()
+        matching_analysis, enriched = await asyncio.gather(
+            self.aanalyze_cv_matching(parsed_cv, jd_text, language),
+            self.aenrich_cv_with_prompt(parsed_cv, jd_text, language, reuse_scoring=True, on_event=on_event),
+        )
+        if enriched:
+            self.merge_matching(enriched, matching_analysis)
+        print(f"   ⏱️ Matching + enrichissement en parallèle: {time.time() - start_time:.1f}s", flush=True)
+        return enriched, matching_analysis
+
+    def run_pipeline(self, cv, jd=None, language: str = "French", on_event=None) -> Dict[str, Any]:
+        """Version synchrone de arun_pipeline"""
+        return run_sync(self.arun_pipeline(cv, jd, language, on_event))
+
+    async def arun_pipeline(self, cv, jd=None, language: str = "French", on_event=None) -> Dict[str, Any]:
+        """
+        Pipeline complet CV (+ JD optionnelle) → CV enrichi, étapes indépendantes en parallèle :
+        extraction CV et lecture JD ensemble (threads : OCR/LibreOffice sont bloquants),
+        puis parsing, puis matching + enrichissement ensemble.
+        
+        Args:
+            cv: CV (chemin, bytes ou objet fichier)
+            jd: Job description optionnelle (même formats)
+            language: Langue cible (French/English)
+            on_event: Callback de streaming de l'enrichissement (cf. IncrementalJSONParser)
+        
+        Returns:
+            dict avec parsed_cv, jd_text, matching_analysis (None sans JD), enriched_cv
+        """
+        if jd is not None:
+            cv_text, jd_text = await asyncio.gather(
+                asyncio.to_thread(self.extract_cv_text, cv),
+                asyncio.to_thread(self.read_job_description, jd),
+            )
+        else:
+            cv_text, jd_text = await asyncio.to_thread(self.extract_cv_text, cv), ""
+        parsed_cv = await self.aparse_cv_with_claude(cv_text)
+        if jd_text:
+            enriched_cv, matching_analysis = await self.aenrich_with_matching(parsed_cv, jd_text, language, on_event)
+        else:
+            enriched_cv = await self.aenrich_cv_with_prompt(parsed_cv, NO_JD_TEXT, language, on_event=on_event)
+            matching_analysis = None
+        return {
+            'parsed_cv': parsed_cv,
+            'jd_text': jd_text,
+            'matching_analysis': matching_analysis,
+            'enriched_cv': enriched_cv,
+        }
+
     # ========================================
     # MODULE 4 : MAPPING TMC + RICHTEXT
     # ========================================
@@ -1814,21 +4178,9 @@ Return the corrected JSON directly:"""
         profil = self.mdbold_to_richtext(profil_brut) if profil_brut else ''
         
         # 2. COMPÉTENCES - FORMAT CATÉGORISÉ DÉTAILLÉ
+        # (schéma validé : catégorie → liste de textes ; une clé "NOTE" éventuelle est ignorée)
         competences_enrichies = enriched_cv.get('competences_enrichies', {})
-        
-        # Si competences_enrichies est un dict (nouveau format), l'utiliser directement
-        if isinstance(competences_enrichies, dict):
-            # Supprimer la clé "NOTE" si présente
-            skills_categorized = {k: v for k, v in competences_enrichies.items() if k != 'NOTE' and isinstance(v, list)}
-        else:
-            # Fallback ancien format (liste simple)
-            competences = competences_enrichies if isinstance(competences_enrichies, list) else parsed_cv.get('competences', [])
-            skills_categorized = {
-                'Compétences techniques': competences[:8] if len(competences) >= 8 else competences,
-                'Compétences transversales': competences[8:12] if len(competences) > 8 else []
-            }
-            # Supprimer les catégories vides
-            skills_categorized = {k: v for k, v in skills_categorized.items() if v}
+        skills_categorized = {k: v for k, v in competences_enrichies.items() if k != 'NOTE'}
         
         # 🔥 Transformation en RichText pour le formatage (pas d'échappement)
         skills_categorized_doc = []
@@ -1986,68 +4338,24 @@ Return the corrected JSON directly:"""
     # ========================================
     
     def find_template_file(self, template_name: str = "TMC_NA_template_FR.docx") -> str:
-        """Recherche intelligente du template dans plusieurs emplacements possibles"""
-        from pathlib import Path
-        
-        # Liste exhaustive des endroits possibles
-        script_dir = Path(__file__).parent
-        possible_paths = [
-            Path(template_name),  # Current directory
-            script_dir / template_name,  # Script directory
-            script_dir.parent / "branding" / "templates" / template_name,  # ../../branding/templates/
-            script_dir.parent.parent / "branding" / "templates" / template_name,  # ../../../branding/templates/
-            Path.home() / template_name,  # Home directory
-            Path.home() / "tmc-cv-optimizer" / "branding" / "templates" / template_name,  # Project in home
-            Path("/app/branding/templates") / template_name,  # Render deployment path
-            Path("/home/ubuntu/tmc-cv-optimizer/branding/templates") / template_name,  # Ubuntu deployment
-        ]
-        
-        # Chercher dans les variables d'environnement aussi
-        env_template_path = os.getenv("TMC_TEMPLATE_PATH")
-        if env_template_path:
-            possible_paths.insert(0, Path(env_template_path))
-        
-        print(f"   🔍 Recherche du template: {template_name}")
-        
-        for path in possible_paths:
-            try:
-                if path.exists() and path.is_file():
-                    print(f"   ✅ Template trouvé: {path.resolve()}")
-                    return str(path.resolve())
-            except (OSError, PermissionError) as e:
-                # Ignorer silencieusement les erreurs de permissions
-                continue
-        
-        # Si pas trouvé, afficher tous les chemins essayés
-        print(f"   ❌ Template introuvable: {template_name}")
-        print(f"   Chemins testés:")
-        for path in possible_paths:
-            print(f"      - {path}")
-        print(f"\n   💡 Astuce: Définir TMC_TEMPLATE_PATH pour spécifier un emplacement personnalisé")
-        raise FileNotFoundError(f"Template TMC introuvable: {template_name}")
+        """Recherche intelligente du template dans plusieurs emplacements possibles
+        (résolue une seule fois par processus, cf. _TemplateRegistry)"""
+        return _TEMPLATES.path(template_name)
     
     def generate_tmc_docx(self, context: Dict[str, Any], output_path: str, template_path: str = "TMC_NA_template_FR.docx"):
         """Générer le CV TMC final avec docxtpl"""
         print(f"📝 Génération du CV TMC: {output_path}")
+        doc = self.render_tmc_document(context, template_path)
         
-        # 🔍 RECHERCHE INTELLIGENTE DU TEMPLATE (nouvelle fonction robuste)
-        final_template_path = self.find_template_file(template_path)
-        print(f"   📄 Template: {final_template_path}")
-        
-        # Créer environnement Jinja2 avec filtre pairwise
-        jinja_env = jinja2.Environment()
-        
-        def pairwise(iterable):
-            items = list(iterable)
-            result = []
-            for i in range(0, len(items), 2):
-                if i + 1 < len(items):
-                    result.append((items[i], items[i + 1]))
-                else:
-                    result.append((items[i], ''))
-            return result
-        
-        jinja_env.filters['pairwise'] = pairwise
+        # Sauvegarder
+        doc.save(output_path)
+        print(f"✅ CV TMC généré avec succès!")
+
+    def render_tmc_document(self, context: Dict[str, Any], template_path: str = "TMC_NA_template_FR.docx"):
+        """Rendre le template TMC en mémoire ; renvoie le document rendu (non sauvegardé)."""
+        # 📑 Template préchargé (registre) : résolution, lecture et compilation Jinja déjà faites
+        doc = _TEMPLATES.get(template_path)
+        print(f"   📄 Template: {self.find_template_file(template_path)}")
         
         # 🔥 Ajouter la fonction r pour RichText dans le contexte
         context['r'] = lambda x: x
@@ -2092,19 +4400,57 @@ Return the corrected JSON directly:"""
 
         print(f"   ✅ Caractères XML échappés une seule fois (apostrophes & corrigés)")
         
-        # Charger le template TMC
-        doc = DocxTemplate(final_template_path)
-        
-        # Rendre le document
-        doc.render(context, jinja_env)
+        # Rendre le document (environnement Jinja partagé, filtre pairwise)
+        doc.render(context, _JINJA_ENV)
+        return doc
+
+    def build_cv_docx(self, context: Dict[str, Any], template_path: str, keywords: list = None,
+                      skills_matrix=None, target_language: str = None):
+        """
+        Pipeline de rendu 100 % mémoire : rendu docxtpl → gras → skill matrix en page 2,
+        sur un seul objet document, sérialisé une seule fois dans un BytesIO.
+        `skills_matrix` : chemin, bytes ou objet fichier (UploadedFile Streamlit...).
         
-        # Sauvegarder
-        doc.save(output_path)
-        print(f"✅ CV TMC généré avec succès!")
+        Returns:
+            tuple: (BytesIO du .docx, durées par étape en s, erreur skill matrix ou None)
+        """
+        timings = {}
+        matrix_error = None
+
+        @contextmanager
+        def step(name):
+            t0 = time.perf_counter()
+            yield
+            timings[name] = time.perf_counter() - t0
+
+        with step("render"):
+            doc = self.render_tmc_document(context, template_path)
+        if keywords:
+            with step("bold"):
+                self.apply_bold_post_processing(doc, keywords)
+        if skills_matrix is not None:
+            try:
+                with step("matrix"):
+                    self.insert_skills_matrix(doc, skills_matrix, target_language=target_language)
+            except Exception as e:
+                matrix_error = str(e)
+                print(f"⚠️ Skill matrix non insérée ({e}) → CV sans matrice", flush=True)
+        with step("save"):
+            buffer = io.BytesIO()
+            doc.save(buffer)
+            buffer.seek(0)
+        print("⏱️ Rendu DOCX : " + " · ".join(f"{k} {v:.2f}s" for k, v in timings.items())
+              + f" (total {sum(timings.values()):.2f}s)", flush=True)
+        return buffer, timings, matrix_error
 
     def _translate_matrix_if_needed(self, matrix, target_language):
+        """Version synchrone de _atranslate_matrix_if_needed"""
+        return run_sync(self._atranslate_matrix_if_needed(matrix, target_language))
+
+    async def _atranslate_matrix_if_needed(self, matrix, target_language):
         """Traduit le contenu de la skill matrix vers target_language si besoin.
-        Les textes deja dans la bonne langue sont gardes tels quels. Repli silencieux."""
+        Les textes deja dans la bonne langue sont gardes tels quels. Repli silencieux :
+        renvoie False si la reponse est inexploitable (matrice laissee verbatim)."""
         import json, re
         paras = []
         for tbl in matrix.tables:
@@ -2118,8 +4464,7 @@ Return the corrected JSON directly:"""
                 paras.append(para)
         texts = [p.text for p in paras]
         if not texts:
-            return
-        client = self._get_anthropic_client()
+            return True
         prompt = (
             "Voici des courts textes extraits d'une grille de competences (skills matrix).\n"
             "Traduis CHAQUE texte en " + target_language + ". Si un texte est DEJA en " + target_language +
@@ -2128,16 +4473,18 @@ Return the corrected JSON directly:"""
             "Reponds UNIQUEMENT avec un tableau JSON de chaines, de MEME longueur et MEME ordre que l'entree, sans markdown.\n\n"
             "TEXTES (JSON): " + json.dumps(texts, ensure_ascii=False)
         )
-        resp = self._track_create(
-            model="claude-sonnet-4-5-20250929", max_tokens=4000,
+        resp = await self._atrack_create(
+            stage="translate",
             messages=[{"role": "user", "content": prompt}]
         )
         raw = resp.content[0].text.strip()
-        m = re.search(r"\[.*\]", raw, re.S)
-        translated = json.loads(m.group(0)) if m else None
+        try:
+            translated = self._loads_or_repair(raw, resp)
+        except ValueError:
+            translated = None
         if not translated or len(translated) != len(paras):
             print("   Traduction matrice ignoree (format inattendu) -> verbatim", flush=True)
-            return
+            return False
         for para, newtxt in zip(paras, translated):
             if para.runs:
                 para.runs[0].text = newtxt
@@ -2146,27 +4493,24 @@ Return the corrected JSON directly:"""
             else:
                 para.add_run(newtxt)
         print("   Skill matrix traduite vers " + target_language, flush=True)
+        return True
 
     def insert_skills_matrix_page2(self, cv_path, matrix_path, output_path, target_language=None):
         """Insere la skill matrix en PAGE 2 du CV (apres la page de garde, avant les details).
         Compose : couverture + skill matrix + contenu. Insertion verbatim.
-        Convertit la matrice en .docx au besoin (via LibreOffice)."""
+        Convertit la matrice en .docx au besoin (pool LibreOffice)."""
         from docx import Document
-        from docxcompose.composer import Composer
-        from pathlib import Path
-        import subprocess
-        W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+        doc = Document(cv_path)
+        self.insert_skills_matrix(doc, matrix_path, target_language=target_language)
+        doc.save(output_path)
+        return True
 
-        mp = Path(matrix_path)
-        if mp.suffix.lower() != '.docx':
-            print("   Conversion de la skill matrix en .docx...", flush=True)
-            subprocess.run(['soffice', '--headless', '--convert-to', 'docx', '--outdir',
-                            str(mp.parent), str(mp)], check=False, timeout=120,
-                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            converted = mp.parent / (mp.stem + '.docx')
-            if not converted.exists():
-                raise RuntimeError("Impossible de convertir la skill matrix en .docx")
-            matrix_path = str(converted)
+    def insert_skills_matrix(self, cv_doc, matrix_source, target_language=None):
+        """Version en memoire de insert_skills_matrix_page2 : modifie `cv_doc` en place.
+        La couverture et le contenu sont les elements du MEME document (plus de second
+        chargement du CV) : seule la matrice est composee (append_document).
+        `matrix_source` : chemin, bytes ou objet fichier ; converti en .docx au besoin."""
+        W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
 
         def page_break_index(body):
             for i, el in enumerate(list(body)):
@@ -2174,32 +4518,81 @@ Return the corrected JSON directly:"""
                     return i
             return None
 
-        cover = Document(cv_path)
-        content = Document(cv_path)
-        body_c, body_d = cover.element.body, content.element.body
+        cover = cv_doc
+        body_c = cover.element.body
         idx = page_break_index(body_c)
         if idx is None:
             idx = len(list(body_c))  # pas de page de garde : matrice tout en haut
 
+        # Preparation de la matrice AVANT toute modification du CV (conversion, traduction...)
+        matrix = self.prepare_skills_matrix(matrix_source, cover.sections[0], target_language)
+
         # Couverture = elements AVANT le saut de page (le saut est porte par le 1er
-        # paragraphe de contenu, donc on s'arrete juste avant).
-        for el in list(body_c)[idx:]:
-            if el.tag == W + 'sectPr':
-                continue
-            body_c.remove(el)
-        # Forcer un saut de page a la fin de la couverture -> la matrice sera en page 2
-        cover.add_page_break()
-        # Contenu = a partir du saut de page (garde son pageBreakBefore -> page suivante)
-        for el in list(body_d)[:idx]:
-            body_d.remove(el)
-
-        matrix = Document(matrix_path)
+        # paragraphe de contenu, donc on s'arrete juste avant) ; contenu = la suite,
+        # detache puis replace apres la matrice (garde son pageBreakBefore -> page suivante)
+        original = list(body_c)
+        content = [el for el in original[idx:] if el.tag != W + 'sectPr']
+        try:
+            for el in content:
+                body_c.remove(el)
+            # Forcer un saut de page a la fin de la couverture -> la matrice sera en page 2
+            cover.add_page_break()
+            append_document(cover, matrix)
+            sect = body_c.find(W + 'sectPr')
+            for el in content:
+                if sect is not None:
+                    sect.addprevious(el)
+                else:
+                    body_c.append(el)
+        except Exception:
+            # CV remis dans son etat d'origine : l'appelant peut le livrer sans matrice
+            for el in list(body_c):
+                body_c.remove(el)
+            for el in original:
+                body_c.append(el)
+            raise
+        print("Skill matrix inseree en page 2", flush=True)
+        return True
+
+    def prepare_skills_matrix(self, matrix_source, cv_section, target_language=None):
+        """Skill matrix normalisee pour la section du CV : conversion .docx, traduction,
+        largeurs de tableaux, marges et paragraphes vides de tete. Resultat mis en cache
+        (namespace 'matrix') par hash du fichier, geometrie de page et langue cible : un client
+        qui reutilise sa matrice pour chaque candidat ne paie ces etapes qu'une fois."""
+        from docx import Document
+        W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+        data = _read_source(matrix_source)
+        geometry = [cv_section.page_width, cv_section.page_height, cv_section.left_margin,
+                    cv_section.right_margin, cv_section.top_margin, cv_section.bottom_margin,
+                    str(cv_section.orientation)]
+        cache = _get_matrix_cache()
+        key = None
+        if cache is not None:
+            spec = json.dumps([hashlib.sha256(data).hexdigest(), geometry, target_language or '',
+                               self.routes['translate']['model'] if target_language else '', _MATRIX_VERSION])
+            key = hashlib.sha256(spec.encode('utf-8')).hexdigest()
+            cached = cache.get(key)
+            if cached is not None:
+                print("   ⚡ Skill matrix preparee en cache (conversion, traduction et mise en page evitees)", flush=True)
+                return Document(io.BytesIO(cached))
+
+        if sniff_file_type(data) != 'docx':
+            print("   Conversion de la skill matrix en .docx...", flush=True)
+            try:
+                data = convert_document(matrix_source, 'docx')
+            except Exception as e:
+                raise RuntimeError(f"Impossible de convertir la skill matrix en .docx ({e})")
+
+        matrix = Document(io.BytesIO(data))
+        cacheable = True
         # Traduire si la langue de la matrice differe de la langue cible
         if target_language:
             try:
-                self._translate_matrix_if_needed(matrix, target_language)
+                cacheable = self._translate_matrix_if_needed(matrix, target_language)
             except Exception as _tr_e:
                 print("   Traduction matrice echouee (" + str(_tr_e) + ") -> verbatim", flush=True)
+                cacheable = False
         # Eviter le debordement horizontal des tableaux larges (checklists)
         try:
             fix_table_width_to_auto(matrix)
@@ -2207,23 +4600,21 @@ Return the corrected JSON directly:"""
             pass
         # Aligner les marges de la matrice sur celles du CV
         try:
-            cv_sec = cover.sections[0]
             for sec in matrix.sections:
-                sec.top_margin = cv_sec.top_margin
-                sec.bottom_margin = cv_sec.bottom_margin
-                sec.left_margin = cv_sec.left_margin
-                sec.right_margin = cv_sec.right_margin
-                sec.orientation = cv_sec.orientation
-                sec.page_width = cv_sec.page_width
-                sec.page_height = cv_sec.page_height
+                sec.top_margin = cv_section.top_margin
+                sec.bottom_margin = cv_section.bottom_margin
+                sec.left_margin = cv_section.left_margin
+                sec.right_margin = cv_section.right_margin
+                sec.orientation = cv_section.orientation
+                sec.page_width = cv_section.page_width
+                sec.page_height = cv_section.page_height
         except Exception:
             pass
         # Mettre les tableaux larges a l'echelle de la largeur utile du CV (evite le debordement)
         try:
             from docx.oxml.ns import qn as _qn
             from docx.oxml import OxmlElement as _Ox
-            cv_sec = cover.sections[0]
-            target = int((cv_sec.page_width - cv_sec.left_margin - cv_sec.right_margin) / 635)  # EMU -> twips
+            target = int((cv_section.page_width - cv_section.left_margin - cv_section.right_margin) / 635)  # EMU -> twips
             for tbl in matrix.tables:
                 tblel = tbl._tbl
                 grid = tblel.find(_qn('w:tblGrid'))
@@ -2261,12 +4652,11 @@ Return the corrected JSON directly:"""
             else:
                 break
 
-        comp = Composer(cover)
-        comp.append(matrix)
-        comp.append(content)
-        comp.save(output_path)
-        print("Skill matrix inseree en page 2", flush=True)
-        return True
+        if cache is not None and cacheable:
+            out = io.BytesIO()
+            matrix.save(out)
+            cache.set(key, out.getvalue())
+        return matrix
 
     def generate_ms_cv_3parts(self, tmc_context, skills_matrix_path, output_path, 
                               cover_template="TMC_NA_template_EN_Anonymise_CoverPage.docx",
@@ -2279,8 +4669,8 @@ Return the corrected JSON directly:"""
         
         Args:
             tmc_context: Contexte enrichi du candidat
-            skills_matrix_path: Path vers le fichier Skills Matrix uploadé
-            output_path: Path pour le fichier final
+            skills_matrix_path: Path (ou bytes / objet fichier) du fichier Skills Matrix uploadé
+            output_path: Path (ou objet fichier, ex. BytesIO) pour le fichier final
             cover_template: Template pour la cover page
             content_template: Template pour le contenu détaillé
         
@@ -2288,36 +4678,26 @@ Return the corrected JSON directly:"""
             tuple: (success: bool, output_path: str)
         """
         try:
-            from pathlib import Path
-            from docxcompose.composer import Composer
             from docx import Document
-            import shutil
-            
-            # Dossier temporaire
-            temp_dir = Path("/tmp/cv_optimizer_ms")
-            temp_dir.mkdir(exist_ok=True)
             
-            # ÉTAPE 1: Générer cover page
-            print("🎨 Generating cover page...")
-            cover_path = temp_dir / "cover.docx"
-            
-            # ✅ FIX: Passer seulement le nom du template, find_template_file va le chercher
+            # ÉTAPES 1 + 3 EN PARALLÈLE : cover et contenu rendus en mémoire, chacun sur sa
+            # propre copie du contexte (le rendu l'échappe et le modifie en place)
+            print("🎨 Generating cover page + detailed content (parallel, in memory)...")
             print(f"   📄 Using cover template: {cover_template}")
-            
-            self.generate_tmc_docx(
-                tmc_context, 
-                str(cover_path), 
-                template_path=cover_template  # Juste le nom, pas le chemin complet
-            )
-            print(f"   ✅ Cover page generated: {cover_path.name}")
-            
-            # ÉTAPE 2: Merger cover + Skills Matrix
-            print("🔗 Merging cover with Skills Matrix...")
-            cover_with_skills = temp_dir / "cover_and_skills.docx"
-            
-            # Charger les deux documents
-            cover_doc = Document(str(cover_path))
-            skills_doc = Document(skills_matrix_path)
+            print(f"   📄 Using content template: {content_template}")
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                cover_future = pool.submit(self.render_tmc_document, copy.deepcopy(tmc_context), cover_template)
+                content_future = pool.submit(self.render_tmc_document, copy.deepcopy(tmc_context), content_template)
+                
+                # ÉTAPE 2 (pendant les rendus) : charger la Skills Matrix
+                data = _read_source(skills_matrix_path)
+                if sniff_file_type(data) != 'docx':
+                    data = convert_document(skills_matrix_path, 'docx')
+                skills_doc = Document(io.BytesIO(data))
+                
+                cover_doc = cover_future.result()
+                content_doc = content_future.result()
+            print(f"   ✅ Cover page + content generated")
             
             # ✅ V1.3.4.2 FIX: Change table width from fixed to auto to prevent horizontal shift
             print("🔧 Fixing Skills Matrix table width...")
@@ -2340,7 +4720,6 @@ Return the corrected JSON directly:"""
             # V1.3.4.1 FIX: Supprimer les espacements au début de la Skills Matrix
             # Ceci assure que le contenu commence exactement en haut de la page
             from docx.shared import Pt
-            from docx.oxml import parse_xml
             
             # Supprimer TOUS les paragraphes vides au début du body XML
             # Travailler directement sur body._element pour avoir l'ordre exact
@@ -2379,53 +4758,19 @@ Return the corrected JSON directly:"""
                 first_para.paragraph_format.space_before = Pt(0)
                 first_para.paragraph_format.space_after = Pt(0)
             
-            # Ajouter page break après cover
-            cover_doc.add_page_break()
-            
-            # Merger avec docxcompose
-            composer = Composer(cover_doc)
-            composer.append(skills_doc)
-            
-            # Sauvegarder
-            composer.save(str(cover_with_skills))
-            print(f"   ✅ Cover + Skills Matrix merged")
-            
-            # ÉTAPE 3: Générer contenu détaillé
-            print("📝 Generating detailed content...")
-            content_path = temp_dir / "content.docx"
-            
-            # ✅ FIX: Passer seulement le nom du template
-            print(f"   📄 Using content template: {content_template}")
-            
-            self.generate_tmc_docx(
-                tmc_context,
-                str(content_path),
-                template_path=content_template  # Juste le nom, pas le chemin complet
-            )
-            print(f"   ✅ Content generated: {content_path.name}")
-            
-            # ÉTAPE 4: Merger tout ensemble
+            # ÉTAPE 4: composition en une passe (cover + saut + Skills Matrix + saut + contenu)
             print("🔗 Merging everything...")
+            cover_doc.add_page_break()
+            engines = [append_document(cover_doc, skills_doc)]
+            cover_doc.add_page_break()
+            engines.append(append_document(cover_doc, content_doc))
+            print(f"   🧬 Skills Matrix: {engines[0]}, content: {engines[1]}")
             
-            # Charger cover+skills
-            final_doc = Document(str(cover_with_skills))
-            
-            # Ajouter page break avant content
-            final_doc.add_page_break()
-            
-            # Merger avec content
-            final_composer = Composer(final_doc)
-            content_doc = Document(str(content_path))
-            final_composer.append(content_doc)
-            
-            # Sauvegarder le document final
-            final_composer.save(str(output_path))
-            print(f"✅ Final CV saved: {output_path}")
-            
-            # Nettoyer les fichiers temporaires
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            # Sauvegarder le document final (chemin ou objet fichier)
+            cover_doc.save(os.fspath(output_path) if _is_path(output_path) else output_path)
+            print(f"✅ Final CV saved: {_source_label(output_path)}")
             
-            return True, str(output_path)
+            return True, _source_label(output_path)
             
         except Exception as e:
             error_msg = f"Error generating MS CV: {str(e)}"
@@ -2433,15 +4778,17 @@ Return the corrected JSON directly:"""
             import traceback
             traceback.print_exc()
             return False, error_msg
-    def apply_bold_post_processing(self, docx_path: str, keywords: list):
-        """Post-traiter le document pour mettre en gras les technologies dans les tableaux"""
+    def apply_bold_post_processing(self, docx_path, keywords: list):
+        """Post-traiter le document pour mettre en gras les technologies dans les tableaux.
+        `docx_path` : chemin (ouvert puis resauvegardé) ou document déjà ouvert (modifié en place)."""
         print(f"🎨 Application du gras sur les technologies...")
         
         from docx import Document as DocxDocument
         from docx.shared import RGBColor
         import re
         
-        doc = DocxDocument(docx_path)
+        in_memory = not _is_path(docx_path)
+        doc = docx_path if in_memory else DocxDocument(docx_path)
         modifications = 0
         
         print(f"   Recherche des **mot** dans le document...")
@@ -2503,8 +4850,9 @@ Return the corrected JSON directly:"""
         for paragraph in doc.paragraphs:
             modifications += apply_bold_to_runs(paragraph)
         
-        # Sauvegarder
-        doc.save(docx_path)
+        # Sauvegarder (sauf document en mémoire : l'appelant sérialise une seule fois)
+        if not in_memory:
+            doc.save(docx_path)
         if modifications > 0:
             print(f"✅ {modifications} mots mis en gras")
         else:
@@ -18,7 +18,6 @@ Interface Streamlit premium avec design moderne et backend complet
 import streamlit as st
 from pathlib import Path
 import base64
-import tempfile
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
@@ -26,6 +25,8 @@ import extra_streamlit_components as stx
 import PyPDF2
 from docx import Document
 import json
+import hashlib
+import queue
 import requests
 
 # Charger les variables d'environnement depuis .env
@@ -624,6 +625,8 @@ if 'skills_matrix_file' not in st.session_state:
     st.session_state.skills_matrix_file = None
 if 'show_generate_button' not in st.session_state:
     st.session_state.show_generate_button = False
+if 'pipeline' not in st.session_state:
+    st.session_state.pipeline = {}
 
 # ==========================================
 # 🔐 AUTHENTICATION FUNCTIONS
@@ -670,6 +673,7 @@ def clear_session():
     st.session_state.processing = False
     st.session_state.skills_matrix_file = None
     st.session_state.show_generate_button = False
+    st.session_state.pipeline = {}
     try:
         cookie_manager.delete('cv_session')
     except:
@@ -742,9 +746,19 @@ def show_login_screen():
 # 🏠 MAIN APPLICATION
 # ==========================================
 
+@st.cache_resource
+def warm_cv_templates():
+    """Préchargement unique par processus des templates DOCX (hors latence du premier CV)."""
+    from cv_enricher import warm_templates
+    warm_templates()
+    return True
+
+
 def main_app():
     """Main application"""
     
+    warm_cv_templates()
+    
     if 'reset_counter' not in st.session_state:
         st.session_state.reset_counter = 0
     
@@ -773,6 +787,7 @@ def main_app():
             st.session_state.processing = False
             st.session_state.skills_matrix_file = None
             st.session_state.show_generate_button = False
+            st.session_state.pipeline = {}
             st.session_state.reset_counter += 1
             st.rerun()
         if st.button("🚪 Deconnexion", use_container_width=True, key="logout_button"):
@@ -832,6 +847,9 @@ def main_app():
         if cv_file:
             st.session_state.cv_file = cv_file
             st.success(f"✅ {cv_file.name}")
+            if Path(cv_file.name).suffix.lower() == '.doc':
+                from cv_enricher import warm_office_pool
+                warm_office_pool()  # conversion LibreOffice à venir : workers démarrés en fond
 
     with col2:
         st.markdown("### 📊 Description de poste  *(optionnel)*")
@@ -843,6 +861,9 @@ def main_app():
         if jd_file:
             st.session_state.jd_file = jd_file
             st.success(f"✅ {jd_file.name}")
+            if Path(jd_file.name).suffix.lower() == '.doc':
+                from cv_enricher import warm_office_pool
+                warm_office_pool()
 
     with col3:
         st.markdown("### 🧩 Skill matrix  *(optionnel)*")
@@ -854,6 +875,9 @@ def main_app():
         if sm_file:
             st.session_state.skills_matrix_file = sm_file
             st.success(f"✅ {sm_file.name}")
+            if Path(sm_file.name).suffix.lower() != '.docx':
+                from cv_enricher import warm_office_pool
+                warm_office_pool()
 
     # ===== OPTIONS : langue (FR par défaut) + anonymisation (décoché par défaut) =====
     st.markdown("---")
@@ -918,6 +942,60 @@ def main_app():
 # 🔄 CV PROCESSING
 # ==========================================
 
+def upload_hash(uploaded_file):
+    """Empreinte SHA-256 du contenu d'un fichier déposé."""
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+
+def get_parsed_cv(enricher):
+    """
+    Retourne le CV parsé, en réutilisant celui de la session si le fichier
+    déposé n'a pas changé (même empreinte). Un nouveau CV invalide aussi le
+    matching précédemment calculé.
+    """
+    pipeline = st.session_state.pipeline
+    cv_hash = upload_hash(st.session_state.cv_file)
+    if pipeline.get('cv_hash') == cv_hash:
+        print("♻️ CV déjà analysé dans cette session, réutilisation")
+        return pipeline['parsed_cv']
+    pipeline.clear()
+    cv_text = enricher.extract_cv_text(st.session_state.cv_file)
+    parsed_cv = enricher.parse_cv_with_claude(cv_text)
+    if parsed_cv:  # échec ({}) non mémorisé : le prochain clic relance le parsing
+        pipeline.update(cv_hash=cv_hash, parsed_cv=parsed_cv)
+    return parsed_cv
+
+
+def matching_succeeded(matching_analysis):
+    """Matching exploitable (ni erreur/timeout, ni synthèse d'erreur) : seul résultat mis en session."""
+    return (isinstance(matching_analysis, dict) and 'error' not in matching_analysis
+            and 'Erreur' not in str(matching_analysis.get('synthese_matching', '')))
+
+
+def get_matching(enricher, parsed_cv, language, compute=True):
+    """
+    Retourne (jd_text, matching_analysis) pour la JD déposée, en réutilisant
+    les résultats de la session si CV, JD et langue n'ont pas changé.
+    Avec compute=False, matching_analysis vaut None s'il n'est pas en session
+    (l'appelant le calcule alors en parallèle de l'enrichissement).
+    """
+    pipeline = st.session_state.pipeline
+    jd_hash = upload_hash(st.session_state.jd_file)
+    if pipeline.get('jd_hash') != jd_hash:
+        pipeline.pop('matching_language', None)
+        pipeline.update(jd_hash=jd_hash, jd_text=enricher.read_job_description(st.session_state.jd_file))
+    if pipeline.get('matching_language') == language:
+        print("♻️ Matching déjà calculé dans cette session, réutilisation")
+    elif not compute:
+        return pipeline['jd_text'], None
+    else:
+        matching_analysis = enricher.analyze_cv_matching(parsed_cv, pipeline['jd_text'], language=language)
+        if not matching_succeeded(matching_analysis):
+            return pipeline['jd_text'], matching_analysis
+        pipeline.update(matching_analysis=matching_analysis, matching_language=language)
+    return pipeline['jd_text'], pipeline['matching_analysis']
+
+
 def process_cv_matching():
     """Process CV matching analysis with 3-step timeline"""
     st.markdown("---")
@@ -938,19 +1016,12 @@ def process_cv_matching():
         api_key = os.getenv('ANTHROPIC_API_KEY') or st.secrets.get("ANTHROPIC_API_KEY")
         enricher = CVEnricher(api_key=api_key)
         
-        cv_path = save_uploaded(st.session_state.cv_file)
-        jd_path = save_uploaded(st.session_state.jd_file)
-        
-        # Step 1: Extraction
+        # Step 1-2: Extraction + Parsing (directement depuis le fichier déposé, réutilisé si inchangé)
         timeline_placeholder.markdown(horizontal_progress_timeline(1, 3, matching_steps), unsafe_allow_html=True)
-        cv_text = enricher.extract_cv_text(str(cv_path))
-        
-        # Step 2: Parsing
-        parsed_cv = enricher.parse_cv_with_claude(cv_text)
+        parsed_cv = get_parsed_cv(enricher)
         
         # Step 3: Matching Analysis
-        jd_text = enricher.read_job_description(str(jd_path))
-        matching_analysis = enricher.analyze_cv_matching(parsed_cv, jd_text, language=st.session_state.selected_language)
+        jd_text, matching_analysis = get_matching(enricher, parsed_cv, st.session_state.selected_language)
         
         timeline_placeholder.empty()
         
@@ -958,8 +1029,6 @@ def process_cv_matching():
             'parsed_cv': parsed_cv,
             'jd_text': jd_text,
             'matching_analysis': matching_analysis,
-            'cv_path': cv_path,
-            'jd_path': jd_path
         }
         st.session_state.matching_done = True
         st.session_state.show_generate_button = True
@@ -1232,24 +1301,23 @@ def display_matching_results(data):
 def process_cv_generation():
     """Parse le CV (+ JD optionnelle) puis génère le CV TMC (bouton 'CV converti TMC')."""
     try:
-        from cv_enricher import CVEnricher
+        from cv_enricher import CVEnricher, NO_JD_TEXT
         api_key = os.getenv('ANTHROPIC_API_KEY') or st.secrets.get("ANTHROPIC_API_KEY")
         enricher = CVEnricher(api_key=api_key)
         st.markdown("---")
         st.info("⏳ Lecture et analyse du CV...")
-        cv_path = save_uploaded(st.session_state.cv_file)
-        cv_text = enricher.extract_cv_text(str(cv_path))
-        parsed_cv = enricher.parse_cv_with_claude(cv_text)
+        # CV parsé et matching repris du "Tableau de matching" si fichiers et langue inchangés
+        parsed_cv = get_parsed_cv(enricher)
         jd_text = ""
         matching_analysis = None
         if st.session_state.jd_file:
-            jd_path = save_uploaded(st.session_state.jd_file)
-            jd_text = enricher.read_job_description(str(jd_path))
-            matching_analysis = enricher.analyze_cv_matching(parsed_cv, jd_text, language=st.session_state.selected_language)
+            jd_text, matching_analysis = get_matching(enricher, parsed_cv, st.session_state.selected_language, compute=False)
         data = {
             'parsed_cv': parsed_cv,
-            'jd_text': jd_text or "(Aucune description de poste fournie — reformate fidèlement le CV au format TMC, sans cibler d'offre.)",
+            'jd_text': jd_text or NO_JD_TEXT,
             'matching_analysis': matching_analysis,
+            # Matching absent de la session : calculé en parallèle de l'enrichissement
+            'run_matching': bool(jd_text) and matching_analysis is None,
         }
         st.session_state.processing = False
         generate_cv(data)
@@ -1260,6 +1328,41 @@ def process_cv_generation():
         st.code(traceback.format_exc())
 
 
+def format_stream_event(event):
+    """Ligne d'aperçu pour un champ du CV enrichi reçu en streaming (None = pas affiché)."""
+    if event[0] == 'field' and event[1] == 'titre_professionnel_enrichi':
+        return f"### 🎯 {event[2]}"
+    if event[0] == 'field' and event[1] == 'profil_enrichi':
+        return f"**📝 Profil** — {event[2]}"
+    if event[0] == 'item' and event[1] == 'experiences_enrichies' and isinstance(event[3], dict):
+        exp = event[3]
+        return f"💼 **{exp.get('poste', '')}** — {exp.get('entreprise', '')} ({exp.get('periode', '')})"
+    return None
+
+
+def show_stream_preview(future, events):
+    """
+    Affiche les sections du CV enrichi au fur et à mesure du streaming Claude
+    (la file `events` est alimentée depuis la boucle asyncio de fond), puis
+    retourne le résultat de l'appel.
+    """
+    placeholder = st.empty()
+    lines = []
+    while True:
+        try:
+            event = events.get(timeout=0.2)
+        except queue.Empty:
+            if future.done():
+                break
+            continue
+        line = format_stream_event(event)
+        if line:
+            lines.append(line)
+            placeholder.markdown("\n\n".join(lines))
+    placeholder.empty()
+    return future.result()
+
+
 def generate_cv(data):
     """Generate the optimized CV with 3-step timeline"""
     st.markdown("---")
@@ -1274,38 +1377,52 @@ def generate_cv(data):
     ]
     
     try:
-        from cv_enricher import CVEnricher
+        from cv_enricher import CVEnricher, submit_async
         
         api_key = os.getenv('ANTHROPIC_API_KEY') or st.secrets.get("ANTHROPIC_API_KEY")
         enricher = CVEnricher(api_key=api_key)
         
         timeline_placeholder.markdown(horizontal_progress_timeline(1, 3, generation_steps), unsafe_allow_html=True)
         
-        enriched_cv = enricher.enrich_cv_with_prompt(
-            data['parsed_cv'],
-            data['jd_text'],
-            language=st.session_state.selected_language,
-            matching_analysis=data.get('matching_analysis')
-        )
+        # Enrichissement streamé : les sections s'affichent dès qu'elles sont complètes
+        events = queue.Queue()
+        if data.get('run_matching'):
+            enriched_cv, matching_analysis = show_stream_preview(submit_async(enricher.aenrich_with_matching(
+                data['parsed_cv'],
+                data['jd_text'],
+                language=st.session_state.selected_language,
+                on_event=events.put
+            )), events)
+            if matching_succeeded(matching_analysis):
+                st.session_state.pipeline.update(
+                    matching_analysis=matching_analysis,
+                    matching_language=st.session_state.selected_language
+                )
+        else:
+            enriched_cv = show_stream_preview(submit_async(enricher.aenrich_cv_with_prompt(
+                data['parsed_cv'],
+                data['jd_text'],
+                language=st.session_state.selected_language,
+                matching_analysis=data.get('matching_analysis'),
+                on_event=events.put
+            )), events)
         
         template_lang = 'EN' if st.session_state.selected_language == 'English' else 'FR'
         tmc_context = enricher.map_to_tmc_structure(data['parsed_cv'], enriched_cv, template_lang=template_lang)
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
-            output_path = tmp_file.name
-        
         suffix = '_Anonymise' if st.session_state.get('anonymized', False) else ''
         template_file = f"Template_{template_lang}{suffix}.docx"
         
-        enricher.generate_tmc_docx(
+        # 📝 Rendu → gras → skill matrix en page 2 (si fournie) : tout en mémoire, une seule sérialisation
+        cv_buffer, _, matrix_error = enricher.build_cv_docx(
             tmc_context,
-            output_path,
-            template_path=template_file
+            template_file,
+            keywords=enriched_cv.get('mots_cles_a_mettre_en_gras', []),
+            skills_matrix=st.session_state.get('skills_matrix_file'),
+            target_language=st.session_state.selected_language
         )
-        
-        keywords = enriched_cv.get('mots_cles_a_mettre_en_gras', [])
-        if keywords:
-            enricher.apply_bold_post_processing(output_path, keywords)
+        if matrix_error:
+            st.warning(f"⚠️ Skill matrix non insérée (CV généré sans elle) : {matrix_error}")
         
         success = True
         result = None
@@ -1315,30 +1432,9 @@ def generate_cv(data):
         except Exception:
             pass
         
-        # 🧩 Skill matrix -> insérée en PAGE 2 (si fournie)
-        if st.session_state.get('skills_matrix_file'):
-            try:
-                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                sm_in = st.session_state.skills_matrix_file
-                sm_suffix = Path(sm_in.name).suffix or '.docx'
-                sm_path = Path(output_path).parent / f"skillmatrix_{ts}{sm_suffix}"
-                with open(sm_path, 'wb') as f:
-                    sm_in.seek(0)
-                    f.write(sm_in.read())
-                merged_path = Path(output_path).parent / f"cv_merged_{ts}.docx"
-                enricher.insert_skills_matrix_page2(output_path, str(sm_path), str(merged_path), target_language=st.session_state.selected_language)
-                output_path = str(merged_path)
-            except Exception as _sm_e:
-                st.warning(f"⚠️ Skill matrix non insérée (CV généré sans elle) : {_sm_e}")
-        
         timeline_placeholder.empty()
         
         if success:
-            with open(output_path, 'rb') as f:
-                cv_bytes = f.read()
-            
-            os.unlink(output_path)
-            
             st.success("🎉 **CV Generated Successfully!**")
             
             parsed_cv = data.get('parsed_cv', {})
@@ -1388,7 +1484,7 @@ def generate_cv(data):
             st.markdown('<div id="download-btn-wrapper">', unsafe_allow_html=True)
             st.download_button(
                 label="📥 Download Optimized CV",
-                data=cv_bytes,
+                data=cv_buffer,
                 file_name=filename,
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                 use_container_width=True
@@ -1402,20 +1498,6 @@ def generate_cv(data):
         import traceback
         st.code(traceback.format_exc())
 
-# ==========================================
-# 🛠️ HELPER FUNCTIONS
-# ==========================================
-
-def save_uploaded(file, suffix=None) -> Path:
-    """Save uploaded file to temp directory"""
-    suffix = suffix or Path(file.name).suffix
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    file.seek(0)
-    tmp.write(file.read())
-    tmp.flush()
-    tmp.close()
-    return Path(tmp.name)
-
 # ==========================================
 # 🔚 FOOTER
 # ==========================================
@@ -1440,7 +1522,7 @@ def show_footer():
 
 def show_admin_dashboard():
     """Tableau de bord d'usage - accessible uniquement via ?admin=<code> (cache aux utilisateurs)."""
-    from cv_enricher import get_stats, reset_stats
+    from cv_enricher import get_stats, reset_stats, clear_llm_cache
     st.markdown("## 📊 Tableau de bord — Usage (admin)")
     sdata = get_stats()
     c1, c2, c3 = st.columns(3)
@@ -1451,7 +1533,39 @@ def show_admin_dashboard():
     c4.metric("Coût total estimé", f"${sdata['cost']:.2f}")
     c5.metric("Coût moyen / CV", f"${sdata['cost_per_cv']:.3f}" if sdata["cv_count"] else "—")
     c6.metric("Tokens in / out", f"{sdata['input_tokens']:,} / {sdata['output_tokens']:,}")
-    st.caption("Compteur fichier — se réinitialise au redéploiement. Prix Sonnet 4.5 : $3 / $15 par MTok.")
+    c7, c8, c9 = st.columns(3)
+    c7.metric("Tokens économisés (normalisation)", f"{sdata['norm_tokens_saved']:,}",
+              f"-{sdata['norm_saved_pct']:.0f}% du texte extrait" if sdata["normalized_docs"] else None,
+              delta_color="off")
+    c8.metric("Tokens économisés / CV", f"{sdata['norm_saved_per_doc']:,.0f}" if sdata["normalized_docs"] else "—")
+    c9.metric("Économie estimée", f"${sdata['norm_cost_saved']:.2f}")
+    c10, c11, c12 = st.columns(3)
+    c10.metric("Cache de prompt (lus / écrits)", f"{sdata['cache_read_tokens']:,} / {sdata['cache_write_tokens']:,}")
+    c11.metric("Part du prompt servie par le cache", f"{sdata['cache_hit_pct']:.0f}%")
+    c12.metric("Économie cache de prompt", f"${sdata['cache_savings']:.2f}")
+    c13, c14, c15 = st.columns(3)
+    c13.metric("Réponses IA en cache (hits / misses)", f"{sdata['llm_cache_hits']:,} / {sdata['llm_cache_misses']:,}")
+    c14.metric("Taux de hit cache réponses", f"{sdata['llm_cache_hit_pct']:.0f}%")
+    if c15.button("🗑️ Vider le cache des réponses IA", key="clear_llm_cache_btn"):
+        clear_llm_cache()
+        st.success("Cache des réponses IA vidé.")
+    c16, c17, _ = st.columns(3)
+    c16.metric("JSON réparés localement", f"{sdata['json_local_repairs']:,}")
+    c17.metric("JSON corrigés par Claude", f"{sdata['json_llm_fixes']:,}")
+    c18, c19, _ = st.columns(3)
+    c18.metric("Nouvelles tentatives API (429/529/5xx)", f"{sdata['api_retries']:,}")
+    c19.metric("Appels refusés (coupe-circuit)", f"{sdata['circuit_open_rejections']:,}")
+    if sdata["stage_rows"]:
+        st.markdown("**Par étape et modèle**")
+        st.dataframe(
+            [{"Étape": r["stage"], "Modèle": r["model"], "Appels": r["calls"], "Latence moy. (s)": r["avg_seconds"],
+              "Tokens in": r["input_tokens"], "Tokens out": r["output_tokens"],
+              "Coût ($)": r["cost"], "Coût / appel ($)": r["cost_per_call"],
+              "Retries": r["retries"]} for r in sdata["stage_rows"]],
+            use_container_width=True, hide_index=True
+        )
+    st.caption("Compteur fichier — se réinitialise au redéploiement. Coût au tarif de chaque modèle "
+               "(Sonnet 4.5 : $3 / $15, Haiku 4.5 : $1 / $5 par MTok ; cache de prompt : écriture ×1.25, lecture ×0.1).")
     if st.button("🔄 Réinitialiser le compteur", key="reset_stats_btn"):
         reset_stats()
         st.rerun()
@@ -0,0 +1,33 @@
+"""Non-régression de _is_transient : ce qui est retenté (et compté comme panne par le disjoncteur)."""
+import pytest
+
+for _module in ('docx', 'docxtpl', 'jinja2', 'lxml', 'PyPDF2', 'pdf2image', 'pytesseract', 'PIL'):
+    pytest.importorskip(_module)
+
+from cv_enricher import _is_transient
+
+
+class _StatusError(Exception):
+    """Même forme qu'anthropic.APIStatusError : status_code + body JSON décodé."""
+
+    def __init__(self, status_code, body=None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+@pytest.mark.parametrize("error_type", ["overloaded_error", "api_error", "rate_limit_error"])
+def test_mid_stream_sse_error_is_transient(error_type):
+    # Événement SSE `error` reçu en plein stream : le SDK garde le statut HTTP du stream (200)
+    body = {"type": "error", "error": {"type": error_type, "message": "Overloaded"}}
+    assert _is_transient(_StatusError(200, body))
+
+
+def test_mid_stream_request_error_is_not_transient():
+    body = {"type": "error", "error": {"type": "invalid_request_error", "message": "prompt is too long"}}
+    assert not _is_transient(_StatusError(200, body))
+
+
+@pytest.mark.parametrize("status, expected", [(529, True), (500, True), (429, True), (400, False), (401, False)])
+def test_http_status(status, expected):
+    assert _is_transient(_StatusError(status, "Error")) is expected
@@ -0,0 +1,63 @@
+"""Non-régression de normalize_cv_text : les en-têtes/pieds répétés partent, le contenu reste."""
+import pytest
+
+for _module in ('docx', 'docxtpl', 'jinja2', 'lxml', 'PyPDF2', 'pdf2image', 'pytesseract', 'PIL'):
+    pytest.importorskip(_module)
+
+from cv_enricher import normalize_cv_text
+
+
+def test_two_pages_keep_every_year():
+    assert normalize_cv_text("2019\n2020\n2021\nPage 1\f2019\nPage 2") == "2019\n2020\n2021\n\n2019"
+
+
+def test_date_ranges_at_page_edges_are_kept():
+    text = ("Dev - CGI\nTâches\n2019 - 2023\f"
+            "2016 - 2019\nDev - Bell\nTâches\n2014 - 2016\f"
+            "2012 - 2014\nDev - CAE\nTâches")
+    out = normalize_cv_text(text).splitlines()
+    for dates in ("2019 - 2023", "2016 - 2019", "2014 - 2016", "2012 - 2014"):
+        assert dates in out
+
+
+def test_identical_date_lines_are_never_dropped():
+    text = "\f".join("Janv. 2019 – Présent\nMission %d\nDétails" % i for i in range(3))
+    assert normalize_cv_text(text).splitlines().count("Janv. 2019 – Présent") == 3
+
+
+def test_distinct_environment_lines_are_kept():
+    text = ("Mission A\nEnvironnement : Python, SQL\f"
+            "Environnement : Java, Spring\nMission B\nEnvironnement : Azure\f"
+            "Environnement : React\nMission C")
+    out = normalize_cv_text(text).splitlines()
+    for env in ("Environnement : Python, SQL", "Environnement : Java, Spring",
+                "Environnement : Azure", "Environnement : React"):
+        assert env in out
+
+
+def test_repeated_header_and_page_numbers_are_stripped():
+    text = "\f".join(f"Jean Dupont - CV - Page {n}\nExpérience {n}\nDétail {n}\n{n}/3" for n in (1, 2, 3))
+    out = normalize_cv_text(text).splitlines()
+    assert out.count("Jean Dupont - CV - Page 1") == 1
+    assert not any(line.startswith("Jean Dupont - CV - Page 2") for line in out)
+    assert not any(line.endswith("/3") for line in out)
+    assert {"Expérience 1", "Expérience 2", "Expérience 3"} <= set(out)
+
+
+def test_header_stripping_needs_three_pages():
+    text = "Jean Dupont\nExpérience A\fJean Dupont\nExpérience B"
+    assert normalize_cv_text(text).splitlines().count("Jean Dupont") == 2
+
+
+def test_bullet_shared_by_two_experiences_is_kept():
+    bullet = "- Animation des ateliers avec les utilisateurs métiers pour recueillir les besoins"
+    text = (f"Analyste - CGI\n{bullet}\n- Rédaction des spécifications\n\n"
+            f"Analyste - Bell\n{bullet}\n- Modélisation SQL")
+    out = normalize_cv_text(text).splitlines()
+    assert out.count(bullet) == 2
+    assert out[out.index("Analyste - Bell") + 1] == bullet
+
+
+def test_consecutive_long_copy_is_collapsed():
+    line = "Consultant senior en transformation numérique et architecture cloud"
+    assert normalize_cv_text(f"{line}\n{line}\nPython").splitlines() == [line, "Python"]